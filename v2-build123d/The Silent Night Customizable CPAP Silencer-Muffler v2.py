@@ -1,8 +1,14 @@
 # %% Imports
 from build123d import *
 from enum import IntEnum
-from math import pi, tan, radians
+from functools import partial
+from math import hypot, pi, tan, radians
+import numpy as np
 from bd_warehouse.thread import IsoThread
+from muffler_memo import memoize
+from muffler_thread import swept_iso_thread
+import muffler_lathe
+import muffler_mesh
 #from ocp_vscode import *
 
 # %% Config
@@ -82,6 +88,10 @@ END_CAP_GRIP_CUTOUT_COUNT = 30
 GRIP_CUTOUT_RATIO = 1/18
 '''The ratio between the muffler outer diameter/radius and grip cutout diameter/radius.'''
 
+GRIP_CUTOUT_SINGLE_PASS = True
+'''Cut the grip of the end caps with one connected cutter instead of END_CAP_GRIP_CUTOUT_COUNT separate ones. Same shape, faster boolean.
+The bodies keep the separate cutters, their outer tube would run 0.04 mm inside the connected cutter'''
+
 # Threading
 
 THREADING_PITCH = 2.0
@@ -90,6 +100,9 @@ THREADING_PITCH = 2.0
 THREADING_EXTRA_SPACING_IF_ENABLED = 0.4
 '''The extra spacing between internal and external threading, if enabled (only added on end-cap)'''
 
+THREADING_SWEPT = False
+'''Sweep the threads along a helix (muffler_thread) instead of using IsoThread. Same profile, faster and with lighter STEP/STL files'''
+
 # Inner tube/mesh
 
 INNER_TUBE_CORKSCREW_THICKNESS = 1
@@ -107,6 +120,14 @@ INNER_TUBE_MESH_COUNT = 15
 INNER_TUBE_MESH_TWIST_ANGLE = 35
 '''The angle (degrees) in the mesh pattern.'''
 
+INNER_TUBE_DIRECT_MESH_SEGMENTS = 64
+'''The number of segments per turn, when the inner tube STL is meshed directly with NumPy'''
+
+# Revolved parts
+
+REVOLVED_DIRECT_MESH_SEGMENTS = 64
+'''The number of segments of a full turn, when the STL of a revolved part (body, end caps, o-ring) is meshed directly with NumPy'''
+
 # Calculations
 connector_male_outer_radius = CONNECTOR_MALE_OUTER_DIAMETER/2
 connector_male_inner_radius = connector_male_outer_radius - CONNECTOR_MALE_WALL_THICKNESS
@@ -115,7 +136,10 @@ threading_height = 5*0.8660*THREADING_PITCH/8 # Height of thread ISO standard, h
 
 # %% Threadings
 
+@memoize
 def threading_body(major_diameter: float):
+    if THREADING_SWEPT:
+        return swept_iso_thread(major_diameter, THREADING_PITCH, END_CAP_INSERT_LENGTH, external=False)
     return IsoThread(major_diameter=major_diameter,
                      pitch=THREADING_PITCH,
                      length=END_CAP_INSERT_LENGTH,
@@ -123,11 +147,15 @@ def threading_body(major_diameter: float):
                      external=False,
                      interference=0.0)
         
+@memoize
 def threading_end_cap(major_diameter: float,
                       threading_extra_spacing_enabled: bool):
     threading_extra_spacing = (THREADING_EXTRA_SPACING_IF_ENABLED
                                if threading_extra_spacing_enabled
                                else 0.0)
+    if THREADING_SWEPT:
+        return swept_iso_thread(major_diameter-2*(TOLERANCE+threading_extra_spacing), THREADING_PITCH,
+                                END_CAP_INSERT_LENGTH)
     return IsoThread(major_diameter=major_diameter-2*(TOLERANCE+threading_extra_spacing),
                      pitch=THREADING_PITCH,
                      length=END_CAP_INSERT_LENGTH,
@@ -176,6 +204,56 @@ def grip_cutout_profile(outer_tube_outer_radius: float):
     )
     return Compound(circles)
 
+@memoize
+def grip_cutout(outer_tube_outer_radius: float,
+                single_pass: bool = False):
+    if not single_pass:
+        return extrude(grip_cutout_profile(outer_tube_outer_radius), CONNECTOR_LENGTH+END_CAP_GRIP_THICKNESS)
+    grip_cutout_radius = outer_tube_outer_radius*GRIP_CUTOUT_RATIO
+    # Join the cutouts with a ring outside the grip, into a single solid
+    ring = Circle(outer_tube_outer_radius+3*grip_cutout_radius) - Circle(outer_tube_outer_radius+1.5*grip_cutout_radius)
+    # Reach past the grip, so no face of the cutter is coplanar with the part
+    return (
+        Pos(0,0,-grip_cutout_radius) 
+        * extrude(ring + grip_cutout_profile(outer_tube_outer_radius), 
+                  CONNECTOR_LENGTH+END_CAP_GRIP_THICKNESS+2*grip_cutout_radius)
+    )
+
+def grip_band_radius(outer_tube_outer_radius: float):
+    # Halfway between the outer tube and the closest point of the grip cutouts, only the grip is outside of it
+    grip_cutout_radius = outer_tube_outer_radius*GRIP_CUTOUT_RATIO
+    cutout_inner_radius = hypot(outer_tube_outer_radius+grip_cutout_radius, grip_cutout_radius) - grip_cutout_radius
+    return (outer_tube_outer_radius+cutout_inner_radius)/2
+
+@memoize
+def grip_band_mesh(outer_tube_outer_radius: float,
+                   builder: str,
+                   quality: str,
+                   single_pass: bool = False):
+    # The grip outside of grip_band_radius, with the cutouts, meshed by OCCT.
+    # The rest of the revolved parts is meshed directly and stitched to it, for STL only
+    band_radius = grip_band_radius(outer_tube_outer_radius)
+    profile = grip_base_profile(outer_tube_outer_radius) & (
+        Pos(band_radius,0)
+        * Rectangle(outer_tube_outer_radius, END_CAP_GRIP_THICKNESS, align=Align.MIN)
+    )
+    band = Pos(0,0,CONNECTOR_LENGTH) * revolve(Plane.XZ * profile)
+    band -= grip_cutout(outer_tube_outer_radius, single_pass)
+    return muffler_lathe.shape_triangles(band, builder, quality, exclude_radius=band_radius)
+
+def gripped_profile_mesh(profile, 
+                         outer_tube_outer_radius: float, 
+                         segments: int,
+                         builder: str,
+                         quality: str,
+                         single_pass: bool = False):
+    # A revolved profile with the grip, the grip cutouts meshed by OCCT (with the STL quality profile of the builder)
+    # and the rest directly with NumPy
+    band = grip_band_mesh(outer_tube_outer_radius, builder, quality, single_pass)
+    polygon = muffler_lathe.profile_polygon(profile)
+    revolved = muffler_mesh.revolve_polygon(polygon, segments, grip_band_radius(outer_tube_outer_radius), band)
+    return np.concatenate([revolved, band])
+
 # %% Base grip
 
 def grip_base_profile(outer_tube_outer_radius: float):
@@ -233,14 +311,30 @@ def body_male(muffler_o_ring_inner_diameter: MufflerORingInnerDiameter,
     profile = body_male_profile(muffler_o_ring_inner_diameter, muffler_length)
     part = revolve(Plane.XZ * profile)
     # Grip cutout
-    body_grip_cutout = grip_cutout_profile(outer_tube_outer_radius)
-    part -= extrude(body_grip_cutout, CONNECTOR_LENGTH+END_CAP_GRIP_THICKNESS)
+    part -= grip_cutout(outer_tube_outer_radius)
+    return Compound([part, body_male_threading(muffler_o_ring_inner_diameter, muffler_length)])
+
+def body_male_threading(muffler_o_ring_inner_diameter: MufflerORingInnerDiameter,
+                        muffler_length: MufflerLength):
+    outer_tube_inner_radius = muffler_o_ring_inner_diameter/2+MUFFLER_O_RING_SHIFT
     # Internal threads
-    threading = (
+    return (
         Pos(0,0,CONNECTOR_LENGTH+muffler_length-END_CAP_GRIP_THICKNESS-END_CAP_INSERT_LENGTH-1) 
         * threading_body(outer_tube_inner_radius*2)
     )
-    return Compound([part, threading])
+
+def body_male_mesh(muffler_o_ring_inner_diameter: MufflerORingInnerDiameter,
+                   muffler_length: MufflerLength,
+                   segments: int = REVOLVED_DIRECT_MESH_SEGMENTS,
+                   quality: str = None):
+    # Same shape as body_male, but the revolved profile is meshed directly with NumPy, for STL only.
+    # The grip cutouts and threads are meshed by OCCT with the STL quality profile of that name (None for the default)
+    outer_tube_inner_radius = muffler_o_ring_inner_diameter/2+MUFFLER_O_RING_SHIFT
+    outer_tube_outer_radius = outer_tube_inner_radius+BODY_WALL_THICKNESS
+    profile = body_male_profile(muffler_o_ring_inner_diameter, muffler_length)
+    threading = body_male_threading(muffler_o_ring_inner_diameter, muffler_length)
+    return np.concatenate([gripped_profile_mesh(profile, outer_tube_outer_radius, segments, "body_male", quality),
+                           muffler_lathe.shape_triangles(threading, "body_male", quality)])
 
 # %% End cap grip used by both male & female versions, no connector
 
@@ -305,14 +399,31 @@ def end_cap_male(muffler_o_ring_inner_diameter: MufflerORingInnerDiameter,
     profile = end_cap_male_profile(muffler_o_ring_inner_diameter, threading_extra_spacing_enabled)
     part = revolve(Plane.XZ * profile)
     # Grip cutout
-    body_grip_cutout = grip_cutout_profile(outer_tube_outer_radius)
-    part -= extrude(body_grip_cutout, CONNECTOR_LENGTH+END_CAP_GRIP_THICKNESS)
+    part -= grip_cutout(outer_tube_outer_radius, GRIP_CUTOUT_SINGLE_PASS)
+    return Compound([part, end_cap_threading(muffler_o_ring_inner_diameter, threading_extra_spacing_enabled)])
+
+def end_cap_threading(muffler_o_ring_inner_diameter: MufflerORingInnerDiameter,
+                      threading_extra_spacing_enabled: bool):
+    outer_tube_inner_radius = muffler_o_ring_inner_diameter/2+MUFFLER_O_RING_SHIFT
     # External threads
-    threading = (
+    return (
         Pos(0,0,CONNECTOR_LENGTH+END_CAP_GRIP_THICKNESS) 
         * threading_end_cap(outer_tube_inner_radius*2, threading_extra_spacing_enabled)
     )
-    return Compound([part, threading])
+
+def end_cap_male_mesh(muffler_o_ring_inner_diameter: MufflerORingInnerDiameter, 
+                      threading_extra_spacing_enabled: bool = False,
+                      segments: int = REVOLVED_DIRECT_MESH_SEGMENTS,
+                      quality: str = None):
+    # Same shape as end_cap_male, but the revolved profile is meshed directly with NumPy, for STL only.
+    # The grip cutouts and threads are meshed by OCCT with the STL quality profile of that name (None for the default)
+    outer_tube_inner_radius = muffler_o_ring_inner_diameter/2+MUFFLER_O_RING_SHIFT
+    outer_tube_outer_radius = outer_tube_inner_radius+BODY_WALL_THICKNESS
+    profile = end_cap_male_profile(muffler_o_ring_inner_diameter, threading_extra_spacing_enabled)
+    threading = end_cap_threading(muffler_o_ring_inner_diameter, threading_extra_spacing_enabled)
+    return np.concatenate([gripped_profile_mesh(profile, outer_tube_outer_radius, segments, "end_cap_male", quality,
+                                                GRIP_CUTOUT_SINGLE_PASS),
+                           muffler_lathe.shape_triangles(threading, "end_cap_male", quality)])
 
 # %% Female end cap profile
 
@@ -351,25 +462,30 @@ def end_cap_female(muffler_o_ring_inner_diameter: MufflerORingInnerDiameter,
                                      threading_extra_spacing_enabled)
     part = revolve(Plane.XZ * profile)
     # Grip cutout
-    body_grip_cutout = grip_cutout_profile(outer_tube_outer_radius)
-    part -= extrude(body_grip_cutout, CONNECTOR_LENGTH+END_CAP_GRIP_THICKNESS)
-    # External threads
-    threading = (
-        Pos(0,0,CONNECTOR_LENGTH+END_CAP_GRIP_THICKNESS) 
-        * threading_end_cap(outer_tube_inner_radius*2, threading_extra_spacing_enabled)
-    )
-    return Compound([part, threading])
+    part -= grip_cutout(outer_tube_outer_radius, GRIP_CUTOUT_SINGLE_PASS)
+    return Compound([part, end_cap_threading(muffler_o_ring_inner_diameter, threading_extra_spacing_enabled)])
+
+def end_cap_female_mesh(muffler_o_ring_inner_diameter: MufflerORingInnerDiameter, 
+                        connector_female_o_ring_thickness: float, 
+                        threading_extra_spacing_enabled: bool = False,
+                        segments: int = REVOLVED_DIRECT_MESH_SEGMENTS,
+                        quality: str = None):
+    # Same shape as end_cap_female, but the revolved profile is meshed directly with NumPy, for STL only.
+    # The grip cutouts and threads are meshed by OCCT with the STL quality profile of that name (None for the default)
+    outer_tube_inner_radius = muffler_o_ring_inner_diameter/2+MUFFLER_O_RING_SHIFT
+    outer_tube_outer_radius = outer_tube_inner_radius+BODY_WALL_THICKNESS
+    profile = end_cap_female_profile(muffler_o_ring_inner_diameter, 
+                                     connector_female_o_ring_thickness, 
+                                     threading_extra_spacing_enabled)
+    threading = end_cap_threading(muffler_o_ring_inner_diameter, threading_extra_spacing_enabled)
+    return np.concatenate([gripped_profile_mesh(profile, outer_tube_outer_radius, segments, "end_cap_female", quality,
+                                                GRIP_CUTOUT_SINGLE_PASS),
+                           muffler_lathe.shape_triangles(threading, "end_cap_female", quality)])
 
 # %% Inner mesh tube
 
-def inner_mesh_tube(muffler_length: MufflerLength, 
-                    include_corkscrew: bool = False):
-    inner_tube_length = muffler_length-2*END_CAP_BOTTOM_THICKNESS+2*END_CAP_INNER_TUBE_SLOT_DEPTH
-    ring_profile = Rectangle(INNER_TUBE_MESH_THICKNESS, INNER_TUBE_MESH_THICKNESS, align=Align.MIN)
-    # End rings
-    bottom_ring = revolve(Plane.XZ * Pos(connector_male_inner_radius,0) * ring_profile)
-    top_ring = Pos(0,0,inner_tube_length-INNER_TUBE_MESH_THICKNESS) * bottom_ring
-    # Mesh
+@memoize
+def inner_mesh_tube_strands(inner_tube_length: float):
     ring_circumference = pi*CONNECTOR_MALE_OUTER_DIAMETER
     pitch = tan(radians(90-INNER_TUBE_MESH_TWIST_ANGLE))*ring_circumference
     clockwise_helix = Helix(pitch, inner_tube_length, connector_male_inner_radius)
@@ -377,13 +493,28 @@ def inner_mesh_tube(muffler_length: MufflerLength,
     mesh_profile = Rectangle(INNER_TUBE_MESH_THICKNESS, INNER_TUBE_MESH_THICKNESS, align=(Align.MIN, Align.CENTER))
     clockwise = sweep(Pos(connector_male_inner_radius,0,0) * mesh_profile, clockwise_helix, is_frenet=True)
     anticlockwise = sweep(Pos(connector_male_inner_radius,0,0) * mesh_profile, anticlockwise_helix, is_frenet=True)
+    return clockwise, anticlockwise
+
+@memoize
+def inner_mesh_tube_corkscrew(inner_tube_length: float):
+    clockwise_helix = Helix(INNER_TUBE_SCREW_TWIST_TURNS*inner_tube_length, inner_tube_length, connector_male_inner_radius)
+    corkscrew_profile = Rectangle(connector_male_inner_radius*2, INNER_TUBE_CORKSCREW_THICKNESS, align=(Align.MAX, Align.CENTER))
+    return sweep(Pos(connector_male_inner_radius,0,0) * corkscrew_profile, clockwise_helix, is_frenet=True)
+
+def inner_mesh_tube(muffler_length: MufflerLength, 
+                    include_corkscrew: bool = False):
+    inner_tube_length = muffler_length-2*END_CAP_BOTTOM_THICKNESS+2*END_CAP_INNER_TUBE_SLOT_DEPTH
+    ring_profile = Rectangle(INNER_TUBE_MESH_THICKNESS, INNER_TUBE_MESH_THICKNESS, align=Align.MIN)
+    # End rings
+    bottom_ring = revolve(Plane.XZ * Pos(connector_male_inner_radius,0) * ring_profile)
+    top_ring = Pos(0,0,inner_tube_length-INNER_TUBE_MESH_THICKNESS) * bottom_ring
+    # Mesh (shared by all tubes of the same length, placed by rotation below)
+    clockwise, anticlockwise = inner_mesh_tube_strands(inner_tube_length)
     # Make a flat Compound of all the objects
     solids = [bottom_ring, top_ring]
     # Optional corkscrew
     if include_corkscrew:
-        clockwise_helix = Helix(INNER_TUBE_SCREW_TWIST_TURNS*inner_tube_length, inner_tube_length, connector_male_inner_radius)
-        corkscrew_profile = Rectangle(connector_male_inner_radius*2, INNER_TUBE_CORKSCREW_THICKNESS, align=(Align.MAX, Align.CENTER))
-        corkscrew = sweep(Pos(connector_male_inner_radius,0,0) * corkscrew_profile, clockwise_helix, is_frenet=True)
+        corkscrew = Pos() * inner_mesh_tube_corkscrew(inner_tube_length)
         solids.append(corkscrew)
     # Merge mesh strands into same Compound
     for i in range(INNER_TUBE_MESH_COUNT):
@@ -393,6 +524,34 @@ def inner_mesh_tube(muffler_length: MufflerLength,
         solids.append(antistrand)
     return Compound(solids)
 
+def inner_mesh_tube_mesh(muffler_length: MufflerLength, 
+                         include_corkscrew: bool = False,
+                         segments: int = INNER_TUBE_DIRECT_MESH_SEGMENTS):
+    # Same shape as inner_mesh_tube, but triangles computed directly with NumPy, for STL only
+    inner_tube_length = muffler_length-2*END_CAP_BOTTOM_THICKNESS+2*END_CAP_INNER_TUBE_SLOT_DEPTH
+    radius = connector_male_inner_radius
+    thickness = INNER_TUBE_MESH_THICKNESS
+    # End rings
+    bottom_ring = muffler_mesh.lathe([(radius, 0), (radius+thickness, 0), (radius+thickness, thickness), (radius, thickness)], 
+                                     segments)
+    top_ring = bottom_ring + (0, 0, inner_tube_length-thickness)
+    # Mesh
+    ring_circumference = pi*CONNECTOR_MALE_OUTER_DIAMETER
+    pitch = tan(radians(90-INNER_TUBE_MESH_TWIST_ANGLE))*ring_circumference
+    mesh_profile = [(radius, -thickness/2), (radius+thickness, -thickness/2), (radius+thickness, thickness/2), (radius, thickness/2)]
+    clockwise = muffler_mesh.screw_sweep(mesh_profile, pitch, inner_tube_length, segments)
+    anticlockwise = muffler_mesh.screw_sweep(mesh_profile, pitch, inner_tube_length, segments, lefthand=True)
+    triangles = [bottom_ring, top_ring]
+    # Optional corkscrew
+    if include_corkscrew:
+        half_thickness = INNER_TUBE_CORKSCREW_THICKNESS/2
+        corkscrew_profile = [(-radius, -half_thickness), (radius, -half_thickness), (radius, half_thickness), (-radius, half_thickness)]
+        triangles.append(muffler_mesh.screw_sweep(corkscrew_profile, INNER_TUBE_SCREW_TWIST_TURNS*inner_tube_length, inner_tube_length, segments))
+    # Mesh strands
+    triangles.append(muffler_mesh.rotated_copies(clockwise, INNER_TUBE_MESH_COUNT))
+    triangles.append(muffler_mesh.rotated_copies(anticlockwise, INNER_TUBE_MESH_COUNT))
+    return np.concatenate(triangles)
+
 # %% Printable O-ring
 
 def o_ring_profile():
@@ -408,185 +567,111 @@ def o_ring(muffler_o_ring_inner_diameter: MufflerORingInnerDiameter):
     part = revolve(Plane.XZ * Pos(muffler_o_ring_inner_diameter/2) * profile)
     return part
 
-# %% Generate parts
-
-body_male_small_70 = body_male(MufflerORingInnerDiameter.SMALL, MufflerLength.SHORT)
-body_male_small_85 = body_male(MufflerORingInnerDiameter.SMALL, MufflerLength.REGULAR)
-body_male_small_100 = body_male(MufflerORingInnerDiameter.SMALL, MufflerLength.LONG)
-body_male_small_120 = body_male(MufflerORingInnerDiameter.SMALL, MufflerLength.EXTRALONG)
-body_male_medium_85 = body_male(MufflerORingInnerDiameter.MEDIUM, MufflerLength.REGULAR)
-body_male_medium_100 = body_male(MufflerORingInnerDiameter.MEDIUM, MufflerLength.LONG)
-body_male_medium_120 = body_male(MufflerORingInnerDiameter.MEDIUM, MufflerLength.EXTRALONG)
-body_male_large_100 = body_male(MufflerORingInnerDiameter.LARGE, MufflerLength.LONG)
-body_male_large_120 = body_male(MufflerORingInnerDiameter.LARGE, MufflerLength.EXTRALONG)
-
-end_cap_male_small = end_cap_male(MufflerORingInnerDiameter.SMALL)
-end_cap_male_small_extra_spacing = end_cap_male(MufflerORingInnerDiameter.SMALL, threading_extra_spacing_enabled=True)
-end_cap_male_medium = end_cap_male(MufflerORingInnerDiameter.MEDIUM)
-end_cap_male_medium_extra_spacing = end_cap_male(MufflerORingInnerDiameter.MEDIUM, threading_extra_spacing_enabled=True)
-end_cap_male_large = end_cap_male(MufflerORingInnerDiameter.LARGE)
-end_cap_male_large_extra_spacing = end_cap_male(MufflerORingInnerDiameter.LARGE, threading_extra_spacing_enabled=True)
-
-end_cap_female_small_2_0 = end_cap_female(MufflerORingInnerDiameter.SMALL, 2.0)
-end_cap_female_small_2_5 = end_cap_female(MufflerORingInnerDiameter.SMALL, 2.5)
-end_cap_female_small_2_0_extra_spacing = end_cap_female(MufflerORingInnerDiameter.SMALL, 2.0, threading_extra_spacing_enabled=True)
-end_cap_female_small_2_5_extra_spacing = end_cap_female(MufflerORingInnerDiameter.SMALL, 2.5, threading_extra_spacing_enabled=True)
-end_cap_female_medium_2_0 = end_cap_female(MufflerORingInnerDiameter.MEDIUM, 2.0)
-end_cap_female_medium_2_5 = end_cap_female(MufflerORingInnerDiameter.MEDIUM, 2.5)
-end_cap_female_medium_2_0_extra_spacing = end_cap_female(MufflerORingInnerDiameter.MEDIUM, 2.0, threading_extra_spacing_enabled=True)
-end_cap_female_medium_2_5_extra_spacing = end_cap_female(MufflerORingInnerDiameter.MEDIUM, 2.5, threading_extra_spacing_enabled=True)
-end_cap_female_large_2_0 = end_cap_female(MufflerORingInnerDiameter.LARGE, 2.0)
-end_cap_female_large_2_5 = end_cap_female(MufflerORingInnerDiameter.LARGE, 2.5)
-end_cap_female_large_2_0_extra_spacing = end_cap_female(MufflerORingInnerDiameter.LARGE, 2.0, threading_extra_spacing_enabled=True)
-end_cap_female_large_2_5_extra_spacing = end_cap_female(MufflerORingInnerDiameter.LARGE, 2.5, threading_extra_spacing_enabled=True)
-
-inner_mesh_tube_70 = inner_mesh_tube(MufflerLength.SHORT)
-inner_mesh_tube_70_corkscrew = inner_mesh_tube(MufflerLength.SHORT, include_corkscrew=True)
-inner_mesh_tube_85 = inner_mesh_tube(MufflerLength.REGULAR)
-inner_mesh_tube_85_corkscrew = inner_mesh_tube(MufflerLength.REGULAR, include_corkscrew=True)
-inner_mesh_tube_100 = inner_mesh_tube(MufflerLength.LONG)
-inner_mesh_tube_100_corkscrew = inner_mesh_tube(MufflerLength.LONG, include_corkscrew=True)
-inner_mesh_tube_120 = inner_mesh_tube(MufflerLength.EXTRALONG)
-inner_mesh_tube_120_corkscrew = inner_mesh_tube(MufflerLength.EXTRALONG, include_corkscrew=True)
-
-o_ring_small = o_ring(MufflerORingInnerDiameter.SMALL)
-o_ring_medium = o_ring(MufflerORingInnerDiameter.MEDIUM)
-o_ring_large = o_ring(MufflerORingInnerDiameter.LARGE)
+def o_ring_mesh(muffler_o_ring_inner_diameter: MufflerORingInnerDiameter,
+                segments: int = REVOLVED_DIRECT_MESH_SEGMENTS):
+    # Same shape as o_ring, but meshed directly with NumPy, for STL only
+    polygon = muffler_lathe.profile_polygon(Pos(muffler_o_ring_inner_diameter/2) * o_ring_profile())
+    return muffler_mesh.revolve_polygon(polygon, segments)
+
+# %% Variants
+
+VARIANTS = {
+    "body-male-small-70": partial(body_male, MufflerORingInnerDiameter.SMALL, MufflerLength.SHORT),
+    "body-male-small-85": partial(body_male, MufflerORingInnerDiameter.SMALL, MufflerLength.REGULAR),
+    "body-male-small-100": partial(body_male, MufflerORingInnerDiameter.SMALL, MufflerLength.LONG),
+    "body-male-small-120": partial(body_male, MufflerORingInnerDiameter.SMALL, MufflerLength.EXTRALONG),
+    "body-male-medium-85": partial(body_male, MufflerORingInnerDiameter.MEDIUM, MufflerLength.REGULAR),
+    "body-male-medium-100": partial(body_male, MufflerORingInnerDiameter.MEDIUM, MufflerLength.LONG),
+    "body-male-medium-120": partial(body_male, MufflerORingInnerDiameter.MEDIUM, MufflerLength.EXTRALONG),
+    "body-male-large-100": partial(body_male, MufflerORingInnerDiameter.LARGE, MufflerLength.LONG),
+    "body-male-large-120": partial(body_male, MufflerORingInnerDiameter.LARGE, MufflerLength.EXTRALONG),
+
+    "end-cap-male-small": partial(end_cap_male, MufflerORingInnerDiameter.SMALL),
+    "end-cap-male-small-extra-spacing": partial(end_cap_male, MufflerORingInnerDiameter.SMALL, threading_extra_spacing_enabled=True),
+    "end-cap-male-medium": partial(end_cap_male, MufflerORingInnerDiameter.MEDIUM),
+    "end-cap-male-medium-extra-spacing": partial(end_cap_male, MufflerORingInnerDiameter.MEDIUM, threading_extra_spacing_enabled=True),
+    "end-cap-male-large": partial(end_cap_male, MufflerORingInnerDiameter.LARGE),
+    "end-cap-male-large-extra-spacing": partial(end_cap_male, MufflerORingInnerDiameter.LARGE, threading_extra_spacing_enabled=True),
+
+    "end-cap-female-small-2-0": partial(end_cap_female, MufflerORingInnerDiameter.SMALL, 2.0),
+    "end-cap-female-small-2-5": partial(end_cap_female, MufflerORingInnerDiameter.SMALL, 2.5),
+    "end-cap-female-small-2-0-extra-spacing": partial(end_cap_female, MufflerORingInnerDiameter.SMALL, 2.0, threading_extra_spacing_enabled=True),
+    "end-cap-female-small-2-5-extra-spacing": partial(end_cap_female, MufflerORingInnerDiameter.SMALL, 2.5, threading_extra_spacing_enabled=True),
+    "end-cap-female-medium-2-0": partial(end_cap_female, MufflerORingInnerDiameter.MEDIUM, 2.0),
+    "end-cap-female-medium-2-5": partial(end_cap_female, MufflerORingInnerDiameter.MEDIUM, 2.5),
+    "end-cap-female-medium-2-0-extra-spacing": partial(end_cap_female, MufflerORingInnerDiameter.MEDIUM, 2.0, threading_extra_spacing_enabled=True),
+    "end-cap-female-medium-2-5-extra-spacing": partial(end_cap_female, MufflerORingInnerDiameter.MEDIUM, 2.5, threading_extra_spacing_enabled=True),
+    "end-cap-female-large-2-0": partial(end_cap_female, MufflerORingInnerDiameter.LARGE, 2.0),
+    "end-cap-female-large-2-5": partial(end_cap_female, MufflerORingInnerDiameter.LARGE, 2.5),
+    "end-cap-female-large-2-0-extra-spacing": partial(end_cap_female, MufflerORingInnerDiameter.LARGE, 2.0, threading_extra_spacing_enabled=True),
+    "end-cap-female-large-2-5-extra-spacing": partial(end_cap_female, MufflerORingInnerDiameter.LARGE, 2.5, threading_extra_spacing_enabled=True),
+
+    "inner-mesh-tube-70": partial(inner_mesh_tube, MufflerLength.SHORT),
+    "inner-mesh-tube-70-corkscrew": partial(inner_mesh_tube, MufflerLength.SHORT, include_corkscrew=True),
+    "inner-mesh-tube-85": partial(inner_mesh_tube, MufflerLength.REGULAR),
+    "inner-mesh-tube-85-corkscrew": partial(inner_mesh_tube, MufflerLength.REGULAR, include_corkscrew=True),
+    "inner-mesh-tube-100": partial(inner_mesh_tube, MufflerLength.LONG),
+    "inner-mesh-tube-100-corkscrew": partial(inner_mesh_tube, MufflerLength.LONG, include_corkscrew=True),
+    "inner-mesh-tube-120": partial(inner_mesh_tube, MufflerLength.EXTRALONG),
+    "inner-mesh-tube-120-corkscrew": partial(inner_mesh_tube, MufflerLength.EXTRALONG, include_corkscrew=True),
+
+    "o-ring-small": partial(o_ring, MufflerORingInnerDiameter.SMALL),
+    "o-ring-medium": partial(o_ring, MufflerORingInnerDiameter.MEDIUM),
+    "o-ring-large": partial(o_ring, MufflerORingInnerDiameter.LARGE),
+}
+'''All printable variants, by name. The exported files are named 'v2-<name>.stl' and 'v2-<name>.step'.'''
 
 # %% Preview 
 # (uncomment one object at a time to preview, import 'ocp_vscode' needs to be uncommented at the top of the file as well)
 
-#show(body_male_small_70)
-#show(body_male_small_85)
-#show(body_male_small_100)
-#show(body_male_small_120)
-#show(body_male_medium_85)
-#show(body_male_medium_100)
-#show(body_male_medium_120)
-#show(body_male_large_100)
-#show(body_male_large_120)
-
-#show(end_cap_male_small)
-#show(end_cap_male_small_extra_spacing)
-#show(end_cap_male_medium)
-#show(end_cap_male_medium_extra_spacing)
-#show(end_cap_male_large)
-#show(end_cap_male_large_extra_spacing)
-
-#show(end_cap_female_small_2_0)
-#show(end_cap_female_small_2_5)
-#show(end_cap_female_small_2_0_extra_spacing)
-#show(end_cap_female_small_2_5_extra_spacing)
-#show(end_cap_female_medium_2_0)
-#show(end_cap_female_medium_2_5)
-#show(end_cap_female_medium_2_0_extra_spacing)
-#show(end_cap_female_medium_2_5_extra_spacing)
-#show(end_cap_female_large_2_0)
-#show(end_cap_female_large_2_5)
-#show(end_cap_female_large_2_0_extra_spacing)
-#show(end_cap_female_large_2_5_extra_spacing)
-
-#show(inner_mesh_tube_70)
-#show(inner_mesh_tube_70_corkscrew)
-#show(inner_mesh_tube_85)
-#show(inner_mesh_tube_85_corkscrew)
-#show(inner_mesh_tube_100)
-#show(inner_mesh_tube_100_corkscrew)
-#show(inner_mesh_tube_120)
-#show(inner_mesh_tube_120_corkscrew)
-
-#show(o_ring_small)
-#show(o_ring_medium)
-#show(o_ring_large)
-
-# %% Exports STL
-
-export_stl(body_male_small_70, "v2-body-male-small-70.stl")
-export_stl(body_male_small_85, "v2-body-male-small-85.stl")
-export_stl(body_male_small_100, "v2-body-male-small-100.stl")
-export_stl(body_male_small_120, "v2-body-male-small-120.stl")
-export_stl(body_male_medium_85, "v2-body-male-medium-85.stl")
-export_stl(body_male_medium_100, "v2-body-male-medium-100.stl")
-export_stl(body_male_medium_120, "v2-body-male-medium-120.stl")
-export_stl(body_male_large_100, "v2-body-male-large-100.stl")
-export_stl(body_male_large_120, "v2-body-male-large-120.stl")
-
-export_stl(end_cap_male_small, "v2-end-cap-male-small.stl")
-export_stl(end_cap_male_small_extra_spacing, "v2-end-cap-male-small-extra-spacing.stl")
-export_stl(end_cap_male_medium, "v2-end-cap-male-medium.stl")
-export_stl(end_cap_male_medium_extra_spacing, "v2-end-cap-male-medium-extra-spacing.stl")
-export_stl(end_cap_male_large, "v2-end-cap-male-large.stl")
-export_stl(end_cap_male_large_extra_spacing, "v2-end-cap-male-large-extra-spacing.stl")
-
-export_stl(end_cap_female_small_2_0, "v2-end-cap-female-small-2-0.stl")
-export_stl(end_cap_female_small_2_5, "v2-end-cap-female-small-2-5.stl")
-export_stl(end_cap_female_small_2_0_extra_spacing, "v2-end-cap-female-small-2-0-extra-spacing.stl")
-export_stl(end_cap_female_small_2_5_extra_spacing, "v2-end-cap-female-small-2-5-extra-spacing.stl")
-export_stl(end_cap_female_medium_2_0, "v2-end-cap-female-medium-2-0.stl")
-export_stl(end_cap_female_medium_2_5, "v2-end-cap-female-medium-2-5.stl")
-export_stl(end_cap_female_medium_2_0_extra_spacing, "v2-end-cap-female-medium-2-0-extra-spacing.stl")
-export_stl(end_cap_female_medium_2_5_extra_spacing, "v2-end-cap-female-medium-2-5-extra-spacing.stl")
-export_stl(end_cap_female_large_2_0, "v2-end-cap-female-large-2-0.stl")
-export_stl(end_cap_female_large_2_5, "v2-end-cap-female-large-2-5.stl")
-export_stl(end_cap_female_large_2_0_extra_spacing, "v2-end-cap-female-large-2-0-extra-spacing.stl")
-export_stl(end_cap_female_large_2_5_extra_spacing, "v2-end-cap-female-large-2-5-extra-spacing.stl")
-
-export_stl(inner_mesh_tube_70, "v2-inner-mesh-tube-70.stl")
-export_stl(inner_mesh_tube_70_corkscrew, "v2-inner-mesh-tube-70-corkscrew.stl")
-export_stl(inner_mesh_tube_85, "v2-inner-mesh-tube-85.stl")
-export_stl(inner_mesh_tube_85_corkscrew, "v2-inner-mesh-tube-85-corkscrew.stl")
-export_stl(inner_mesh_tube_100, "v2-inner-mesh-tube-100.stl")
-export_stl(inner_mesh_tube_100_corkscrew, "v2-inner-mesh-tube-100-corkscrew.stl")
-export_stl(inner_mesh_tube_120, "v2-inner-mesh-tube-120.stl")
-export_stl(inner_mesh_tube_120_corkscrew, "v2-inner-mesh-tube-120-corkscrew.stl")
-
-export_stl(o_ring_small, "v2-o-ring-small.stl")
-export_stl(o_ring_medium, "v2-o-ring-medium.stl")
-export_stl(o_ring_large, "v2-o-ring-large.stl")
-
-# %% Exports STEP
-
-export_step(body_male_small_70, "v2-body-male-small-70.step")
-export_step(body_male_small_85, "v2-body-male-small-85.step")
-export_step(body_male_small_100, "v2-body-male-small-100.step")
-export_step(body_male_small_120, "v2-body-male-small-120.step")
-export_step(body_male_medium_85, "v2-body-male-medium-85.step")
-export_step(body_male_medium_100, "v2-body-male-medium-100.step")
-export_step(body_male_medium_120, "v2-body-male-medium-120.step")
-export_step(body_male_large_100, "v2-body-male-large-100.step")
-export_step(body_male_large_120, "v2-body-male-large-120.step")
-
-export_step(end_cap_male_small, "v2-end-cap-male-small.step")
-export_step(end_cap_male_small_extra_spacing, "v2-end-cap-male-small-extra-spacing.step")
-export_step(end_cap_male_medium, "v2-end-cap-male-medium.step")
-export_step(end_cap_male_medium_extra_spacing, "v2-end-cap-male-medium-extra-spacing.step")
-export_step(end_cap_male_large, "v2-end-cap-male-large.step")
-export_step(end_cap_male_large_extra_spacing, "v2-end-cap-male-large-extra-spacing.step")
-
-export_step(end_cap_female_small_2_0, "v2-end-cap-female-small-2-0.step")
-export_step(end_cap_female_small_2_5, "v2-end-cap-female-small-2-5.step")
-export_step(end_cap_female_small_2_0_extra_spacing, "v2-end-cap-female-small-2-0-extra-spacing.step")
-export_step(end_cap_female_small_2_5_extra_spacing, "v2-end-cap-female-small-2-5-extra-spacing.step")
-export_step(end_cap_female_medium_2_0, "v2-end-cap-female-medium-2-0.step")
-export_step(end_cap_female_medium_2_5, "v2-end-cap-female-medium-2-5.step")
-export_step(end_cap_female_medium_2_0_extra_spacing, "v2-end-cap-female-medium-2-0-extra-spacing.step")
-export_step(end_cap_female_medium_2_5_extra_spacing, "v2-end-cap-female-medium-2-5-extra-spacing.step")
-export_step(end_cap_female_large_2_0, "v2-end-cap-female-large-2-0.step")
-export_step(end_cap_female_large_2_5, "v2-end-cap-female-large-2-5.step")
-export_step(end_cap_female_large_2_0_extra_spacing, "v2-end-cap-female-large-2-0-extra-spacing.step")
-export_step(end_cap_female_large_2_5_extra_spacing, "v2-end-cap-female-large-2-5-extra-spacing.step")
-
-export_step(inner_mesh_tube_70, "v2-inner-mesh-tube-70.step")
-export_step(inner_mesh_tube_70_corkscrew, "v2-inner-mesh-tube-70-corkscrew.step")
-export_step(inner_mesh_tube_85, "v2-inner-mesh-tube-85.step")
-export_step(inner_mesh_tube_85_corkscrew, "v2-inner-mesh-tube-85-corkscrew.step")
-export_step(inner_mesh_tube_100, "v2-inner-mesh-tube-100.step")
-export_step(inner_mesh_tube_100_corkscrew, "v2-inner-mesh-tube-100-corkscrew.step")
-export_step(inner_mesh_tube_120, "v2-inner-mesh-tube-120.step")
-export_step(inner_mesh_tube_120_corkscrew, "v2-inner-mesh-tube-120-corkscrew.step")
-
-export_step(o_ring_small, "v2-o-ring-small.step")
-export_step(o_ring_medium, "v2-o-ring-medium.step")
-export_step(o_ring_large, "v2-o-ring-large.step")
-
-# %%
\ No newline at end of file
+#show(VARIANTS["body-male-small-70"]())
+#show(VARIANTS["body-male-small-85"]())
+#show(VARIANTS["body-male-small-100"]())
+#show(VARIANTS["body-male-small-120"]())
+#show(VARIANTS["body-male-medium-85"]())
+#show(VARIANTS["body-male-medium-100"]())
+#show(VARIANTS["body-male-medium-120"]())
+#show(VARIANTS["body-male-large-100"]())
+#show(VARIANTS["body-male-large-120"]())
+
+#show(VARIANTS["end-cap-male-small"]())
+#show(VARIANTS["end-cap-male-small-extra-spacing"]())
+#show(VARIANTS["end-cap-male-medium"]())
+#show(VARIANTS["end-cap-male-medium-extra-spacing"]())
+#show(VARIANTS["end-cap-male-large"]())
+#show(VARIANTS["end-cap-male-large-extra-spacing"]())
+
+#show(VARIANTS["end-cap-female-small-2-0"]())
+#show(VARIANTS["end-cap-female-small-2-5"]())
+#show(VARIANTS["end-cap-female-small-2-0-extra-spacing"]())
+#show(VARIANTS["end-cap-female-small-2-5-extra-spacing"]())
+#show(VARIANTS["end-cap-female-medium-2-0"]())
+#show(VARIANTS["end-cap-female-medium-2-5"]())
+#show(VARIANTS["end-cap-female-medium-2-0-extra-spacing"]())
+#show(VARIANTS["end-cap-female-medium-2-5-extra-spacing"]())
+#show(VARIANTS["end-cap-female-large-2-0"]())
+#show(VARIANTS["end-cap-female-large-2-5"]())
+#show(VARIANTS["end-cap-female-large-2-0-extra-spacing"]())
+#show(VARIANTS["end-cap-female-large-2-5-extra-spacing"]())
+
+#show(VARIANTS["inner-mesh-tube-70"]())
+#show(VARIANTS["inner-mesh-tube-70-corkscrew"]())
+#show(VARIANTS["inner-mesh-tube-85"]())
+#show(VARIANTS["inner-mesh-tube-85-corkscrew"]())
+#show(VARIANTS["inner-mesh-tube-100"]())
+#show(VARIANTS["inner-mesh-tube-100-corkscrew"]())
+#show(VARIANTS["inner-mesh-tube-120"]())
+#show(VARIANTS["inner-mesh-tube-120-corkscrew"]())
+
+#show(VARIANTS["o-ring-small"]())
+#show(VARIANTS["o-ring-medium"]())
+#show(VARIANTS["o-ring-large"]())
+
+# %% Build and export
+# (all variants by default, see 'python muffler_cli.py --help' for building only some of them)
+
+if __name__ == "__main__":
+    from muffler_cli import main
+    main()
+
+# %%
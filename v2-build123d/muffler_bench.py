@@ -0,0 +1,307 @@
+'''Benchmark of the geometry builders, the tessellation and the exports.
+
+Times every stage of a fixed set of variants, after warm-up runs, and appends
+the results to a JSON history file. The compare mode flags stages that got
+slower than an earlier run, e.g. after a build123d or OCCT upgrade or after
+changing a constant.
+
+Examples:
+    python muffler_bench.py --label "before upgrade"
+    python muffler_bench.py --compare
+    python muffler_bench.py --grip-cutout-modes
+    python muffler_bench.py --thread-engines
+    python muffler_bench.py --import-time
+'''
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from muffler_build import load_model
+from muffler_cache import library_versions
+from muffler_memo import memo_clear
+from muffler_quality import DEFAULT_PROFILE, QUALITY_PROFILES, export_stl
+
+BENCH_VARIANTS = ("body-male-large-100", "end-cap-male-large", "end-cap-female-large-2-0",
+                  "inner-mesh-tube-100-corkscrew", "o-ring-large")
+'''The variants timed by default, one of each part builder'''
+
+DEFAULT_HISTORY = Path("bench-history.json")
+'''The JSON file the benchmark runs are appended to, in the current directory as its timings are of this machine'''
+
+DEFAULT_THRESHOLD = 0.10
+'''Relative slowdown of a stage's median time reported as a regression'''
+
+MIN_REGRESSION_SECONDS = 0.005
+'''Smaller slowdowns are timing noise, never reported as a regression'''
+
+STARTUP_STATEMENTS = {
+    "python": "pass",
+    "params": "from muffler_params import load_params; load_params()",
+    "model": "from muffler_build import load_model; load_model()",
+}
+'''The startups timed in a fresh interpreter: the bare interpreter, the configuration alone and the model'''
+
+def _time(function, warmup: int, repeats: int):
+    '''Seconds of each repeated call of function, after the warm-up calls'''
+    for _ in range(warmup):
+        function()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return times
+
+def _fresh(function, *args, **kwargs):
+    '''Call a (memoized) model function, building all its geometry from scratch'''
+    memo_clear()
+    return function(*args, **kwargs)
+
+def bench_stages(names=BENCH_VARIANTS, warmup: int = 1, repeats: int = 5, quality: str = DEFAULT_PROFILE):
+    '''Times of every stage, by "<variant>/<stage>" or "<function>/<arguments>"'''
+    from build123d import export_step
+    from OCP.BRepMesh import BRepMesh_IncrementalMesh
+    from OCP.BRepTools import BRepTools
+    model = load_model()
+    profile = QUALITY_PROFILES[quality]
+    stages = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name in names:
+            variant = model.VARIANTS[name]
+            builder = variant.func.__name__
+            stages[f"{name}/build"] = _time(lambda: _fresh(variant), warmup, repeats)
+            part = variant()
+
+            def tessellate():
+                BRepTools.Clean_s(part.wrapped)
+                BRepMesh_IncrementalMesh(part.wrapped, profile.default.tolerance, True,
+                                         profile.default.angular_tolerance, True)
+            stages[f"{name}/tessellate"] = _time(tessellate, warmup, repeats)
+            stl = Path(directory) / f"{name}.stl"
+            stages[f"{name}/stl"] = _time(lambda: export_stl(part, stl, builder, profile), warmup, repeats)
+            step = Path(directory) / f"{name}.step"
+            stages[f"{name}/step"] = _time(lambda: export_step(part, step, timestamp="2000-01-01T00:00:00"),
+                                           warmup, repeats)
+            del part
+    # The IsoThread calls on their own, bypassing the memo
+    for size in model.MufflerORingInnerDiameter:
+        major_diameter = 2*(size/2 + model.MUFFLER_O_RING_SHIFT) # As in body_male and the end caps
+        stages[f"threading_body/{size.name.lower()}"] = _time(
+            lambda: model.threading_body.__wrapped__(major_diameter), warmup, repeats)
+        stages[f"threading_end_cap/{size.name.lower()}"] = _time(
+            lambda: model.threading_end_cap.__wrapped__(major_diameter, False), warmup, repeats)
+    memo_clear()
+    return stages
+
+def bench_startup(warmup: int = 1, repeats: int = 5):
+    '''Times of a fresh interpreter loading the configuration or the model, by "startup/<name>"'''
+    def run(statement):
+        subprocess.run([sys.executable, "-c", statement], cwd=Path(__file__).parent, check=True)
+    return {f"startup/{name}": _time(lambda: run(statement), warmup, repeats)
+            for name, statement in STARTUP_STATEMENTS.items()}
+
+def compare_grip_cutout_modes(names=BENCH_VARIANTS, warmup: int = 1, repeats: int = 5):
+    '''Build time, and faces and volume of the gripped solid, of every end cap in both grip cutout modes.
+
+    By variant, then by GRIP_CUTOUT_SINGLE_PASS.
+    '''
+    model = load_model()
+    default = model.GRIP_CUTOUT_SINGLE_PASS
+    gripped = [name for name in names if model.VARIANTS[name].func.__name__ in ("end_cap_male", "end_cap_female")]
+    results = {name: {} for name in gripped}
+    try:
+        for single_pass in (False, True):
+            model.GRIP_CUTOUT_SINGLE_PASS = single_pass
+            for name in gripped:
+                variant = model.VARIANTS[name]
+                times = _time(lambda: _fresh(variant), warmup, repeats)
+                solid = max(variant().solids(), key=lambda solid: len(solid.faces()))
+                results[name][single_pass] = (statistics.median(times), len(solid.faces()), solid.volume)
+    finally:
+        model.GRIP_CUTOUT_SINGLE_PASS = default
+        memo_clear()
+    return results
+
+def compare_thread_engines(names=BENCH_VARIANTS, warmup: int = 1, repeats: int = 5, quality: str = DEFAULT_PROFILE):
+    '''Build time, faces, STL triangles and STEP bytes of every threaded variant with IsoThread and swept threads.
+
+    By variant, then by THREADING_SWEPT.
+    '''
+    from build123d import export_step
+    model = load_model()
+    default = model.THREADING_SWEPT
+    profile = QUALITY_PROFILES[quality]
+    threaded = [name for name in names if model.VARIANTS[name].func.__name__ in ("end_cap_male", "end_cap_female")]
+    results = {name: {} for name in threaded}
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for swept in (False, True):
+                model.THREADING_SWEPT = swept
+                for name in threaded:
+                    variant = model.VARIANTS[name]
+                    times = _time(lambda: _fresh(variant), warmup, repeats)
+                    part = variant()
+                    stl, step = Path(directory) / f"{name}.stl", Path(directory) / f"{name}.step"
+                    export_stl(part, stl, variant.func.__name__, profile)
+                    export_step(part, step, timestamp="2000-01-01T00:00:00")
+                    # A binary STL is an 84 byte header and 50 bytes per triangle
+                    results[name][swept] = (statistics.median(times), len(part.faces()),
+                                            (stl.stat().st_size - 84)//50, step.stat().st_size)
+    finally:
+        model.THREADING_SWEPT = default
+        memo_clear()
+    return results
+
+def run_benchmark(names=BENCH_VARIANTS, warmup: int = 1, repeats: int = 5, quality: str = DEFAULT_PROFILE,
+                  label: str = None):
+    '''One benchmark run, as stored in the history'''
+    stages = {**bench_startup(warmup, repeats), **bench_stages(names, warmup, repeats, quality)}
+    return {
+        "time": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "label": label,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "libraries": library_versions(),
+        "warmup": warmup,
+        "repeats": repeats,
+        "quality": quality,
+        "stages": {stage: {"median": statistics.median(times), "min": min(times), "times": times}
+                   for stage, times in stages.items()},
+    }
+
+def load_history(path=DEFAULT_HISTORY):
+    '''All runs in the history file, oldest first'''
+    path = Path(path)
+    return json.loads(path.read_text()) if path.is_file() else []
+
+def append_history(run: dict, path=DEFAULT_HISTORY):
+    history = load_history(path) + [run]
+    Path(path).write_text(json.dumps(history, indent=1) + "\n")
+    return history
+
+def find_run(history, baseline: str):
+    '''The run with the given label, or at the given index (e.g. "-2" for the one before the last)'''
+    for run in reversed(history):
+        if run.get("label") == baseline:
+            return run
+    try:
+        return history[int(baseline)]
+    except (ValueError, IndexError):
+        raise KeyError(baseline) from None
+
+def compare_runs(baseline: dict, current: dict, threshold: float = DEFAULT_THRESHOLD):
+    '''The relative change of the median time of every stage in both runs, and whether it is a regression'''
+    changes = {}
+    for stage, timing in current["stages"].items():
+        if stage in baseline["stages"]:
+            before = baseline["stages"][stage]["median"]
+            change = timing["median"]/before - 1 if before > 0 else 0.0
+            regression = change > threshold and timing["median"] - before > MIN_REGRESSION_SECONDS
+            changes[stage] = (before, timing["median"], change, regression)
+    return changes
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the muffler geometry builders and exports.")
+    parser.add_argument("variants", nargs="*", metavar="VARIANT",
+                        help=f"variants to time (default: {', '.join(BENCH_VARIANTS)})")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed runs of each stage (default: 1)")
+    parser.add_argument("--repeats", type=int, default=5, help="timed runs of each stage (default: 5)")
+    parser.add_argument("--quality", choices=QUALITY_PROFILES, default=DEFAULT_PROFILE,
+                        help=f"STL tessellation quality profile (default: {DEFAULT_PROFILE})")
+    parser.add_argument("--label", help="name of this run in the history, to compare against later")
+    parser.add_argument("--history", default=DEFAULT_HISTORY,
+                        help=f"JSON history file (default: {DEFAULT_HISTORY} in the current directory)")
+    parser.add_argument("--compare", nargs="?", const="-2", metavar="BASELINE",
+                        help="compare the last run with a baseline run, by label or index "
+                             "(default: the run before it), without running the benchmark")
+    parser.add_argument("--grip-cutout-modes", action="store_true",
+                        help="compare the build time and faces of the separate and single pass grip cutouts, "
+                             "without running the benchmark")
+    parser.add_argument("--thread-engines", action="store_true",
+                        help="compare the build time, faces and file sizes of the IsoThread and swept threads, "
+                             "without running the benchmark")
+    parser.add_argument("--import-time", action="store_true",
+                        help="compare the startup of the configuration alone (muffler_params) and of the model, "
+                             "without running the benchmark")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"relative slowdown reported as a regression (default: {DEFAULT_THRESHOLD})")
+    args = parser.parse_args(argv)
+
+    if args.compare is not None:
+        history = load_history(args.history)
+        if not history:
+            parser.error(f"no benchmark runs in {args.history}")
+        try:
+            baseline = find_run(history, args.compare)
+        except KeyError:
+            parser.error(f"no benchmark run {args.compare!r} in {args.history}")
+        sys.exit(_report_comparison(baseline, history[-1], args.threshold))
+
+    if args.import_time:
+        _report_startup(bench_startup(args.warmup, args.repeats))
+        return
+    model = load_model()
+    unknown = [name for name in args.variants if name not in model.VARIANTS]
+    if unknown:
+        parser.error(f"unknown variants: {', '.join(unknown)}")
+    if args.grip_cutout_modes:
+        _report_grip_cutout_modes(compare_grip_cutout_modes(args.variants or BENCH_VARIANTS, args.warmup, args.repeats))
+        return
+    if args.thread_engines:
+        _report_thread_engines(compare_thread_engines(args.variants or BENCH_VARIANTS, args.warmup, args.repeats,
+                                                      args.quality))
+        return
+    run = run_benchmark(args.variants or BENCH_VARIANTS, args.warmup, args.repeats, args.quality, args.label)
+    for stage, timing in run["stages"].items():
+        print(f"{stage:<50} {timing['median']:8.3f}s median {timing['min']:8.3f}s min")
+    append_history(run, args.history)
+    print(f"Appended to {args.history}")
+
+def _report_comparison(baseline: dict, current: dict, threshold: float):
+    print(f"Comparing {current['time']} ({current.get('label') or 'unlabeled'}) "
+          f"with {baseline['time']} ({baseline.get('label') or 'unlabeled'})")
+    for setting in ("quality", "python", "machine"):
+        if baseline.get(setting) != current.get(setting):
+            print(f"Warning: {setting} changed from {baseline.get(setting)} to {current.get(setting)}")
+    for library in sorted(set(baseline["libraries"]) | set(current["libraries"])):
+        before, after = baseline["libraries"].get(library), current["libraries"].get(library)
+        if before != after:
+            print(f"{library} changed from {before} to {after}")
+    changes = compare_runs(baseline, current, threshold)
+    for stage, (before, after, change, regression) in changes.items():
+        print(f"{stage:<50} {before:8.3f}s -> {after:8.3f}s {change:+7.1%}{'  REGRESSION' if regression else ''}")
+    regressions = sum(regression for *_, regression in changes.values())
+    print(f"{regressions} regressions above {threshold:.0%}")
+    return 1 if regressions else 0
+
+def _report_startup(stages):
+    python, params, model = (statistics.median(stages[f"startup/{name}"]) for name in STARTUP_STATEMENTS)
+    print(f"{'python':<10} {python:8.3f}s")
+    print(f"{'params':<10} {params:8.3f}s {params - python:8.3f}s after the interpreter")
+    print(f"{'model':<10} {model:8.3f}s {model - python:8.3f}s after the interpreter, "
+          f"{(model - python)/max(params - python, 1e-6):.0f}x the configuration alone")
+
+def _report_grip_cutout_modes(results):
+    for name, modes in results.items():
+        (separate, separate_faces, separate_volume), (single, single_faces, single_volume) = modes[False], modes[True]
+        print(f"{name:<45} separate {separate:6.3f}s {separate_faces:4} faces  "
+              f"single pass {single:6.3f}s {single_faces:4} faces  {single/separate - 1:+7.1%}"
+              f"{'' if abs(single_volume - separate_volume) < 1e-3*separate_volume else '  VOLUME DIFFERS'}")
+
+def _report_thread_engines(results):
+    for name, engines in results.items():
+        (iso, iso_faces, iso_triangles, iso_step), (swept, swept_faces, swept_triangles, swept_step) = \
+            engines[False], engines[True]
+        print(f"{name:<45} IsoThread {iso:6.3f}s {iso_faces:4} faces {iso_triangles:7} triangles {iso_step:8} bytes  "
+              f"swept {swept:6.3f}s {swept_faces:4} faces {swept_triangles:7} triangles {swept_step:8} bytes  "
+              f"{swept/iso - 1:+7.1%}")
+
+if __name__ == "__main__":
+    main()
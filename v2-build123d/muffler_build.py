@@ -0,0 +1,426 @@
+'''Build driver for the v2 muffler variants.
+
+Each variant is built and exported (STL and STEP) as an independent job on a
+process pool, so regenerating the whole catalog uses every core instead of one.
+Variants that are unchanged since an earlier build are copied from the cache.
+Results are streamed: a part is released as soon as its files are written, so
+the memory of a build does not grow with the number of variants.
+'''
+import argparse
+import fnmatch
+import gc
+import importlib.util
+import inspect
+import os
+import time
+import types
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+
+from muffler_cache import ArtifactCache, variant_key
+from muffler_deps import ModelDependencies, override_constants
+from muffler_memo import MemoStats, memo_stats
+from muffler_params import MODEL_PATH
+from muffler_quality import (DEFAULT_PROFILE, QUALITY_PROFILES, IndexedStats, StlStats, export_indexed, export_stl,
+                             stl_stats)
+from muffler_trace import instrument, peak_rss, span, stage_totals, tracing, write_chrome_trace
+
+FILE_PREFIX = "v2-"
+'''Prefix of all exported file names'''
+
+MESH_FORMATS = (".stl", ".3mf", ".ply")
+'''The exported formats made from the tessellation, all but STEP'''
+
+INDEXED_FORMATS = (".3mf", ".ply")
+'''The mesh formats storing every vertex once, see muffler_mesh.INDEXED_WRITERS'''
+
+MAX_MODELS = 4
+'''Number of models with different constants kept loaded per process, besides the default one'''
+
+_model = None
+_custom_models: dict[tuple, types.ModuleType] = {}
+
+def load_model(constants: dict = None):
+    '''Load the parametric source file as a module, once per process.
+
+    With constants, e.g. {"CONNECTOR_MALE_OUTER_DIAMETER": 23.0}, a separate
+    module is loaded with these values replaced. Raises KeyError for unknown constants.
+    '''
+    global _model
+    if constants:
+        key = tuple(sorted(constants.items()))
+        if key in _custom_models:
+            _custom_models[key] = _custom_models.pop(key) # Most recently used
+        else:
+            model = types.ModuleType("muffler_v2")
+            model.__file__ = str(MODEL_PATH)
+            code = compile(override_constants(MODEL_PATH.read_text(), constants), str(MODEL_PATH), "exec")
+            exec(code, model.__dict__)
+            _custom_models[key] = model
+            if len(_custom_models) > MAX_MODELS:
+                del _custom_models[next(iter(_custom_models))]
+        return _custom_models[key]
+    if _model is None:
+        spec = importlib.util.spec_from_file_location("muffler_v2", MODEL_PATH)
+        _model = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(_model)
+    return _model
+
+def reload_model():
+    '''Forget the loaded modules, so load_model loads the source file again after it was edited'''
+    global _model
+    _model = None
+    _custom_models.clear()
+
+def build_timestamp():
+    '''The timestamp written in every STEP header of one build.
+
+    Uses SOURCE_DATE_EPOCH when set, so repeated builds are byte-for-byte identical.
+    '''
+    epoch = os.environ.get("SOURCE_DATE_EPOCH")
+    now = datetime.fromtimestamp(int(epoch), timezone.utc) if epoch else datetime.now(timezone.utc)
+    return now.strftime("%Y-%m-%dT%H:%M:%S")
+
+@dataclass
+class BuildResult:
+    name: str
+    '''Name of the variant'''
+    seconds: float
+    '''Wall time of building and exporting the variant'''
+    files: list[str]
+    '''Paths of the exported files'''
+    cached: bool = False
+    '''Whether the files were copied from the cache instead of built'''
+    memo: dict[str, MemoStats] = field(default_factory=dict)
+    '''Use of the memoized sub-geometry while building, by function'''
+    stl: StlStats = None
+    '''Triangles, size and export time of the STL file'''
+    indexed: dict[str, IndexedStats] = field(default_factory=dict)
+    '''Vertices, size and export time of the indexed mesh files, by suffix'''
+    peak_rss: int = None
+    '''Peak resident memory of the building process so far, in bytes (None if unknown)'''
+    trace: list[dict] = field(default_factory=list)
+    '''Chrome trace events of the build stages, when tracing'''
+
+def select_variants(patterns, names):
+    '''The names matching any of the glob patterns, in registry order.
+
+    Patterns may include the file prefix and suffix, e.g. "v2-end-cap-*.stl".
+    Raises KeyError for a pattern without any match.
+    '''
+    selected = set()
+    for pattern in patterns:
+        pattern = pattern.removeprefix(FILE_PREFIX).removesuffix(".stl").removesuffix(".step")
+        matches = fnmatch.filter(names, pattern)
+        if not matches:
+            raise KeyError(pattern)
+        selected.update(matches)
+    return [name for name in names if name in selected]
+
+@dataclass(frozen=True)
+class BuildOptions:
+    formats: tuple[str, ...] = (".stl", ".step")
+    '''The exported file formats, any of MESH_FORMATS and ".step"'''
+    direct_mesh: bool = False
+    '''Mesh the STL directly with NumPy, for the parts having a '<builder>_mesh' function in the model'''
+    direct_mesh_segments: int = None
+    '''Segments per turn of the direct meshes, None for the model's default'''
+    quality: str = DEFAULT_PROFILE
+    '''Name of the STL quality profile, see muffler_quality.QUALITY_PROFILES, also of the OCCT parts of direct meshes'''
+    trace_file: str = None
+    '''Trace the build stages into this Chrome trace file, see muffler_trace'''
+    constants: tuple[tuple[str, object], ...] = ()
+    '''Overridden constants of the model, sorted by name, e.g. (("THREADING_SWEPT", True),)'''
+
+def add_build_arguments(parser: argparse.ArgumentParser):
+    '''Add the export options shared by the build commands, read back by build_options'''
+    parser.add_argument("--stl-only", action="store_true", help="export STL files only, no STEP files")
+    parser.add_argument("--3mf", dest="three_mf", action="store_true",
+                        help="also export welded, zip-compressed 3MF files")
+    parser.add_argument("--ply", action="store_true", help="also export welded binary PLY files")
+    parser.add_argument("--quality", choices=QUALITY_PROFILES, default=DEFAULT_PROFILE,
+                        help=f"STL tessellation quality profile (default: {DEFAULT_PROFILE})")
+    parser.add_argument("--direct-mesh", action="store_true",
+                        help="mesh the STL directly with NumPy for the parts supporting it "
+                             "(all but the threads and grip cutouts, meshed by OCCT with the --quality profile)")
+
+def build_options(args: argparse.Namespace, **options):
+    '''The BuildOptions of the arguments added by add_build_arguments, and of the other options given'''
+    formats = (".stl",) if args.stl_only else BuildOptions.formats
+    formats += (".3mf",)*args.three_mf + (".ply",)*args.ply
+    return BuildOptions(formats=formats, direct_mesh=args.direct_mesh, quality=args.quality, **options)
+
+def output_files(name: str, output_dir: str = ".", formats=BuildOptions.formats):
+    '''The exported files of a variant, by suffix'''
+    stem = os.path.join(output_dir, FILE_PREFIX + name)
+    return {suffix: stem + suffix for suffix in formats}
+
+def direct_mesher(name: str):
+    '''The function meshing a variant directly with NumPy, or None if its part has none'''
+    model = load_model()
+    return _mesher(model, model.VARIANTS[name])
+
+def _mesher(model, variant):
+    return getattr(model, variant.func.__name__ + "_mesh", None)
+
+def direct_mesh(name: str, segments: int = None, quality: str = DEFAULT_PROFILE, constants: dict = None):
+    '''The triangles of a variant, meshed directly with NumPy, with the constants of the model replaced'''
+    model = load_model(constants)
+    return _direct_mesh(model, model.VARIANTS[name], segments, quality)
+
+def _direct_mesh(model, variant, segments: int = None, quality: str = DEFAULT_PROFILE):
+    mesher = _mesher(model, variant)
+    arguments = {} if segments is None else {"segments": segments}
+    if _meshes_with_occt(mesher):
+        arguments["quality"] = quality
+    return mesher(*variant.args, **variant.keywords, **arguments)
+
+def _meshes_with_occt(mesher):
+    # The meshers of the parts with threads and grip cutouts mesh these with OCCT, at the STL quality profile
+    return "quality" in inspect.signature(mesher).parameters
+
+def part_key(dependencies: ModelDependencies, model, variant, options: BuildOptions = BuildOptions(),
+             constants: dict = None):
+    '''The cache key of a part, a functools.partial of a part builder of the model loaded with the constants'''
+    functions, key_options = (), {}
+    meshed = any(suffix in options.formats for suffix in MESH_FORMATS)
+    if options.direct_mesh and meshed and _mesher(model, variant):
+        functions = (_mesher(model, variant).__name__,)
+        key_options = {"direct_mesh_segments": options.direct_mesh_segments}
+        if _meshes_with_occt(_mesher(model, variant)):
+            key_options["quality"] = asdict(QUALITY_PROFILES[options.quality])
+    elif meshed:
+        key_options = {"quality": asdict(QUALITY_PROFILES[options.quality])}
+    # Only the constants the part reads, so the parts not reading an overridden constant keep their key
+    names = dependencies.names(variant.func.__name__, *functions) if constants else ()
+    constants = {name: value for name, value in (constants or {}).items() if name in names}
+    if constants:
+        key_options["constants"] = constants
+    return variant_key(dependencies, variant, functions, key_options)
+
+def variant_keys(names, options: BuildOptions = BuildOptions()):
+    '''The cache key of each named variant'''
+    model = load_model(dict(options.constants))
+    dependencies = ModelDependencies(MODEL_PATH.read_text())
+    return {name: part_key(dependencies, model, model.VARIANTS[name], options, dict(options.constants))
+            for name in names}
+
+def build_variant(name: str, output_dir: str = ".", timestamp: str = None,
+                  cache: ArtifactCache = None, key: str = None, options: BuildOptions = BuildOptions()):
+    '''Build one variant and export it into output_dir, storing the files in the cache'''
+    if cache is not None and key is None:
+        key = variant_keys([name], options)[name]
+    model = load_model(dict(options.constants))
+    return build_part(name, model, model.VARIANTS[name], output_files(name, output_dir, options.formats),
+                      timestamp, cache, key, options)
+
+def build_part(name: str, model, variant, files: dict[str, str], timestamp: str = None,
+               cache: ArtifactCache = None, key: str = None, options: BuildOptions = BuildOptions()):
+    '''Build a part, a functools.partial of a part builder of the model, and export it into the files by suffix.
+
+    The files are stored in the cache under the key.
+    '''
+    if options.trace_file is None:
+        return _build_part(name, model, variant, files, timestamp, cache, key, options)
+    instrument(model)
+    with tracing() as events:
+        with span(variant.func.__name__, variant=name):
+            result = _build_part(name, model, variant, files, timestamp, cache, key, options)
+    result.trace = events
+    return result
+
+def _build_part(name: str, model, variant, files: dict[str, str], timestamp: str, cache: ArtifactCache, key: str,
+                options: BuildOptions):
+    from build123d import export_step
+    from muffler_mesh import read_stl, write_binary_stl
+    memo_before = memo_stats()
+    start = time.perf_counter()
+    indexed_files = {suffix: file for suffix, file in files.items() if suffix in INDEXED_FORMATS}
+    meshed = ".stl" in files or bool(indexed_files)
+    mesh_directly = meshed and options.direct_mesh and _mesher(model, variant) is not None
+    stl = None
+    indexed = {}
+    if mesh_directly:
+        mesh_start = time.perf_counter()
+        with span("direct mesh") as counts:
+            triangles = _direct_mesh(model, variant, options.direct_mesh_segments, options.quality)
+            counts["triangles"] = len(triangles)
+        if ".stl" in files:
+            with span("write stl"):
+                write_binary_stl(triangles, files[".stl"])
+            stl = stl_stats(files[".stl"], time.perf_counter() - mesh_start)
+        indexed = export_indexed(triangles, indexed_files)
+    if ".step" in files or (meshed and not mesh_directly):
+        part = variant()
+        if meshed and not mesh_directly:
+            # The indexed meshes are welded from the STL tessellation, written to a scratch file if not exported
+            stl_file = files.get(".stl") or files[next(iter(indexed_files))] + ".stl"
+            exported = export_stl(part, stl_file, variant.func.__name__, QUALITY_PROFILES[options.quality])
+            if indexed_files:
+                indexed = export_indexed(read_stl(stl_file), indexed_files)
+            if ".stl" in files:
+                stl = exported
+            else:
+                os.remove(stl_file)
+        if ".step" in files:
+            with span("write step"):
+                export_step(part, files[".step"], timestamp=timestamp or build_timestamp())
+        # Release the part before the next one is built
+        del part
+        gc.collect()
+    if cache is not None and key is not None:
+        with span("cache store"):
+            cache.store(key, files)
+    memo = {function: stats - memo_before.get(function, MemoStats())
+            for function, stats in memo_stats().items()}
+    return BuildResult(name, time.perf_counter() - start, list(files.values()), memo=memo, stl=stl, indexed=indexed,
+                       peak_rss=peak_rss())
+
+def check_direct_mesh(name: str, options: BuildOptions = BuildOptions()):
+    '''The volume of a variant's direct NumPy mesh and of its OCCT solid, and the open edges of the mesh.
+
+    The mesh has the segments and quality of the options, and both are built with their constants.
+    '''
+    from muffler_mesh import mesh_volume, open_edges, weld
+    constants = dict(options.constants)
+    triangles = direct_mesh(name, options.direct_mesh_segments, options.quality, constants)
+    return mesh_volume(triangles), load_model(constants).VARIANTS[name]().volume, open_edges(weld(triangles)[1])
+
+@dataclass
+class ThreadCheck:
+    iso_volume: float
+    '''Volume of the middle turn of the IsoThread thread'''
+    swept_volume: float
+    '''Volume of the middle turn of the swept thread'''
+    iso_extent: tuple[float, float]
+    '''Smallest and largest radius of the IsoThread thread'''
+    swept_extent: tuple[float, float]
+    '''Smallest and largest radius of the swept thread'''
+    clearance: float = None
+    '''Smallest gap of a swept end cap thread screwed into the swept body thread, None for the body threads'''
+
+def check_threads(constants: dict = None):
+    '''Compare the swept threads of the model (THREADING_SWEPT) with its IsoThread threads, by thread name.
+
+    Both should have the same profile, so the same middle turn volume and radial
+    extent, and every swept end cap thread should fit into the swept body thread.
+    Both models are loaded with the other constants replaced.
+    '''
+    from muffler_thread import mating_clearance, middle_turn_volume, radial_extent
+    constants = {name: value for name, value in (constants or {}).items() if name != "THREADING_SWEPT"}
+    iso, swept = load_model(constants), load_model(dict(constants, THREADING_SWEPT=True))
+    length, pitch = iso.END_CAP_INSERT_LENGTH, iso.THREADING_PITCH
+    checks = {}
+    for size in iso.MufflerORingInnerDiameter:
+        # As in body_male and the end caps
+        major_diameter = 2*(size/2 + iso.MUFFLER_O_RING_SHIFT)
+        body = swept.threading_body(major_diameter)
+        threads = {f"body-{size.name.lower()}": (lambda model: model.threading_body(major_diameter), None)}
+        for extra_spacing in (False, True):
+            name = f"end-cap-{size.name.lower()}{'-extra-spacing' if extra_spacing else ''}"
+            threads[name] = (lambda model, extra_spacing=extra_spacing:
+                             model.threading_end_cap(major_diameter, extra_spacing), body)
+        for name, (thread, internal) in threads.items():
+            iso_thread, swept_thread = thread(iso), thread(swept)
+            checks[name] = ThreadCheck(middle_turn_volume(iso_thread, length, pitch),
+                                       middle_turn_volume(swept_thread, length, pitch),
+                                       radial_extent(iso_thread, length), radial_extent(swept_thread, length),
+                                       None if internal is None else mating_clearance(internal, swept_thread, pitch))
+    return checks
+
+def stream_variants(names, output_dir: str = ".", workers: int = None, use_cache: bool = True,
+                    options: BuildOptions = BuildOptions()):
+    '''Build and export all the named variants, yielding each result as soon as its files are written.
+
+    Jobs run on a process pool with one process per core by default, workers=1
+    builds serially in this process. Both produce identical files. Variants
+    found in the cache are copied instead of built, unless tracing. Only the
+    results are kept, every part is released after its export.
+    '''
+    names = list(names)
+    output_dir = os.path.abspath(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    timestamp = build_timestamp()
+    cache = ArtifactCache() if use_cache else None
+    keys = variant_keys(names, options) if use_cache else {}
+    pending = []
+    for name in names:
+        copy_start = time.perf_counter()
+        files = output_files(name, output_dir, options.formats)
+        if cache is not None and options.trace_file is None and cache.fetch(keys[name], files):
+            stl = stl_stats(files[".stl"]) if ".stl" in files else None
+            yield BuildResult(name, time.perf_counter() - copy_start, list(files.values()), cached=True, stl=stl,
+                              indexed=cached_indexed_stats(files))
+        else:
+            pending.append(name)
+    workers = min(workers or os.cpu_count() or 1, len(pending) or 1)
+    if workers == 1:
+        for name in pending:
+            yield build_variant(name, output_dir, timestamp, cache, keys.get(name), options)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            jobs = [pool.submit(build_variant, name, output_dir, timestamp, cache, keys.get(name), options)
+                    for name in pending]
+            for job in as_completed(jobs):
+                yield job.result()
+
+def build_variants(names, output_dir: str = ".", workers: int = None, use_cache: bool = True,
+                   options: BuildOptions = BuildOptions()):
+    '''Build and export all the named variants, reporting each one as it is done (see stream_variants)'''
+    start = time.perf_counter()
+    results = [report_result(result) for result in stream_variants(names, output_dir, workers, use_cache, options)]
+    report_summary(results, time.perf_counter() - start, workers, options)
+    return results
+
+def report_summary(results, seconds: float, workers: int = None, options: BuildOptions = BuildOptions()):
+    '''Print the totals of a build, its peak memory and memo use, and write its trace'''
+    built = [result for result in results if not result.cached]
+    workers = min(workers or os.cpu_count() or 1, len(built) or 1)
+    print(f"Built {len(built)} and copied {len(results) - len(built)} cached variants "
+          f"in {seconds:.2f}s "
+          f"({sum(result.seconds for result in results):.2f}s of job time, {workers} workers)")
+    stl_bytes = sum(result.stl.bytes for result in results if result.stl)
+    for suffix in INDEXED_FORMATS:
+        sizes = [result.indexed[suffix].bytes for result in results if suffix in result.indexed]
+        if sizes and stl_bytes:
+            print(f"{suffix[1:].upper()} files {sum(sizes)/1e6:.1f} MB, {sum(sizes)/stl_bytes - 1:+.0%} "
+                  f"of the {stl_bytes/1e6:.1f} MB of STL files")
+    peaks = [result.peak_rss for result in built if result.peak_rss is not None]
+    if peaks:
+        print(f"Peak memory {max(peaks)/2**20:.0f} MB per build process")
+    _report_memo(results)
+    if options.trace_file is not None:
+        events = [event for result in results for event in result.trace]
+        write_chrome_trace(events, options.trace_file)
+        _report_trace(events, options.trace_file)
+
+def cached_indexed_stats(files: dict[str, str]):
+    '''The statistics of the indexed mesh files copied from the cache, by suffix'''
+    return {suffix: IndexedStats(None, os.path.getsize(file), 0.0) for suffix, file in files.items()
+            if suffix in INDEXED_FORMATS}
+
+def report_result(result: BuildResult):
+    stl = (f" {result.stl.triangles:8} triangles {result.stl.bytes/1e6:7.2f} MB {result.stl.seconds:6.2f}s STL"
+           if result.stl else "")
+    # The size of the indexed meshes relative to the STL file
+    indexed = "".join(f" {stats.bytes/1e6:6.2f} MB{f' {stats.bytes/result.stl.bytes - 1:+4.0%}' if result.stl else ''}"
+                      f" {stats.seconds:5.2f}s {suffix[1:].upper()}" for suffix, stats in result.indexed.items())
+    rss = f" {result.peak_rss/2**20:6.0f} MB peak RSS" if result.peak_rss is not None else ""
+    print(f"{result.name:<45} {result.seconds:7.2f}s{stl}{indexed}{rss}{' (cached)' if result.cached else ''}")
+    return result
+
+def _report_memo(results):
+    total = {}
+    for result in results:
+        for function, stats in result.memo.items():
+            total[function] = total.get(function, MemoStats()) + stats
+    for function, stats in sorted(total.items()):
+        if stats.hits or stats.misses:
+            print(f"Memo {function:<40} {stats.hits:4} hits {stats.misses:4} misses "
+                  f"{stats.build_seconds:7.2f}s built {stats.saved_seconds:7.2f}s saved")
+
+def _report_trace(events, trace_file: str):
+    for stage, (count, seconds, growth) in stage_totals(events).items():
+        print(f"Stage {stage:<39} {count:4} spans {seconds:7.2f}s total {growth:7.1f} MB peak RSS growth")
+    print(f"Trace written to {trace_file}")
@@ -0,0 +1,160 @@
+'''Persistent, content-addressed cache of exported part files.
+
+Every variant is keyed by a hash of its builder, arguments and the source of
+all constants and functions the builder reads, so a rerun only rebuilds the
+parts that are actually affected by a change. The source of the helper modules
+the builder imports (muffler_thread, muffler_lathe, ...) and of the modules
+exporting the files is part of the key as well.
+'''
+import ast
+import functools
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+
+from muffler_deps import ModelDependencies, imported_modules
+
+CACHE_FORMAT = 1
+'''Increase to invalidate all cached files, e.g. when the export settings change'''
+
+DEFAULT_CACHE_DIR = Path(os.environ.get("MUFFLER_CACHE_DIR",
+                                        Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+                                        / "silent-night-muffler"))
+'''Location of the cache, override with the environment variable MUFFLER_CACHE_DIR'''
+
+DEFAULT_MAX_BYTES = 1024**3
+'''Size of the cache, least recently used files are evicted above this'''
+
+EXPORT_MODULES = ("muffler_quality", "muffler_mesh")
+'''The helper modules writing the files of every part, in every key'''
+
+_LIBRARIES = ("build123d", "bd_warehouse", "cadquery-ocp", "cadquery-ocp-novtk")
+
+def library_versions():
+    '''Installed versions of the CAD libraries, by package name'''
+    versions = {}
+    for library in _LIBRARIES:
+        try:
+            versions[library] = version(library)
+        except PackageNotFoundError:
+            pass
+    return versions
+
+@functools.cache
+def _module_source(module: str):
+    # Read once per process, so a long running process keys its files by the helper modules it runs
+    source = Path(__file__).with_name(module + ".py").read_text()
+    local = sorted(name for name in imported_modules(ast.parse(source)) if is_local_module(name))
+    return hashlib.sha256(source.encode()).hexdigest(), local
+
+def is_local_module(module: str):
+    '''Whether a module is one of the helper modules next to this one, e.g. "muffler_mesh"'''
+    return Path(__file__).with_name(module + ".py").is_file()
+
+def module_sources(modules):
+    '''SHA-256 of the source of every local module, and of the local modules they import in turn, by name'''
+    digests = {}
+    pending = [module for module in modules if is_local_module(module)]
+    while pending:
+        module = pending.pop()
+        if module not in digests:
+            digests[module], imports = _module_source(module)
+            pending.extend(imports)
+    return dict(sorted(digests.items()))
+
+def variant_key(dependencies: ModelDependencies, variant, functions=(), options: dict = None):
+    '''Cache key of a variant, a functools.partial of a part builder.
+
+    Other model functions used for the output, and options affecting it, are
+    included in the key as well.
+    '''
+    content = {
+        "format": CACHE_FORMAT,
+        "libraries": library_versions(),
+        "builder": variant.func.__name__,
+        "args": [repr(arg) for arg in variant.args],
+        "keywords": {keyword: repr(value) for keyword, value in sorted(variant.keywords.items())},
+        "sources": dependencies.sources(variant.func.__name__, *functions),
+        "modules": module_sources(EXPORT_MODULES + tuple(dependencies.modules(variant.func.__name__, *functions))),
+        "options": options or {},
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+class ArtifactCache:
+    '''Directory of cache entries, one subdirectory per key holding the exported files'''
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+
+    def fetch(self, key: str, destinations: dict[str, str]):
+        '''Copy the cached files, by suffix, to their destinations. Returns False on a cache miss.'''
+        entry = self.directory / key
+        sources = {suffix: entry / ("part" + suffix) for suffix in destinations}
+        if not all(source.is_file() for source in sources.values()):
+            return False
+        staged = {}
+        try:
+            for suffix, destination in destinations.items():
+                # Copy next to the destination first, so an eviction meanwhile overwrites none of the destinations
+                handle, staged[destination] = tempfile.mkstemp(prefix=".staging-",
+                                                               dir=os.path.dirname(destination) or ".")
+                os.close(handle)
+                shutil.copyfile(sources[suffix], staged[destination])
+            # Mark as recently used
+            now = time.time()
+            os.utime(entry, (now, now))
+        except FileNotFoundError: # Evicted concurrently
+            for staging in staged.values():
+                os.remove(staging)
+            return False
+        for destination, staging in staged.items():
+            os.replace(staging, destination)
+        return True
+
+    def read(self, key: str, suffix: str):
+        '''The content of a cached file, or None on a cache miss'''
+        entry = self.directory / key
+        try:
+            content = (entry / ("part" + suffix)).read_bytes()
+            # Mark as recently used
+            now = time.time()
+            os.utime(entry, (now, now))
+        except FileNotFoundError: # Not cached, or evicted concurrently
+            return None
+        return content
+
+    def store(self, key: str, files: dict[str, str]):
+        '''Add the exported files, by suffix, to the cache and evict old entries if it is full'''
+        entry = self.directory / key
+        entry.mkdir(parents=True, exist_ok=True)
+        for suffix, file in files.items():
+            # Copy to a temporary file first, so other jobs never fetch a partial file
+            handle, staging = tempfile.mkstemp(prefix=".staging-", dir=entry)
+            os.close(handle)
+            shutil.copyfile(file, staging)
+            os.replace(staging, entry / ("part" + suffix))
+        self.evict()
+
+    def evict(self):
+        '''Remove the least recently used entries until the cache fits in max_bytes'''
+        entries = []
+        for entry in self.directory.iterdir():
+            if entry.name.startswith("."):
+                continue
+            try:
+                size = sum(file.stat().st_size for file in entry.iterdir() if not file.name.startswith("."))
+                entries.append((entry.stat().st_mtime, size, entry))
+            except FileNotFoundError:
+                pass # Evicted concurrently
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
@@ -0,0 +1,116 @@
+'''Command line entry point, building only the requested variants.
+
+Examples:
+    python muffler_cli.py --list
+    python muffler_cli.py --constants
+    python muffler_cli.py "end-cap-*" --swept-threads
+    python muffler_cli.py "inner-mesh-tube-*" --stl-only --3mf
+    python muffler_cli.py body-male-large-100 "end-cap-female-medium-*"
+'''
+import argparse
+import sys
+
+from muffler_build import (BuildOptions, add_build_arguments, build_options, build_variants, check_direct_mesh,
+                           check_threads, direct_mesher, select_variants)
+from muffler_params import load_params, parse_value
+
+DIRECT_MESH_VOLUME_TOLERANCE = 0.01
+'''Largest relative volume difference between a direct NumPy mesh and its OCCT solid'''
+
+THREAD_VOLUME_TOLERANCE = 0.001
+'''Largest relative difference between the middle turn volumes of a swept thread and its IsoThread thread'''
+
+THREAD_RADIUS_TOLERANCE = 0.02
+'''Largest difference in mm between the radial extents of a swept thread and its IsoThread thread'''
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and export The Silent Night CPAP muffler parts.")
+    parser.add_argument("variants", nargs="*", metavar="VARIANT",
+                        help="names or glob patterns of the variants to build (default: all)")
+    parser.add_argument("--list", action="store_true",
+                        help="list the matching variants instead of building them")
+    parser.add_argument("--constants", action="store_true",
+                        help="print the constants and calculated dimensions of the model instead of building")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of parallel build processes (default: one per core)")
+    parser.add_argument("-o", "--output-dir", default=".",
+                        help="directory of the exported files (default: current directory)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="rebuild all variants instead of copying unchanged ones from the cache")
+    add_build_arguments(parser)
+    parser.add_argument("--direct-mesh-segments", type=int, default=None,
+                        help="segments per turn of the direct meshes (default: set in the model)")
+    parser.add_argument("--trace", metavar="FILE", default=None,
+                        help="trace the build stages of every variant into a Chrome trace file "
+                             "(view in chrome://tracing or ui.perfetto.dev), rebuilding cached variants")
+    parser.add_argument("--check-direct-mesh", action="store_true",
+                        help="compare the volume of the direct meshes with the OCCT solids instead of building")
+    parser.add_argument("--swept-threads", action="store_true",
+                        help="sweep the threads along a helix instead of using IsoThread (THREADING_SWEPT)")
+    parser.add_argument("--check-threads", action="store_true",
+                        help="compare the swept threads with the IsoThread threads, and check that they fit, "
+                             "instead of building")
+    parser.add_argument("-D", "--constant", action="append", default=[], metavar="NAME=VALUE",
+                        help="build or check with another value of a constant of the model, e.g. TOLERANCE=0.25")
+    args = parser.parse_args(argv)
+
+    # Listing and selecting the variants does not need the CAD stack, only building them does
+    params = load_params()
+    if args.constants:
+        print("\n".join(f"{name} = {value!r}" if isinstance(value, bool) else f"{name} = {value:g}"
+                         for name, value in params.VALUES.items()))
+        return
+    names = list(params.VARIANTS)
+    try:
+        names = select_variants(args.variants, names) if args.variants else names
+    except KeyError as error:
+        parser.error(f"no variant matches {error}")
+    if args.list:
+        print("\n".join(names))
+        return
+    constants = {"THREADING_SWEPT": True} if args.swept_threads else {}
+    for text in args.constant:
+        name, separator, value = text.partition("=")
+        if not separator or name not in params.VALUES or not name.isupper():
+            parser.error(f"invalid constant {text!r}, use NAME=VALUE with a constant of the model")
+        try:
+            constants[name] = parse_value(value)
+        except ValueError:
+            parser.error(f"invalid value of {name}: {value!r}")
+    options = build_options(args,
+                            direct_mesh_segments=args.direct_mesh_segments,
+                            trace_file=args.trace,
+                            constants=tuple(sorted(constants.items())))
+    if args.check_threads:
+        sys.exit(_check_threads(constants))
+    if args.check_direct_mesh:
+        sys.exit(_check_direct_mesh([name for name in names if direct_mesher(name)], options))
+    build_variants(names, args.output_dir, args.jobs, use_cache=not args.no_cache, options=options)
+
+def _check_direct_mesh(names, options: BuildOptions):
+    failed = 0
+    for name in names:
+        mesh_volume, solid_volume, open_edges = check_direct_mesh(name, options)
+        difference = abs(mesh_volume - solid_volume)/solid_volume
+        ok = difference <= DIRECT_MESH_VOLUME_TOLERANCE
+        failed += not ok
+        print(f"{name:<45} mesh {mesh_volume:10.1f} solid {solid_volume:10.1f} mm3 "
+              f"{difference:7.3%} {open_edges:4} open edges {'ok' if ok else 'FAILED'}")
+    return 1 if failed else 0
+
+def _check_threads(constants: dict):
+    failed = 0
+    for name, check in check_threads(constants).items():
+        difference = check.swept_volume/check.iso_volume - 1
+        radius_difference = max(abs(swept - iso) for swept, iso in zip(check.swept_extent, check.iso_extent))
+        ok = (abs(difference) <= THREAD_VOLUME_TOLERANCE and radius_difference <= THREAD_RADIUS_TOLERANCE
+              and (check.clearance is None or check.clearance > 0))
+        failed += not ok
+        clearance = "" if check.clearance is None else f" clearance {check.clearance:5.3f} mm"
+        print(f"{name:<30} middle turn {check.iso_volume:7.2f} swept {check.swept_volume:7.2f} mm3 {difference:+7.3%} "
+              f"radius {check.iso_extent[0]:6.3f}-{check.iso_extent[1]:6.3f} "
+              f"swept {check.swept_extent[0]:6.3f}-{check.swept_extent[1]:6.3f}{clearance} {'ok' if ok else 'FAILED'}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    main()
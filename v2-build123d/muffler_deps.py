@@ -0,0 +1,114 @@
+'''Static dependency analysis of the parametric source file.
+
+Finds the top-level constants, calculations and functions that a part builder
+actually reads, so a change to one constant only affects the parts using it,
+and the modules it imports, e.g. the thread engine of muffler_thread.
+'''
+import ast
+
+class _NameCollector(ast.NodeVisitor):
+    '''Collect all names loaded in a statement, ignoring type annotations'''
+
+    def __init__(self):
+        self.names = set()
+
+    def visit_Name(self, node: ast.Name):
+        if isinstance(node.ctx, ast.Load):
+            self.names.add(node.id)
+
+    def visit_arg(self, node: ast.arg):
+        pass # Annotation only
+
+    def visit_FunctionDef(self, node: ast.FunctionDef):
+        for default in node.args.defaults + node.args.kw_defaults:
+            if default is not None:
+                self.visit(default)
+        for statement in node.body:
+            self.visit(statement)
+
+    def visit_AnnAssign(self, node: ast.AnnAssign):
+        if node.value is not None:
+            self.visit(node.value)
+
+class ModelDependencies:
+    '''Index of the top-level definitions in a source file'''
+
+    def __init__(self, source: str):
+        self.definitions: dict[str, list[ast.stmt]] = {}
+        for statement in ast.parse(source).body:
+            for name in _defined_names(statement):
+                self.definitions.setdefault(name, []).append(statement)
+
+    def names(self, *roots: str):
+        '''All top-level names reachable from the roots, including the roots'''
+        seen = set()
+        pending = [root for root in roots if root in self.definitions]
+        while pending:
+            name = pending.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            for statement in self.definitions[name]:
+                collector = _NameCollector()
+                collector.visit(statement)
+                pending.extend(collector.names & self.definitions.keys())
+        return seen
+
+    def sources(self, *roots: str):
+        '''Normalized source of every definition reachable from the roots, by name'''
+        return {name: "\n".join(ast.unparse(statement) for statement in self.definitions[name])
+                for name in sorted(self.names(*roots))}
+
+    def modules(self, *roots: str):
+        '''The modules imported by the definitions reachable from the roots, e.g. "muffler_thread"'''
+        return sorted({module for name in self.names(*roots) for statement in self.definitions[name]
+                       for module in imported_modules(statement)})
+
+def imported_modules(node: ast.AST):
+    '''The modules imported anywhere in a statement or module, relative imports left out'''
+    modules = set()
+    for child in ast.walk(node):
+        if isinstance(child, ast.Import):
+            modules.update(alias.name for alias in child.names)
+        elif isinstance(child, ast.ImportFrom) and child.module and not child.level:
+            modules.add(child.module)
+    return modules
+
+def constant_names(source: str):
+    '''The names of the top-level constants of a source file, in order.
+
+    Constants are upper case names assigned a literal value or expression, e.g. 'GRIP_CUTOUT_RATIO = 1/18'.
+    '''
+    return [statement.targets[0].id for statement in ast.parse(source).body
+            if isinstance(statement, ast.Assign) and len(statement.targets) == 1
+            and isinstance(statement.targets[0], ast.Name) and statement.targets[0].id.isupper()
+            and not any(isinstance(node, ast.Name) for node in ast.walk(statement.value))]
+
+def override_constants(source: str, constants: dict):
+    '''The parsed source file, with the values of some top-level constants replaced.
+
+    Calculations using the constants are left as they are, so they use the new
+    values. Raises KeyError for a name that is not a constant of the source.
+    '''
+    tree = ast.parse(source)
+    unknown = set(constants) - set(constant_names(source))
+    if unknown:
+        raise KeyError(", ".join(sorted(unknown)))
+    for statement in tree.body:
+        if isinstance(statement, ast.Assign) and isinstance(statement.targets[0], ast.Name) \
+                and statement.targets[0].id in constants:
+            statement.value = ast.copy_location(ast.Constant(constants[statement.targets[0].id]), statement.value)
+    return tree
+
+def _defined_names(statement: ast.stmt):
+    if isinstance(statement, (ast.FunctionDef, ast.ClassDef)):
+        return [statement.name]
+    if isinstance(statement, ast.Assign):
+        return [name.id for target in statement.targets for name in ast.walk(target)
+                if isinstance(name, ast.Name)]
+    if isinstance(statement, (ast.AugAssign, ast.AnnAssign)) and isinstance(statement.target, ast.Name):
+        return [statement.target.id]
+    if isinstance(statement, (ast.Import, ast.ImportFrom)):
+        # 'import muffler_mesh' defines muffler_mesh, 'from muffler_thread import swept_iso_thread' swept_iso_thread
+        return [alias.asname or alias.name.split(".")[0] for alias in statement.names if alias.name != "*"]
+    return []
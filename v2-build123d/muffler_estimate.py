@@ -0,0 +1,363 @@
+'''Analytic volume, filament mass and print time of the parts, without building them.
+
+The volume of a revolved part is 2*pi times the first moment of its 2D profile
+about the axis (Pappus's theorem). The profiles are composed here of exact
+pieces (rectangles, fillet corners, half ellipses, triangles, circle caps),
+evaluated with NumPy from the values of muffler_validate, so the whole variant
+matrix takes milliseconds. Corrections are analytic as well: the grip cutouts
+are lens-shaped prisms, the ISO threads are helical loops of their tooth
+profile (as bd_warehouse builds them) and the mesh strands and corkscrew are
+helical sweeps of a horizontal profile, whose volume is its area times the height.
+
+Like the OCCT volume of the parts, the solids of a compound are summed, the
+mesh strands overlapping where they cross. Use --check to compare with the
+OCCT volume of the built parts.
+
+Examples:
+    python muffler_estimate.py
+    python muffler_estimate.py "body-male-large-*" --material petg
+    python muffler_estimate.py --check
+'''
+import argparse
+import sys
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from muffler_build import MODEL_PATH, select_variants
+from muffler_params import load_params
+from muffler_thread import FADE_SCALE, FADE_TURNS
+from muffler_validate import default_points, dimensions, model_values
+
+@dataclass(frozen=True)
+class Filament:
+    density: float
+    '''Density of the printed material, in g/cm3'''
+    flow_rate: float
+    '''Average volume extruded per second while printing, in mm3/s'''
+    layer_height: float
+    '''Layer height, in mm'''
+    layer_seconds: float
+    '''Time per layer spent on travel, retraction and the layer change'''
+
+MATERIALS = {
+    "pla": Filament(1.24, 8.0, 0.2, 2.0),
+    "petg": Filament(1.27, 6.0, 0.2, 2.5),
+    "tpu": Filament(1.21, 2.5, 0.2, 3.0),
+}
+'''Print settings of the common materials, by name'''
+
+DEFAULT_MATERIAL = "pla"
+
+BUILDER_MATERIALS = {"o_ring": "tpu"}
+'''The default material of the builders not printed in DEFAULT_MATERIAL'''
+
+CHECK_TOLERANCE = 0.001
+'''Largest relative difference between an estimated volume and the OCCT volume of the part'''
+
+# Centroid of the region cut off by a fillet of radius 1, from the corner along each side
+_FILLET_CENTROID = (10 - 3*np.pi)/(3*(4 - np.pi))
+
+# The grip cutouts are integrated over the rounded corner of the grip, by its angle
+_FILLET_NODES, _FILLET_WEIGHTS = np.polynomial.legendre.leggauss(16)
+
+@dataclass
+class Estimate:
+    volume: float
+    '''Volume of the part, in mm3'''
+    mass: float
+    '''Filament mass, in g'''
+    seconds: float
+    '''Approximate print time'''
+    material: str
+    '''Name of the material, see MATERIALS'''
+
+def _rectangle(x0, x1, y0, y1):
+    area = (x1 - x0)*(y1 - y0)
+    return area, (y1 - y0)*(x1**2 - x0**2)/2
+
+def _fillet(x, radius):
+    # The corner cut off by a fillet, at radius x and rounded towards the axis
+    area = (1 - np.pi/4)*radius**2
+    return area, area*(x - _FILLET_CENTROID*radius)
+
+def _half_ellipse(center, a, b):
+    area = np.pi*a*b/2
+    return area, area*center
+
+def _half_ellipse_cap(center, a, b, x):
+    # The part of a half ellipse (radial semi-axis a) closer to the axis than x
+    u = np.clip((center - x)/a, -1, 1)
+    segment = np.arccos(u) - u*np.sqrt(1 - u**2)
+    area = a*b*segment/2
+    with np.errstate(invalid="ignore", divide="ignore"):
+        centroid = np.where(segment > 0, center - 2*a*(1 - u**2)**1.5/(3*segment), center)
+    return area, area*centroid
+
+def _triangle(x0, x1, x2, area):
+    return area, area*(x0 + x1 + x2)/3
+
+def _taper_band(radius, x, y0, y1):
+    # The part of the triangle (0, 0), (radius, 0), (0, radius) between heights y0 and y1, farther from the axis than x
+    y1 = np.maximum(np.minimum(y1, radius - x), y0)
+    w0, w1 = radius - y0, radius - y1
+    return ((w0 - x)**2 - (w1 - x)**2)/2, (w0**3 - w1**3)/6 - x**2*(y1 - y0)/2
+
+def _sum(*pieces):
+    return sum(area for area, _ in pieces), sum(moment for _, moment in pieces)
+
+def _negative(piece):
+    return -piece[0], -piece[1]
+
+def _lens(radius, cutout_radius, distance):
+    # Area of a cutout circle inside the disc of the grip
+    r, R, d = cutout_radius, radius, distance
+    with np.errstate(invalid="ignore"):
+        area = (r**2*np.arccos(np.clip((d**2 + r**2 - R**2)/(2*d*r), -1, 1))
+                + R**2*np.arccos(np.clip((d**2 + R**2 - r**2)/(2*d*R), -1, 1))
+                - np.sqrt(np.maximum((-d + r + R)*(d + r - R)*(d - r + R)*(d + r + R), 0))/2)
+    return np.where(d >= r + R, 0.0, np.where(d + r <= R, np.pi*r**2, area))
+
+def _grip_base(v, y):
+    # end_cap_grip_base_profile, at height y
+    insert_radius = v.outer_tube_inner_radius - v.TOLERANCE - v.threading_height - v.extra_spacing
+    grip_radius = v.outer_tube_outer_radius + v.grip_cutout_radius
+    slot = (v.diameter + v.BODY_WALL_THICKNESS)/2
+    a, b = v.MUFFLER_O_RING_THICKNESS/2, v.MUFFLER_O_RING_THICKNESS/2.5
+    return _sum(_rectangle(0, grip_radius, y, y + v.END_CAP_GRIP_THICKNESS),
+                _negative(_fillet(grip_radius, v.END_CAP_CORNER_RADIUS)),
+                _rectangle(0, insert_radius, y + v.END_CAP_GRIP_THICKNESS,
+                           y + v.END_CAP_GRIP_THICKNESS + v.END_CAP_INSERT_LENGTH),
+                # The O-ring slot, where not inside the insert cavity or above the insert
+                _negative(_half_ellipse(slot, a, b)),
+                _half_ellipse_cap(slot, a, b, v.insert_inner_radius),
+                _negative(_half_ellipse_cap(slot, a, b, insert_radius)),
+                _half_ellipse_cap(slot, a, b, v.insert_inner_radius),
+                _negative(_rectangle(0, v.insert_inner_radius, y + v.END_CAP_BOTTOM_THICKNESS,
+                                     y + v.END_CAP_GRIP_THICKNESS + v.END_CAP_INSERT_LENGTH)),
+                # The slot for the inner mesh tube, below the insert cavity
+                _negative(_rectangle(0, v.inner_tube_slot_radius,
+                                     y + v.END_CAP_BOTTOM_THICKNESS - v.END_CAP_INNER_TUBE_SLOT_DEPTH,
+                                     y + v.END_CAP_BOTTOM_THICKNESS)))
+
+def _male_connector(v):
+    return _sum(_rectangle(0, v.connector_male_outer_radius, 0, v.CONNECTOR_LENGTH),
+                _negative(_fillet(v.connector_male_outer_radius, v.CONNECTOR_CORNER_RADIUS)))
+
+def _connector_hole(v):
+    # The hole through the connector, below the slot for the inner mesh tube
+    return _rectangle(0, v.connector_male_inner_radius, 0,
+                      v.CONNECTOR_LENGTH + v.END_CAP_BOTTOM_THICKNESS - v.END_CAP_INNER_TUBE_SLOT_DEPTH)
+
+def _body_male_profile(v):
+    grip_radius = v.outer_tube_outer_radius + v.grip_cutout_radius
+    top = v.CONNECTOR_LENGTH + v.length - v.END_CAP_GRIP_THICKNESS
+    floor = v.CONNECTOR_LENGTH + v.END_CAP_BOTTOM_THICKNESS
+    slot = (v.diameter + v.BODY_WALL_THICKNESS)/2
+    a, b = v.MUFFLER_O_RING_THICKNESS/2, v.MUFFLER_O_RING_THICKNESS/2.5
+    return _sum(_male_connector(v),
+                _rectangle(0, grip_radius, v.CONNECTOR_LENGTH, v.CONNECTOR_LENGTH + v.END_CAP_GRIP_THICKNESS),
+                _negative(_fillet(grip_radius, v.END_CAP_CORNER_RADIUS)),
+                _rectangle(0, v.outer_tube_outer_radius, v.CONNECTOR_LENGTH + v.END_CAP_GRIP_THICKNESS, top),
+                # The O-ring slot, where not inside the body
+                _negative(_half_ellipse(slot, a, b)),
+                _half_ellipse_cap(slot, a, b, v.outer_tube_inner_radius),
+                _negative(_rectangle(0, v.outer_tube_inner_radius, floor, top)),
+                _negative(_rectangle(0, v.inner_tube_slot_radius, floor - v.END_CAP_INNER_TUBE_SLOT_DEPTH, floor)),
+                _negative(_connector_hole(v)))
+
+def _end_cap_male_profile(v):
+    return _sum(_male_connector(v), _grip_base(v, v.CONNECTOR_LENGTH), _negative(_connector_hole(v)))
+
+def _female_o_ring_slot(v, wall_radius):
+    # The filleted triangle of female_connector_o_ring_slot_profile, where inside the connector wall
+    t = v.female_o_ring_thickness
+    base, tip, height = v.CONNECTOR_FEMALE_O_RING_INNER_DIAMETER/2, v.CONNECTOR_FEMALE_O_RING_INNER_DIAMETER/2 + 2*t, t/1.4
+    start = np.maximum(base, wall_radius)
+    length = tip - start
+    triangle = _triangle(start, start, tip, height*length**2/(2*t))
+    # The tip cut off by the fillet: a kite from the tip to the fillet center, less the sector of the fillet
+    half_angle = np.arctan(height/(2*t))
+    radius = t/2
+    center = tip - radius/np.sin(half_angle)
+    tangent = tip - radius/np.tan(half_angle)*np.cos(half_angle)
+    kite = _triangle(tip, tangent, center, radius**2/np.tan(half_angle))
+    sector_angle = np.pi/2 - half_angle
+    sector_area = radius**2*sector_angle
+    sector = sector_area, sector_area*(center + 2*radius*np.sin(sector_angle)/(3*sector_angle))
+    return _sum(triangle, _negative(kite), sector)
+
+def _end_cap_female_profile(v):
+    inside_radius = v.connector_male_outer_radius + v.TOLERANCE
+    slot_floor = v.END_CAP_BOTTOM_THICKNESS - v.END_CAP_INNER_TUBE_SLOT_DEPTH
+    # The taper, where it cuts the grip (local heights, above the connector)
+    taper = _sum(_taper_band(inside_radius, 0, 0, slot_floor),
+                 _taper_band(inside_radius, v.inner_tube_slot_radius, slot_floor, v.END_CAP_BOTTOM_THICKNESS),
+                 _taper_band(inside_radius, v.insert_inner_radius, v.END_CAP_BOTTOM_THICKNESS,
+                             v.END_CAP_GRIP_THICKNESS + v.END_CAP_INSERT_LENGTH))
+    # The hole through the connector, where the taper left any grip
+    hole = _sum(_rectangle(0, v.connector_male_inner_radius, 0, slot_floor),
+                _negative(_taper_band(inside_radius, 0, 0, slot_floor)),
+                _taper_band(inside_radius, v.connector_male_inner_radius, 0, slot_floor))
+    return _sum(_rectangle(inside_radius, inside_radius + v.CONNECTOR_FEMALE_WALL_THICKNESS, 0, v.CONNECTOR_LENGTH),
+                _negative(_fillet(inside_radius + v.CONNECTOR_FEMALE_WALL_THICKNESS, v.CONNECTOR_CORNER_RADIUS)),
+                _negative(_female_o_ring_slot(v, inside_radius)),
+                _grip_base(v, v.CONNECTOR_LENGTH),
+                _negative(taper),
+                _negative(hole))
+
+def _o_ring_profile(v):
+    radius = v.MUFFLER_O_RING_THICKNESS/2
+    # The circle with its bottom cut off 0.3 mm, for printing
+    distance = radius - 0.3
+    area = np.pi*radius**2 - (radius**2*np.arccos(distance/radius) - distance*np.sqrt(radius**2 - distance**2))
+    return area, area*(v.diameter/2 + radius)
+
+def _grip_cutouts(v):
+    # The cutouts through the grip, rounded at its bottom outer corner by END_CAP_CORNER_RADIUS
+    cutout_radius = v.grip_cutout_radius
+    grip_radius = v.outer_tube_outer_radius + cutout_radius
+    distance = np.hypot(grip_radius, cutout_radius)
+    corner = v.END_CAP_CORNER_RADIUS
+    angles = (_FILLET_NODES[:, None] + 1)*np.pi/4
+    corner_radius = grip_radius - corner + corner*np.sin(angles)
+    rounded = np.sum(_FILLET_WEIGHTS[:, None]*np.pi/4*corner*np.sin(angles)
+                     *_lens(corner_radius, cutout_radius, distance), axis=0)
+    straight = (v.END_CAP_GRIP_THICKNESS - corner)*_lens(grip_radius, cutout_radius, distance)
+    return v.END_CAP_GRIP_CUTOUT_COUNT*(rounded + straight)
+
+def _iso_thread(v, major_diameter, external: bool):
+    # IsoThread with faded ends: length/pitch - 1 helical loops of the tooth profile, and two faded quarter loops.
+    # The swept thread of muffler_thread fades the same way, but its loops fill the length from the faded ends
+    pitch = v.THREADING_PITCH
+    height = v.threading_height
+    apex_width, root_width = (pitch/8, 3*pitch/4) if external else (pitch/4, 7*pitch/8)
+    area = (apex_width + root_width)/2*height
+    root_radius = major_diameter/2 - height if external else major_diameter/2
+    centroid = height*(root_width + 2*apex_width)/(3*(root_width + apex_width))
+    direction = 1 if external else -1
+    start = root_width/2 - FADE_TURNS*pitch
+    loops = np.where(v.THREADING_SWEPT, (v.END_CAP_INSERT_LENGTH - 2*start)/pitch - 2*FADE_TURNS,
+                     v.END_CAP_INSERT_LENGTH/pitch - 1)
+    # Each faded end shrinks the profile linearly over a quarter turn, from 1 to 1/11
+    end = FADE_SCALE
+    square_mean = (1 + end + end**2)/3
+    cube_mean = (1 + end)*(1 + end**2)/4
+    fade = 2*np.pi*FADE_TURNS*area*(root_radius*square_mean + direction*centroid*cube_mean)
+    return 2*np.pi*area*(root_radius + direction*centroid)*loops + 2*fade
+
+def _body_threads(v):
+    return _iso_thread(v, 2*v.outer_tube_inner_radius, external=False)
+
+def _end_cap_threads(v):
+    return _iso_thread(v, 2*(v.outer_tube_inner_radius - v.TOLERANCE - v.extra_spacing), external=True)
+
+def _inner_mesh_tube(v):
+    radius, thickness = v.connector_male_inner_radius, v.INNER_TUBE_MESH_THICKNESS
+    rings = 2*2*np.pi*thickness**2*(radius + thickness/2)
+    strands = 2*v.INNER_TUBE_MESH_COUNT*thickness**2*v.inner_tube_length
+    corkscrew = v.include_corkscrew*2*radius*v.INNER_TUBE_CORKSCREW_THICKNESS*v.inner_tube_length
+    return rings + strands + corkscrew
+
+def _revolved(profile):
+    return lambda v: 2*np.pi*profile(v)[1]
+
+PART_VOLUMES = {
+    "body_male": lambda v: _revolved(_body_male_profile)(v) - _grip_cutouts(v) + _body_threads(v),
+    "end_cap_male": lambda v: _revolved(_end_cap_male_profile)(v) - _grip_cutouts(v) + _end_cap_threads(v),
+    "end_cap_female": lambda v: _revolved(_end_cap_female_profile)(v) - _grip_cutouts(v) + _end_cap_threads(v),
+    "inner_mesh_tube": _inner_mesh_tube,
+    "o_ring": _revolved(_o_ring_profile),
+}
+'''The volume of the parts of each builder, from the dimensions of muffler_validate'''
+
+PART_HEIGHTS = {
+    "body_male": lambda v: v.CONNECTOR_LENGTH + v.length - v.END_CAP_GRIP_THICKNESS,
+    "end_cap_male": lambda v: v.CONNECTOR_LENGTH + v.END_CAP_GRIP_THICKNESS + v.END_CAP_INSERT_LENGTH,
+    "end_cap_female": lambda v: v.CONNECTOR_LENGTH + v.END_CAP_GRIP_THICKNESS + v.END_CAP_INSERT_LENGTH,
+    "inner_mesh_tube": lambda v: v.inner_tube_length,
+    "o_ring": lambda v: v.MUFFLER_O_RING_THICKNESS - 0.3,
+}
+'''The printed height of the parts of each builder'''
+
+def part_volumes(builder: str, points: dict, source: str = None):
+    '''The volume (mm3) and height (mm) of the parts of a builder at every point, see muffler_validate.validate'''
+    v = dimensions(model_values(default_points(points, source), source))
+    return PART_VOLUMES[builder](v), PART_HEIGHTS[builder](v)
+
+def estimate(builder: str, points: dict, material: str = None, source: str = None):
+    '''The volume, filament mass and print time of the parts of a builder at every point, as arrays'''
+    material = material or BUILDER_MATERIALS.get(builder, DEFAULT_MATERIAL)
+    filament = MATERIALS[material]
+    volume, height = part_volumes(builder, points, source)
+    seconds = volume/filament.flow_rate + np.ceil(height/filament.layer_height)*filament.layer_seconds
+    return volume, volume*filament.density/1000, seconds
+
+def builder_points(names):
+    '''The named variants grouped by builder, as (builder, names, points) with the arguments of the names as points'''
+    params = load_params()
+    variants = params.VARIANTS
+    for builder in dict.fromkeys(variants[name].builder for name in names):
+        group = [name for name in names if variants[name].builder == builder]
+        arguments = [variants[name].arguments for name in group]
+        # Arguments given to only some of the variants take their default in the others
+        parameters = params.BUILDERS[builder].parameters
+        names_given = dict.fromkeys(argument for values in arguments for argument in values)
+        yield builder, group, {argument: [values.get(argument, parameters[argument].default) for values in arguments]
+                               for argument in names_given}
+
+def estimate_variants(names=None, material: str = None):
+    '''The estimate of each named variant (default: all), computed for all variants of a builder at once'''
+    source = MODEL_PATH.read_text()
+    names = list(load_params().VARIANTS) if names is None else names
+    estimates = {}
+    for builder, group, points in builder_points(names):
+        volumes, masses, seconds = estimate(builder, points, material, source)
+        for i, name in enumerate(group):
+            estimates[name] = Estimate(float(volumes[i]), float(masses[i]), float(seconds[i]),
+                                       material or BUILDER_MATERIALS.get(builder, DEFAULT_MATERIAL))
+    return {name: estimates[name] for name in names}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estimate the volume, filament and print time of the muffler parts.")
+    parser.add_argument("variants", nargs="*", metavar="VARIANT",
+                        help="names or glob patterns of the variants (default: all)")
+    parser.add_argument("--material", choices=MATERIALS, default=None,
+                        help=f"printed material (default: {DEFAULT_MATERIAL}, "
+                             f"{', '.join(f'{material} for {builder}' for builder, material in BUILDER_MATERIALS.items())})")
+    parser.add_argument("--check", action="store_true",
+                        help="compare the estimated volumes with the OCCT volume of the built parts")
+    args = parser.parse_args(argv)
+
+    names = list(load_params().VARIANTS)
+    try:
+        names = select_variants(args.variants, names) if args.variants else names
+    except KeyError as error:
+        parser.error(f"no variant matches {error}")
+    start = time.perf_counter()
+    estimates = estimate_variants(names, args.material)
+    seconds = time.perf_counter() - start
+    if args.check:
+        sys.exit(_check(estimates))
+    for name, estimate in estimates.items():
+        hours, minutes = divmod(round(estimate.seconds/60), 60)
+        print(f"{name:<45} {estimate.volume/1000:8.2f} cm3 {estimate.mass:7.1f} g {estimate.material:<5}"
+              f"{hours:3}h{minutes:02}")
+    print(f"Estimated {len(estimates)} variants in {seconds*1000:.1f} ms")
+
+def _check(estimates):
+    from muffler_build import load_model
+    model = load_model()
+    failed = 0
+    for name, estimate in estimates.items():
+        volume = model.VARIANTS[name]().volume
+        difference = estimate.volume/volume - 1
+        ok = abs(difference) <= CHECK_TOLERANCE
+        failed += not ok
+        print(f"{name:<45} estimated {estimate.volume:10.1f} built {volume:10.1f} mm3 {difference:+8.3%} "
+              f"{'ok' if ok else 'FAILED'}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+'''Regression check of fresh STL exports against the committed (golden) STL files.
+
+Both files are read with NumPy, the binary ones memory-mapped, and compared by
+volume, surface area, bounding box and a sampled Hausdorff distance: points
+sampled uniformly on each surface are measured against the other surface, and
+the largest distance is reported. The meshes need not have the same triangles,
+so a change of the tessellation or of a builder is accepted as long as the
+surface stays where it was. Unchanged files are compared triangle by
+triangle, so an unchanged catalog is checked in seconds.
+
+Examples:
+    python muffler_golden.py
+    python muffler_golden.py "end-cap-*" --quality draft
+    python muffler_golden.py --against build
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+
+from muffler_build import BuildOptions, FILE_PREFIX, build_variants, output_files, select_variants
+from muffler_mesh import mesh_volume, read_stl, triangle_areas
+from muffler_params import MODEL_PATH, load_params
+from muffler_quality import DEFAULT_PROFILE, QUALITY_PROFILES
+
+GOLDEN_DIR = MODEL_PATH.parent
+'''Folder of the committed STL files'''
+
+VOLUME_TOLERANCE = 0.002
+'''Largest relative volume difference between a fresh export and its golden file'''
+
+AREA_TOLERANCE = 0.002
+'''Largest relative surface area difference between a fresh export and its golden file'''
+
+BOUNDS_TOLERANCE = 0.01
+'''Largest difference in mm between the bounding box corners of a fresh export and its golden file'''
+
+HAUSDORFF_TOLERANCE = 0.05
+'''Largest sampled Hausdorff distance in mm between a fresh export and its golden file'''
+
+DEFAULT_SAMPLES = 20000
+'''Points sampled on each surface for the Hausdorff distance'''
+
+CELL_SCALE = 1
+'''Size of the grid cells, relative to the side of a square of the average triangle area'''
+
+FARTHEST_REACH = 5.0
+'''Distance in mm up to which the Hausdorff distance is exact, further it is measured to the nearest vertex'''
+
+@dataclass
+class MeshSummary:
+    triangles: int
+    '''Number of triangles'''
+    volume: float
+    '''Enclosed volume, in mm3'''
+    area: float
+    '''Surface area, in mm2'''
+    bounds: np.ndarray
+    '''Bounding box, as its lowest and highest corner'''
+
+def summarize(triangles):
+    '''The triangle count, volume, area and bounding box of triangles'''
+    triangles = np.asarray(triangles, dtype=float)
+    points = triangles.reshape(-1, 3)
+    return MeshSummary(len(triangles), mesh_volume(triangles), triangle_areas(triangles).sum(),
+                       np.array([points.min(axis=0), points.max(axis=0)]))
+
+def sample_surface(triangles, count: int, seed: int = 0):
+    '''Points sampled uniformly on the surface, and the index of the triangle of each point'''
+    rng = np.random.default_rng(seed)
+    areas = triangle_areas(triangles)
+    indices = rng.choice(len(triangles), count, p=areas/areas.sum())
+    # Uniform barycentric coordinates, folding the upper half of the unit square back into the triangle
+    u, v = rng.random((2, count))
+    flip = u + v > 1
+    u, v = np.where(flip, 1 - u, u), np.where(flip, 1 - v, v)
+    a, b, c = triangles[indices, 0], triangles[indices, 1], triangles[indices, 2]
+    return a + u[:, None]*(b - a) + v[:, None]*(c - a), indices
+
+def point_triangle_distance(points, triangles):
+    '''Distance of every point to the triangle of the same index'''
+    a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    normal = np.cross(b - a, c - a)
+    length = np.linalg.norm(normal, axis=1)
+    normal = np.divide(normal, length[:, None], out=np.zeros_like(normal), where=length[:, None] > 0)
+    height = np.einsum("ij,ij->i", points - a, normal)
+    # Inside when the projected point is on the inner side of all three edges
+    projected = points - height[:, None]*normal
+    inside = length > 0
+    for start, end in ((a, b), (b, c), (c, a)):
+        inside &= np.einsum("ij,ij->i", np.cross(end - start, projected - start), normal) >= 0
+    edges = np.min([_segment_distance(points, start, end) for start, end in ((a, b), (b, c), (c, a))], axis=0)
+    return np.where(inside, np.abs(height), edges)
+
+def _segment_distance(points, start, end):
+    direction = end - start
+    squared = np.einsum("ij,ij->i", direction, direction)
+    t = np.divide(np.einsum("ij,ij->i", points - start, direction), squared, out=np.zeros_like(squared),
+                  where=squared > 0)
+    return np.linalg.norm(points - (start + np.clip(t, 0, 1)[:, None]*direction), axis=1)
+
+def _cell_distance(points, triangles, reach: float):
+    # The distance of every point to the triangles whose bounding box, grown by
+    # reach, overlaps its cell of a uniform grid (inf without any). Exact for
+    # the points within reach of the surface, an upper bound for the others
+    lowest, highest = triangles.min(axis=1) - reach, triangles.max(axis=1) + reach
+    size = max(np.sqrt(triangle_areas(triangles).mean())*CELL_SCALE, reach)
+    first, last = np.floor(lowest/size).astype(np.int64), np.floor(highest/size).astype(np.int64)
+    origin, shape = first.min(axis=0), last.max(axis=0) - first.min(axis=0) + 1
+    # Every (triangle, cell) pair, the cells keyed by their index in the grid
+    extent = last - first + 1
+    counts = extent.prod(axis=1)
+    owners = np.repeat(np.arange(len(triangles)), counts)
+    local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    extent = extent[owners]
+    cells = first[owners] - origin + np.stack([local % extent[:, 0], local//extent[:, 0] % extent[:, 1],
+                                               local//(extent[:, 0]*extent[:, 1])], axis=1)
+    keys = np.ravel_multi_index(cells.T, shape)
+    order = np.argsort(keys, kind="stable")
+    keys, owners = keys[order], owners[order]
+    # The candidate triangles of every point inside the grid
+    cells = np.floor(points/size).astype(np.int64) - origin
+    inside = np.nonzero(np.all((cells >= 0) & (cells < shape), axis=1))[0]
+    point_keys = np.ravel_multi_index(cells[inside].T, shape)
+    begin, end = np.searchsorted(keys, point_keys), np.searchsorted(keys, point_keys, side="right")
+    pairs = end - begin
+    inside, begin, pairs = inside[pairs > 0], begin[pairs > 0], pairs[pairs > 0]
+    candidates = owners[np.repeat(begin - (np.cumsum(pairs) - pairs), pairs) + np.arange(pairs.sum())]
+    distances = np.full(len(points), np.inf)
+    if len(inside):
+        exact = point_triangle_distance(np.repeat(points[inside], pairs, axis=0), triangles[candidates])
+        distances[inside] = np.minimum.reduceat(exact, np.cumsum(pairs) - pairs)
+    return distances
+
+def farthest_distance(points, triangles, reach: float = HAUSDORFF_TOLERANCE):
+    '''The largest distance of the points to the surface of the triangles.
+
+    Each point is measured against the triangles near its cell of a uniform
+    grid, which is exact within reach of the surface. The points further away
+    are measured again with twice the reach, up to FARTHEST_REACH, beyond
+    which the distance to the nearest vertex is close enough.
+    '''
+    from scipy.spatial import cKDTree
+    farthest = 0.0
+    while len(points):
+        if reach > FARTHEST_REACH:
+            return max(farthest, float(cKDTree(triangles.reshape(-1, 3)).query(points)[0].max()))
+        distances = _cell_distance(points, triangles, reach)
+        near = distances <= reach
+        farthest = max(farthest, float(distances[near].max(initial=0)))
+        points, reach = points[~near], 2*reach
+    return farthest
+
+def hausdorff_distance(first, second, samples: int = DEFAULT_SAMPLES):
+    '''Sampled symmetric Hausdorff distance between the surfaces of two triangle meshes'''
+    first, second = np.asarray(first, dtype=float), np.asarray(second, dtype=float)
+    return max(farthest_distance(sample_surface(first, samples)[0], second),
+               farthest_distance(sample_surface(second, samples)[0], first))
+
+@dataclass
+class GoldenComparison:
+    golden: MeshSummary
+    '''Summary of the committed file'''
+    fresh: MeshSummary
+    '''Summary of the fresh export'''
+    hausdorff: float
+    '''Sampled Hausdorff distance between both surfaces, in mm'''
+
+    def failures(self):
+        '''What differs beyond the tolerances, e.g. ["volume +0.53%"]'''
+        volume = self.fresh.volume/self.golden.volume - 1
+        area = self.fresh.area/self.golden.area - 1
+        bounds = np.abs(self.fresh.bounds - self.golden.bounds).max()
+        return ([f"volume {volume:+.3%}"] if abs(volume) > VOLUME_TOLERANCE else []) \
+            + ([f"area {area:+.3%}"] if abs(area) > AREA_TOLERANCE else []) \
+            + ([f"bounds {bounds:.3f} mm"] if bounds > BOUNDS_TOLERANCE else []) \
+            + ([f"Hausdorff {self.hausdorff:.3f} mm"] if self.hausdorff > HAUSDORFF_TOLERANCE else [])
+
+def compare_stl(golden_file: str, fresh_file: str, samples: int = DEFAULT_SAMPLES):
+    '''Compare a fresh STL export with its golden file'''
+    golden, fresh = read_stl(golden_file), read_stl(fresh_file)
+    # An unchanged export has the very same triangles, no need to sample them
+    distance = 0.0 if np.array_equal(golden, fresh) else hausdorff_distance(golden, fresh, samples)
+    return GoldenComparison(summarize(golden), summarize(fresh), distance)
+
+def compare_exports(names, export_dir: str, golden_dir: str = GOLDEN_DIR, samples: int = DEFAULT_SAMPLES,
+                    workers: int = None):
+    '''Compare the STL exports of the named variants in export_dir with the golden files, by name.
+
+    None for the variants without a golden file. The variants are compared on
+    a process pool with one process per core by default, workers=1 compares
+    them in this process.
+    '''
+    files = {name: (output_files(name, golden_dir, (".stl",))[".stl"], output_files(name, export_dir, (".stl",))[".stl"])
+             for name in names}
+    comparisons = dict.fromkeys(names)
+    pending = [name for name, (golden, _) in files.items() if os.path.exists(golden)]
+    workers = min(workers or os.cpu_count() or 1, len(pending) or 1)
+    if workers == 1:
+        comparisons.update({name: compare_stl(*files[name], samples) for name in pending})
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            jobs = [pool.submit(compare_stl, *files[name], samples) for name in pending]
+            comparisons.update(zip(pending, (job.result() for job in jobs)))
+    return comparisons
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare fresh STL exports of the muffler with the committed files.")
+    parser.add_argument("variants", nargs="*", metavar="VARIANT",
+                        help="names or glob patterns of the variants (default: all)")
+    parser.add_argument("--against", metavar="DIR",
+                        help="compare the STL files already exported into this folder instead of building them")
+    parser.add_argument("--golden-dir", default=GOLDEN_DIR,
+                        help=f"folder of the golden STL files (default: {GOLDEN_DIR.name})")
+    parser.add_argument("--quality", choices=QUALITY_PROFILES, default=DEFAULT_PROFILE,
+                        help=f"STL tessellation quality profile of the fresh exports (default: {DEFAULT_PROFILE})")
+    parser.add_argument("--direct-mesh", action="store_true",
+                        help="mesh the fresh exports directly with NumPy where possible")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of build and comparison processes (default: one per CPU core)")
+    parser.add_argument("--no-cache", action="store_true", help="build every variant, ignoring the cache")
+    parser.add_argument("--samples", type=int, default=DEFAULT_SAMPLES,
+                        help=f"points sampled on each surface for the Hausdorff distance (default: {DEFAULT_SAMPLES})")
+    args = parser.parse_args(argv)
+
+    names = list(load_params().VARIANTS)
+    try:
+        names = select_variants(args.variants, names) if args.variants else names
+    except KeyError as error:
+        parser.error(f"no variant matches {error}")
+    if args.against is not None:
+        missing = [name for name in names if not os.path.exists(output_files(name, args.against, (".stl",))[".stl"])]
+        if missing:
+            parser.error(f"no STL file of {', '.join(missing)} in {args.against}")
+        sys.exit(_report(names, args.against, args))
+    with tempfile.TemporaryDirectory() as directory:
+        build_variants(names, directory, args.jobs, not args.no_cache,
+                       BuildOptions(formats=(".stl",), direct_mesh=args.direct_mesh, quality=args.quality))
+        sys.exit(_report(names, directory, args))
+
+def _report(names, export_dir: str, args):
+    start = time.perf_counter()
+    failed = 0
+    for name, comparison in compare_exports(names, export_dir, args.golden_dir, args.samples, args.jobs).items():
+        if comparison is None:
+            print(f"{name:<45} no golden file {FILE_PREFIX}{name}.stl")
+            continue
+        failures = comparison.failures()
+        failed += bool(failures)
+        golden, fresh = comparison.golden, comparison.fresh
+        print(f"{name:<45} {golden.triangles:7} -> {fresh.triangles:7} triangles "
+              f"volume {fresh.volume/golden.volume - 1:+7.3%} area {fresh.area/golden.area - 1:+7.3%} "
+              f"Hausdorff {comparison.hausdorff:6.3f} mm {', '.join(failures) or 'ok'}")
+    print(f"Compared {len(names)} variants in {time.perf_counter() - start:.2f}s, {failed} differ")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    main()
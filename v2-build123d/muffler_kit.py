@@ -0,0 +1,220 @@
+'''Kits of parts exported as one instanced STEP assembly.
+
+A kit is everything printed for one muffler: a body, an end cap, an inner mesh
+tube and an O-ring of the same size and length, laid out side by side. The
+STEP file of a single part writes each of its solids in full, so the 30
+strands of an inner mesh tube, two solids rotated around the axis, are written
+30 times. Here every distinct solid is written once, as a STEP product, and
+each placement of it as a reference with a location, so the size and the load
+time of a file follow its unique geometry rather than its instances. A catalog
+of several kits in one file also writes each part and each thread once: an end
+cap is shared by the kits of all lengths, a body thread by the bodies of all
+lengths, and an end cap thread by the male and female end caps.
+
+Examples:
+    python muffler_kit.py
+    python muffler_kit.py "kit-small-*" --female 2.5 -o build
+    python muffler_kit.py --catalog v2-kits.step
+'''
+import argparse
+import fnmatch
+import os
+import time
+from dataclasses import dataclass
+
+from muffler_build import build_timestamp, load_model, output_files
+from muffler_params import MODEL_PATH, load_params
+
+KIT_SPACING = 10
+'''Gap in mm between the parts of a kit, laid out side by side along X'''
+
+@dataclass
+class KitStats:
+    parts: int
+    '''Number of parts written'''
+    instances: int
+    '''Number of placed solids'''
+    shapes: int
+    '''Number of distinct solids written, each as one STEP product'''
+    bytes: int
+    '''Size of the STEP file'''
+
+def kit_variants(end_cap: str = "end_cap_male", include_corkscrew: bool = False, **end_cap_arguments):
+    '''The variant names of each kit by name, one kit per body.
+
+    Each kit has the body, the end cap made by the end_cap builder with
+    end_cap_arguments besides the diameter, e.g.
+    connector_female_o_ring_thickness=2.0, the inner mesh tube of the same
+    length and the O-ring of the same size. Raises KeyError when no variant
+    matches.
+    '''
+    params = load_params()
+
+    def find(builder: str, **arguments):
+        for name, variant in params.VARIANTS.items():
+            if variant.builder == builder:
+                bound = params.BUILDERS[builder].bind(**variant.arguments)
+                bound.apply_defaults()
+                if all(bound.arguments.get(key) == value for key, value in arguments.items()):
+                    return name
+        raise KeyError(f"{builder} {arguments}")
+
+    kits = {}
+    for name, variant in params.VARIANTS.items():
+        if variant.builder != "body_male":
+            continue
+        diameter, length = variant.arguments["muffler_o_ring_inner_diameter"], variant.arguments["muffler_length"]
+        cap = find(end_cap, muffler_o_ring_inner_diameter=diameter,
+                   threading_extra_spacing_enabled=False, **end_cap_arguments)
+        tube = find("inner_mesh_tube", muffler_length=length, include_corkscrew=include_corkscrew)
+        ring = find("o_ring", muffler_o_ring_inner_diameter=diameter)
+        # kit-<size>-<length>, followed by how the end cap and tube differ from the default kit
+        tags = [name.removeprefix("body-male-")]
+        tags += [tag for tag in cap.removeprefix("end-cap-").split("-") if tag != "male" and tag not in name.split("-")]
+        tags += ["corkscrew"] if include_corkscrew else []
+        kits["-".join(["kit", *tags])] = (name, cap, tube, ring)
+    return kits
+
+def export_kits(kits: dict[str, dict], file_path: str, timestamp: str = None):
+    '''Write kits, each a dict of built parts by variant name, as one instanced STEP assembly.
+
+    Parts of the same name are written once, and so is every distinct solid
+    (OCCT TShape) of all parts, each placement being a reference with a location.
+    '''
+    from build123d import Pos
+    from OCP.APIHeaderSection import APIHeaderSection_MakeHeader
+    from OCP.IFSelect import IFSelect_ReturnStatus
+    from OCP.Interface import Interface_Static
+    from OCP.Message import Message, Message_Gravity
+    from OCP.STEPCAFControl import STEPCAFControl_Controller, STEPCAFControl_Writer
+    from OCP.STEPControl import STEPControl_Controller, STEPControl_StepModelType
+    from OCP.TCollection import TCollection_ExtendedString, TCollection_HAsciiString
+    from OCP.TDataStd import TDataStd_Name
+    from OCP.TDF import TDF_Label
+    from OCP.TDocStd import TDocStd_Document
+    from OCP.TopAbs import TopAbs_COMPOUND
+    from OCP.TopLoc import TopLoc_Location
+    from OCP.TopoDS import TopoDS_Iterator
+    from OCP.XCAFApp import XCAFApp_Application
+    from OCP.XCAFDoc import XCAFDoc_DocumentTool
+    from OCP.XSControl import XSControl_WorkSession
+
+    document = TDocStd_Document(TCollection_ExtendedString("XmlOcaf"))
+    application = XCAFApp_Application.GetApplication_s()
+    application.NewDocument(TCollection_ExtendedString("MDTV-XCAF"), document)
+    application.InitDocument(document)
+    XCAFDoc_DocumentTool.SetLengthUnit_s(document, 0.001)
+    shape_tool = XCAFDoc_DocumentTool.ShapeTool_s(document.Main())
+
+    def new_label(name: str, shape=None):
+        label = shape_tool.NewShape() if shape is None else shape_tool.AddShape(shape, False, False)
+        TDataStd_Name.Set_s(label, TCollection_ExtendedString(name))
+        return label
+
+    part_labels = {}
+    instances = 0
+    for kit_name, parts in kits.items():
+        kit_label = new_label(kit_name)
+        x = 0
+        for name, part in parts.items():
+            box = part.bounding_box()
+            if name not in part_labels:
+                part_labels[name] = new_label(name)
+                solids = []
+                if part.wrapped.ShapeType() == TopAbs_COMPOUND:
+                    children = TopoDS_Iterator(part.wrapped)
+                    while children.More():
+                        solids.append(children.Value())
+                        children.Next()
+                else:
+                    solids.append(part.wrapped)
+                for index, solid in enumerate(solids):
+                    # The solid at the origin is the prototype, found again for every placement of the same TShape
+                    prototype, label = solid.Located(TopLoc_Location()), TDF_Label()
+                    if not shape_tool.FindShape(prototype, label, False):
+                        label = new_label(f"{name}-{index}", prototype)
+                    shape_tool.AddComponent(part_labels[name], label, solid.Location())
+                instances += len(solids)
+            shape_tool.AddComponent(kit_label, part_labels[name], Pos(x - box.min.X, 0, 0).wrapped)
+            x += box.size.X + KIT_SPACING
+    shape_tool.UpdateAssemblies()
+
+    # Written as build123d export_step does, without the messages of OCCT
+    for printer in Message.DefaultMessenger_s().Printers():
+        printer.SetTraceLevel(Message_Gravity.Message_Fail)
+    writer = STEPCAFControl_Writer(XSControl_WorkSession(), False)
+    writer.SetNameMode(True)
+    header = APIHeaderSection_MakeHeader(writer.Writer().Model())
+    if not header.IsDone():
+        header = APIHeaderSection_MakeHeader(0)
+        header.Apply(writer.Writer().Model())
+    header.SetName(TCollection_HAsciiString(os.path.basename(file_path)))
+    header.SetTimeStamp(TCollection_HAsciiString(timestamp or build_timestamp()))
+    header.SetOriginatingSystem(TCollection_HAsciiString("build123d"))
+    STEPCAFControl_Controller.Init_s()
+    STEPControl_Controller.Init_s()
+    Interface_Static.SetIVal_s("write.surfacecurve.mode", 1)
+    writer.Transfer(document, STEPControl_StepModelType.STEPControl_AsIs)
+    if writer.Write(file_path) != IFSelect_ReturnStatus.IFSelect_RetDone:
+        raise RuntimeError(f"Failed to write {file_path}")
+    shapes = sum(1 for label in _free_labels(shape_tool) if not shape_tool.IsAssembly_s(label))
+    return KitStats(len(part_labels), instances, shapes, os.path.getsize(file_path))
+
+def _free_labels(shape_tool):
+    # The top-level labels of the document: kits, parts and prototypes
+    from OCP.TDF import TDF_ChildIterator
+    labels = TDF_ChildIterator(shape_tool.Label(), False)
+    while labels.More():
+        yield labels.Value()
+        labels.Next()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export muffler kits as instanced STEP assemblies.")
+    parser.add_argument("kits", nargs="*", metavar="KIT", help="names or glob patterns of the kits (default: all)")
+    parser.add_argument("-o", "--output-dir", default=".", help="folder of the STEP files (default: current folder)")
+    parser.add_argument("--catalog", metavar="FILE", help="write all kits into this one STEP file, sharing their parts")
+    parser.add_argument("--female", type=float, metavar="THICKNESS",
+                        help="use the female end cap for a CPAP hose O-ring of this thickness, e.g. 2.0")
+    parser.add_argument("--corkscrew", action="store_true", help="use the inner mesh tubes with a corkscrew")
+    parser.add_argument("--list", action="store_true", help="list the kits and their variants, and exit")
+    args = parser.parse_args(argv)
+
+    end_cap = dict(end_cap="end_cap_female", connector_female_o_ring_thickness=args.female) \
+        if args.female is not None else {}
+    try:
+        kits = kit_variants(include_corkscrew=args.corkscrew, **end_cap)
+    except KeyError:
+        parser.error(f"no female end cap for an O-ring {args.female} mm thick")
+    names = [name for name in kits if not args.kits or any(fnmatch.fnmatchcase(name, kit) for kit in args.kits)]
+    if not names:
+        parser.error(f"no kit matches {', '.join(args.kits)}")
+    if args.list:
+        for name in names:
+            print(f"{name:<36} {', '.join(kits[name])}")
+        return
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    model = load_model()
+    timestamp = build_timestamp()
+    built = {}
+    start = time.perf_counter()
+    for name in names:
+        built[name] = {variant: model.VARIANTS[variant]() for variant in kits[name]}
+        if args.catalog is None:
+            _report(name, kits[name], export_kits({name: built.pop(name)},
+                    output_files(name, args.output_dir, (".step",))[".step"], timestamp))
+    if args.catalog is not None:
+        _report(os.path.basename(args.catalog), {variant for name in names for variant in kits[name]},
+                export_kits(built, os.path.join(args.output_dir, args.catalog), timestamp))
+    print(f"Exported {len(names)} kits in {time.perf_counter() - start:.2f}s")
+
+def _report(name: str, variants, stats: KitStats):
+    # Compared with the committed STEP files of the parts, when all exist
+    files = [output_files(variant, MODEL_PATH.parent, (".step",))[".step"] for variant in variants]
+    separate = f", separate files {sum(map(os.path.getsize, files))/1e6:.2f} MB" \
+        if all(map(os.path.exists, files)) else ""
+    print(f"{name:<35} {stats.parts:3} parts {stats.instances:4} solids {stats.shapes:4} shapes "
+          f"{stats.bytes/1e6:6.2f} MB{separate}")
+
+if __name__ == "__main__":
+    main()
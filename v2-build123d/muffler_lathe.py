@@ -0,0 +1,86 @@
+'''OCCT helpers for meshing revolved parts directly from their 2D profile.
+
+The profile outline is discretized here and revolved with NumPy by
+muffler_mesh.revolve_polygon. Only the features that are not revolved (grip
+cutouts and threads) are meshed by OCCT, with shape_triangles.
+'''
+import numpy as np
+
+from muffler_quality import DEFAULT_PROFILE, QUALITY_PROFILES, MeshQuality, solid_kind
+
+PROFILE_ANGULAR_TOLERANCE = 0.1
+'''Largest angle (radians) between the segments of a discretized curved profile edge'''
+
+PROFILE_TOLERANCE = 0.005
+'''Largest distance (mm) between a discretized curved profile edge and the curve'''
+
+SEAM_QUALITY = QUALITY_PROFILES[DEFAULT_PROFILE].default
+'''The coarsest quality of a shape stitched to a revolved mesh, as the chords of a coarser seam circle
+reach into the outer tube of the bodies, 0.02 mm inside the seam'''
+
+def profile_polygon(profile, angular_tolerance: float = PROFILE_ANGULAR_TOLERANCE,
+                    tolerance: float = PROFILE_TOLERANCE):
+    '''The outline of a single face profile in the XY plane, as a polygon of (x, y) points'''
+    from OCP.BRepAdaptor import BRepAdaptor_Curve
+    from OCP.BRepTools import BRepTools_WireExplorer
+    from OCP.GCPnts import GCPnts_TangentialDeflection
+    from OCP.TopAbs import TopAbs_REVERSED
+    faces = profile.faces()
+    if len(faces) != 1 or faces[0].inner_wires():
+        raise ValueError("Only profiles of a single face without holes can be revolved directly")
+    points = []
+    explorer = BRepTools_WireExplorer(faces[0].outer_wire().wrapped)
+    while explorer.More():
+        edge = explorer.Current()
+        discretized = GCPnts_TangentialDeflection(BRepAdaptor_Curve(edge), angular_tolerance, tolerance)
+        edge_points = [discretized.Value(i) for i in range(1, discretized.NbPoints()+1)]
+        if edge.Orientation() == TopAbs_REVERSED:
+            edge_points.reverse()
+        # The last point is the first one of the next edge
+        points.extend((point.X(), point.Y()) for point in edge_points[:-1])
+        explorer.Next()
+    return np.array(points)
+
+def shape_triangles(shape, builder: str = None, quality: str = None, exclude_radius: float = None):
+    '''Triangles of a shape meshed by OCCT, as muffler_mesh uses them.
+
+    Each solid is meshed as export_stl does for a part of the builder, with
+    the quality profile of that name (None for the default). Faces lying on
+    the cylinder of exclude_radius around the Z axis are left out, e.g. the
+    seam with a mesh made by muffler_mesh.revolve_polygon, and the shape is
+    then meshed at least as finely as SEAM_QUALITY.
+    '''
+    from OCP.BRep import BRep_Tool
+    from OCP.BRepMesh import BRepMesh_IncrementalMesh
+    from OCP.BRepTools import BRepTools
+    from OCP.TopAbs import TopAbs_REVERSED
+    from OCP.TopLoc import TopLoc_Location
+    # As export_stl, do not depend on the triangulation of an earlier export
+    BRepTools.Clean_s(shape.wrapped)
+    profile = QUALITY_PROFILES[quality or DEFAULT_PROFILE]
+    solids = shape.solids()
+    qualities = [profile.quality(builder, solid_kind(solid)) for solid in solids]
+    if exclude_radius is not None:
+        qualities = [MeshQuality(min(quality.tolerance, SEAM_QUALITY.tolerance),
+                                 min(quality.angular_tolerance, SEAM_QUALITY.angular_tolerance))
+                     for quality in qualities]
+    if len(set(qualities)) == 1:
+        solids, qualities = [shape], qualities[:1]
+    for solid, solid_quality in zip(solids, qualities):
+        BRepMesh_IncrementalMesh(solid.wrapped, solid_quality.tolerance, True, solid_quality.angular_tolerance, True)
+    triangles = []
+    for face in shape.faces():
+        location = TopLoc_Location()
+        triangulation = BRep_Tool.Triangulation_s(face.wrapped, location)
+        if triangulation is None:
+            continue
+        transformation = location.Transformation()
+        nodes = np.array([triangulation.Node(i).Transformed(transformation).Coord()
+                          for i in range(1, triangulation.NbNodes()+1)])
+        if exclude_radius is not None and np.allclose(np.hypot(nodes[:, 0], nodes[:, 1]), exclude_radius, atol=1e-6):
+            continue
+        indices = np.array([triangulation.Triangle(i).Get() for i in range(1, triangulation.NbTriangles()+1)]) - 1
+        if face.wrapped.Orientation() == TopAbs_REVERSED:
+            indices = indices[:, ::-1]
+        triangles.append(nodes[indices])
+    return np.concatenate(triangles)
@@ -0,0 +1,385 @@
+'''Declarative variant manifests, and builds sharded across machines.
+
+A manifest is a JSON file of the variants to build, each with its builder and
+arguments, and of the constants overriding the model, e.g.
+    {"constants": {"TOLERANCE": 0.25},
+     "variants": {"body-male-small-70": {"builder": "body_male",
+                  "arguments": {"muffler_o_ring_inner_diameter": 44, "muffler_length": 70}}}}
+Without a manifest, the VARIANTS of the source file are built; "write" saves
+them as a manifest to start from.
+
+"build --shard i/n" builds only the i-th of n shards, so n CI nodes build one
+catalog together. The shards are balanced by the longest processing time
+rule: the variants are dealt from the slowest to the fastest, each one to the
+shard with the least work so far. The cost of a variant is its build time
+recorded by earlier merges (build-times.json), else the mean recorded time of
+its builder, so the inner mesh tubes and threaded parts are spread over the
+shards. Every node computes the same plan from the same manifest and times.
+
+Each shard writes its files and a report (shard-i-of-n.json). "merge" checks
+that the reports of all shards cover the manifest exactly once, copies their
+files into one catalog listed in catalog.json (with the size and SHA-256 of
+every file), and writes the recorded times updated with the new build times
+next to it. The shards must have been planned with the same times, so merge
+leaves build-times.json as it is: copy the new times over it to balance the
+next plans with them. As a shard builds its variants in one process, a
+variant may reuse memoized geometry of an earlier one and record less time
+than a build of its own.
+
+Examples:
+    python muffler_manifest.py write variants.json
+    python muffler_manifest.py plan --shards 4
+    python muffler_manifest.py build --shard 2/4 --stl-only -o shard-2
+    python muffler_manifest.py merge shard-1 shard-2 shard-3 shard-4 -o catalog
+'''
+import argparse
+import enum
+import hashlib
+import heapq
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+
+from muffler_build import (MODEL_PATH, BuildOptions, BuildResult, add_build_arguments, build_options, build_part,
+                           build_timestamp, cached_indexed_stats, load_model, output_files, part_key, report_result,
+                           report_summary)
+from muffler_cache import ArtifactCache
+from muffler_deps import ModelDependencies, constant_names
+from muffler_params import load_params
+from muffler_quality import stl_stats
+
+MANIFEST_FORMAT = 1
+'''Version of the manifest, shard report and catalog files'''
+
+BUILD_TIMES_PATH = MODEL_PATH.with_name("build-times.json")
+'''The recorded build time of every variant in seconds, used to balance the shards'''
+
+DEFAULT_COST = 1.0
+'''Cost in seconds of a variant whose builder has no recorded time'''
+
+CATALOG_FILE = "catalog.json"
+'''The list of the variants of a merged catalog and their files, written in the catalog directory'''
+
+@dataclass(frozen=True)
+class ManifestVariant:
+    name: str
+    '''Name of the variant, its files being named 'v2-<name>.stl' etc.'''
+    builder: str
+    '''Name of the part builder, e.g. "end_cap_male"'''
+    arguments: tuple[tuple[str, object], ...]
+    '''Arguments of the builder by name, enums as their values'''
+
+@dataclass
+class Manifest:
+    variants: list[ManifestVariant]
+    '''The variants to build, in order'''
+    constants: dict
+    '''Overridden constants of the model by name'''
+
+    def to_json(self):
+        '''The manifest as JSON data'''
+        return {"format": MANIFEST_FORMAT, "constants": self.constants,
+                "variants": {variant.name: {"builder": variant.builder, "arguments": dict(variant.arguments)}
+                             for variant in self.variants}}
+
+    def digest(self):
+        '''SHA-256 of the manifest, telling whether shards were built from the same one'''
+        return hashlib.sha256(json.dumps(self.to_json(), sort_keys=True).encode()).hexdigest()
+
+def default_manifest():
+    '''The manifest of the VARIANTS of the source file'''
+    variants = [ManifestVariant(name, variant.builder,
+                                tuple((argument, value.value if isinstance(value, enum.Enum) else value)
+                                      for argument, value in variant.arguments.items()))
+                for name, variant in load_params().VARIANTS.items()]
+    return Manifest(variants, {})
+
+def read_manifest(file_path: str):
+    '''The manifest of a JSON file.
+
+    Raises ValueError for a manifest without variants, an unknown builder or constant, or arguments not matching
+    the builder.
+    '''
+    data = json.loads(Path(file_path).read_text())
+    if data.get("format", MANIFEST_FORMAT) != MANIFEST_FORMAT:
+        raise ValueError(f"{file_path}: unsupported manifest format {data['format']}")
+    builders = load_params().BUILDERS
+    unknown = set(data.get("constants", {})) - set(constant_names(MODEL_PATH.read_text()))
+    if unknown:
+        raise ValueError(f"{file_path}: unknown constants {', '.join(sorted(unknown))}")
+    if not data["variants"]:
+        raise ValueError(f"{file_path}: no variants")
+    variants = []
+    for name, entry in data["variants"].items():
+        builder, arguments = entry.get("builder"), entry.get("arguments", {})
+        if builder not in builders:
+            raise ValueError(f"{file_path}: unknown builder {builder!r} of {name}")
+        try:
+            builders[builder].bind(**arguments)
+        except TypeError as error:
+            raise ValueError(f"{file_path}: invalid arguments of {name}: {error}") from None
+        variants.append(ManifestVariant(name, builder, tuple(arguments.items())))
+    return Manifest(variants, dict(data.get("constants", {})))
+
+def write_manifest(manifest: Manifest, file_path: str):
+    '''Write the manifest as a JSON file'''
+    Path(file_path).write_text(json.dumps(manifest.to_json(), indent=1) + "\n")
+
+def read_build_times(file_path: str = BUILD_TIMES_PATH):
+    '''The recorded build times in seconds by variant name, empty without a file'''
+    path = Path(file_path)
+    return json.loads(path.read_text()) if path.is_file() else {}
+
+def variant_costs(manifest: Manifest, times: dict[str, float]):
+    '''The cost of every variant of the manifest by name: its recorded build time, else the mean of its builder'''
+    recorded = {}
+    for variant in manifest.variants:
+        if variant.name in times:
+            recorded.setdefault(variant.builder, []).append(times[variant.name])
+    return {variant.name: times[variant.name] if variant.name in times
+            else sum(recorded[variant.builder])/len(recorded[variant.builder]) if variant.builder in recorded
+            else DEFAULT_COST
+            for variant in manifest.variants}
+
+def plan_shards(manifest: Manifest, shards: int, times: dict[str, float] = None):
+    '''The variants of every shard, balanced by the longest processing time rule.
+
+    The same manifest and times always give the same plan.
+    '''
+    costs = variant_costs(manifest, read_build_times() if times is None else times)
+    order = sorted(range(len(manifest.variants)), key=lambda index: (-costs[manifest.variants[index].name], index))
+    loads = [(0.0, shard) for shard in range(shards)]
+    plan = [[] for _ in range(shards)]
+    for index in order:
+        load, shard = heapq.heappop(loads)
+        plan[shard].append(index)
+        heapq.heappush(loads, (load + costs[manifest.variants[index].name], shard))
+    # Each shard builds in manifest order
+    return [[manifest.variants[index] for index in sorted(indices)] for indices in plan]
+
+def manifest_keys(variants, constants: dict, options: BuildOptions = BuildOptions()):
+    '''The cache key of each manifest variant'''
+    model = load_model(constants)
+    dependencies = ModelDependencies(MODEL_PATH.read_text())
+    return {variant: part_key(dependencies, model, partial(getattr(model, variant.builder), **dict(variant.arguments)),
+                              options, constants)
+            for variant in variants}
+
+def build_manifest_variant(variant: ManifestVariant, output_dir: str = ".", timestamp: str = None,
+                           cache: ArtifactCache = None, key: str = None, options: BuildOptions = BuildOptions()):
+    '''Build one manifest variant with the constants of the options, and export it into output_dir'''
+    model = load_model(dict(options.constants))
+    part = partial(getattr(model, variant.builder), **dict(variant.arguments))
+    return build_part(variant.name, model, part, output_files(variant.name, output_dir, options.formats),
+                      timestamp, cache, key, options)
+
+def stream_manifest(variants, output_dir: str = ".", workers: int = None, use_cache: bool = True,
+                    options: BuildOptions = BuildOptions()):
+    '''Build and export manifest variants, yielding each result as soon as its files are written.
+
+    As muffler_build.stream_variants, with the constants of the manifest in the options.
+    '''
+    output_dir = os.path.abspath(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    timestamp = build_timestamp()
+    cache = ArtifactCache() if use_cache else None
+    keys = manifest_keys(variants, dict(options.constants), options) if use_cache else {}
+    pending = []
+    for variant in variants:
+        copy_start = time.perf_counter()
+        files = output_files(variant.name, output_dir, options.formats)
+        if cache is not None and cache.fetch(keys[variant], files):
+            stl = stl_stats(files[".stl"]) if ".stl" in files else None
+            yield BuildResult(variant.name, time.perf_counter() - copy_start, list(files.values()), cached=True,
+                              stl=stl, indexed=cached_indexed_stats(files))
+        else:
+            pending.append(variant)
+    workers = min(workers or os.cpu_count() or 1, len(pending) or 1)
+    if workers == 1:
+        for variant in pending:
+            yield build_manifest_variant(variant, output_dir, timestamp, cache, keys.get(variant), options)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            jobs = [pool.submit(build_manifest_variant, variant, output_dir, timestamp, cache, keys.get(variant),
+                                options)
+                    for variant in pending]
+            for job in as_completed(jobs):
+                yield job.result()
+
+def shard_report_name(shard: int, shards: int):
+    '''The file name of the report of a shard'''
+    return f"shard-{shard}-of-{shards}.json"
+
+def times_digest(times: dict[str, float]):
+    '''SHA-256 of build times, telling whether shards were planned with the same ones'''
+    return hashlib.sha256(json.dumps(times, sort_keys=True).encode()).hexdigest()
+
+def write_shard_report(manifest: Manifest, shard: int, shards: int, results, output_dir: str,
+                       times: dict[str, float]):
+    '''Write the report of a built shard: the digests of the manifest and of the times it was planned with, and
+    the build time and files of every variant'''
+    report = {"format": MANIFEST_FORMAT, "manifest": manifest.digest(), "times": times_digest(times),
+              "shard": shard, "shards": shards,
+              "results": {result.name: {"seconds": round(result.seconds, 3), "cached": result.cached,
+                                        "files": [os.path.basename(file) for file in result.files]}
+                          for result in results}}
+    path = os.path.join(output_dir, shard_report_name(shard, shards))
+    Path(path).write_text(json.dumps(report, indent=1) + "\n")
+    return path
+
+def merge_shards(manifest: Manifest, shard_dirs, output_dir: str, times: dict[str, float] = None):
+    '''Copy the files of all shards into one catalog, and write the times updated with their build times next to it.
+
+    Every shard directory holds the report of one shard, planned with the
+    times (by default the recorded ones). Returns the problems found: missing
+    or foreign shards, shards planned with other times, and variants missing,
+    built twice or without their files. The catalog and times are only written
+    without problems.
+    '''
+    times = read_build_times() if times is None else times
+    reports = {}
+    problems = []
+    for directory in shard_dirs:
+        paths = sorted(Path(directory).glob("shard-*-of-*.json"))
+        if len(paths) != 1:
+            problems.append(f"{directory}: expected one shard report, found {len(paths)}")
+            continue
+        report = json.loads(paths[0].read_text())
+        if report["manifest"] != manifest.digest():
+            problems.append(f"{paths[0]}: built from another manifest")
+        elif report.get("times") != times_digest(times):
+            problems.append(f"{paths[0]}: planned with other build times")
+        elif report["shard"] in reports:
+            problems.append(f"{paths[0]}: shard {report['shard']} merged twice")
+        else:
+            reports[report["shard"]] = (Path(directory), report)
+    shards = {report["shards"] for _, report in reports.values()}
+    if len(shards) > 1:
+        problems.append(f"reports of different shard counts {sorted(shards)}")
+    elif shards:
+        missing = set(range(1, shards.pop() + 1)) - set(reports)
+        if missing:
+            problems.append(f"missing shards {', '.join(map(str, sorted(missing)))}")
+    built = {}
+    for shard, (directory, report) in sorted(reports.items()):
+        for name, result in report["results"].items():
+            if name in built:
+                problems.append(f"{name} built by shards {built[name][0]} and {shard}")
+            missing = [file for file in result["files"] if not (directory / file).is_file()]
+            if missing:
+                problems.append(f"{name}: missing {', '.join(missing)} in {directory}")
+            built[name] = (shard, directory, result)
+    names = [variant.name for variant in manifest.variants]
+    problems += [f"{name} not built by any shard" for name in names if name not in built]
+    problems += [f"{name} built but not in the manifest" for name in built if name not in names]
+    if problems:
+        return problems
+
+    os.makedirs(output_dir, exist_ok=True)
+    catalog = {}
+    for variant in manifest.variants:
+        shard, directory, result = built[variant.name]
+        files = {}
+        for file in result["files"]:
+            source, destination = directory / file, Path(output_dir) / file
+            if source.resolve() != destination.resolve():
+                shutil.copyfile(source, destination)
+            content = destination.read_bytes()
+            files[file] = {"bytes": len(content), "sha256": hashlib.sha256(content).hexdigest()}
+        catalog[variant.name] = {"builder": variant.builder, "arguments": dict(variant.arguments),
+                                 "shard": shard, "files": files}
+    Path(output_dir, CATALOG_FILE).write_text(json.dumps(
+        {"format": MANIFEST_FORMAT, "manifest": manifest.digest(), "constants": manifest.constants,
+         "variants": catalog}, indent=1) + "\n")
+    # Cached variants were copied, not built, so they keep their recorded time
+    times = dict(times)
+    times.update({name: result["seconds"] for name, (_, _, result) in built.items() if not result["cached"]})
+    Path(output_dir, BUILD_TIMES_PATH.name).write_text(json.dumps(dict(sorted(times.items())), indent=1) + "\n")
+    return []
+
+def parse_shard(text: str):
+    '''A shard "i/n" as (i, n), numbered from 1'''
+    index, _, count = text.partition("/")
+    if not (index.isdigit() and count.isdigit() and 1 <= int(index) <= int(count)):
+        raise argparse.ArgumentTypeError(f"invalid shard {text!r}, expected i/n with 1 <= i <= n")
+    return int(index), int(count)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the muffler variants of a manifest, sharded across machines.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    write = commands.add_parser("write", help="write the VARIANTS of the source file as a manifest")
+    write.add_argument("file", help="the manifest file to write")
+    plan = commands.add_parser("plan", help="print the variants and cost of every shard")
+    plan.add_argument("--shards", type=int, required=True, help="number of shards")
+    build = commands.add_parser("build", help="build the variants of one shard")
+    build.add_argument("--shard", type=parse_shard, default=(1, 1), metavar="I/N",
+                       help="build the I-th of N shards (default: 1/1, all variants)")
+    build.add_argument("-o", "--output-dir", default=".",
+                       help="directory of the exported files and the shard report (default: current directory)")
+    build.add_argument("-j", "--jobs", type=int, default=None,
+                       help="number of parallel build processes (default: one per core)")
+    build.add_argument("--no-cache", action="store_true",
+                       help="rebuild all variants instead of copying unchanged ones from the cache")
+    add_build_arguments(build)
+    merge = commands.add_parser("merge", help="assemble the outputs of all shards into one catalog")
+    merge.add_argument("shard_dirs", nargs="+", metavar="SHARD_DIR", help="output directories of the shards")
+    merge.add_argument("-o", "--output-dir", required=True, help="directory of the catalog")
+    for command in (plan, build, merge):
+        command.add_argument("--manifest", metavar="FILE",
+                             help="the manifest of the variants (default: the VARIANTS of the source file)")
+        command.add_argument("--times", default=BUILD_TIMES_PATH, metavar="FILE",
+                             help=f"recorded build times to plan the shards with (default: {BUILD_TIMES_PATH.name})")
+    args = parser.parse_args(argv)
+
+    if args.command == "write":
+        manifest = default_manifest()
+        write_manifest(manifest, args.file)
+        print(f"Wrote {len(manifest.variants)} variants to {args.file}")
+        return
+    try:
+        manifest = read_manifest(args.manifest) if args.manifest else default_manifest()
+    except (OSError, ValueError, KeyError) as error:
+        parser.error(f"invalid manifest: {error}")
+    if args.command == "plan":
+        if args.shards < 1:
+            parser.error("the number of shards must be at least 1")
+        _report_plan(manifest, args.shards, read_build_times(args.times))
+    elif args.command == "build":
+        shard, shards = args.shard
+        times = read_build_times(args.times)
+        variants = plan_shards(manifest, shards, times)[shard - 1]
+        options = build_options(args, constants=tuple(sorted(manifest.constants.items())))
+        print(f"Shard {shard}/{shards}: {len(variants)} of {len(manifest.variants)} variants")
+        start = time.perf_counter()
+        results = [report_result(result) for result in
+                   stream_manifest(variants, args.output_dir, args.jobs, not args.no_cache, options)]
+        report_summary(results, time.perf_counter() - start, args.jobs, options)
+        print(f"Wrote {write_shard_report(manifest, shard, shards, results, args.output_dir, times)}")
+    else:
+        problems = merge_shards(manifest, args.shard_dirs, args.output_dir, read_build_times(args.times))
+        for problem in problems:
+            print(problem)
+        if problems:
+            sys.exit(1)
+        print(f"Merged {len(args.shard_dirs)} shards into {os.path.join(args.output_dir, CATALOG_FILE)}, "
+              f"build times updated in {os.path.join(args.output_dir, BUILD_TIMES_PATH.name)}")
+
+def _report_plan(manifest: Manifest, shards: int, times: dict[str, float]):
+    costs = variant_costs(manifest, times)
+    loads = []
+    for shard, variants in enumerate(plan_shards(manifest, shards, times), 1):
+        load = sum(costs[variant.name] for variant in variants)
+        loads.append(load)
+        print(f"shard {shard}/{shards} {len(variants):3} variants {load:7.1f}s  "
+              f"{', '.join(variant.name for variant in variants)}")
+    print(f"Longest shard {max(loads):.1f}s, {max(loads)/(sum(loads)/shards) - 1:+.1%} over an even split "
+          f"({len(times)} recorded times)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+'''In-process memo of intermediate geometry that is shared between variants.
+
+A memoized function returns the same shape for the same arguments. Callers must
+treat it as read-only and place it with a transform (e.g. 'Pos(...) * shape'),
+which creates a lightweight instance sharing the underlying OCCT geometry.
+Only the most recently used shapes of each function are kept, so the memory of a
+build process stays flat however many variants it builds.
+'''
+import functools
+import time
+import weakref
+from dataclasses import dataclass
+
+MEMO_MAX_ENTRIES = 8
+'''Number of shapes kept per memoized function, the least recently used are released'''
+
+@dataclass
+class MemoStats:
+    hits: int = 0
+    '''Number of calls answered from the memo'''
+    misses: int = 0
+    '''Number of calls that built the geometry'''
+    build_seconds: float = 0.0
+    '''Time spent building the geometry on misses'''
+    saved_seconds: float = 0.0
+    '''Time the hits would have spent building the geometry again'''
+
+    def __add__(self, other: "MemoStats"):
+        return MemoStats(self.hits + other.hits,
+                         self.misses + other.misses,
+                         self.build_seconds + other.build_seconds,
+                         self.saved_seconds + other.saved_seconds)
+
+    def __sub__(self, other: "MemoStats"):
+        return MemoStats(self.hits - other.hits,
+                         self.misses - other.misses,
+                         self.build_seconds - other.build_seconds,
+                         self.saved_seconds - other.saved_seconds)
+
+class _Memo(dict):
+    '''The memo of one function, released with the model that defined it'''
+
+_stats: dict[str, MemoStats] = {}
+_memos: list[weakref.ref] = []
+
+def memoize(function):
+    '''Decorator memoizing a geometry function by its arguments, the memo being its attribute memo'''
+    memo = _Memo()
+    _memos.append(weakref.ref(memo, _memos.remove))
+    stats = _stats.setdefault(function.__name__, MemoStats())
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        if key in memo:
+            # Move to the end, as most recently used
+            shape, seconds = memo[key] = memo.pop(key)
+            stats.hits += 1
+            stats.saved_seconds += seconds
+            return shape
+        start = time.perf_counter()
+        shape = function(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        memo[key] = (shape, seconds)
+        if len(memo) > MEMO_MAX_ENTRIES:
+            del memo[next(iter(memo))]
+        stats.misses += 1
+        stats.build_seconds += seconds
+        return shape
+    wrapper.memo = memo
+    return wrapper
+
+def memo_stats():
+    '''A snapshot of the statistics of every memoized function, by name'''
+    return {name: MemoStats() + stats for name, stats in _stats.items()}
+
+def memo_clear():
+    '''Release all memoized geometry'''
+    for reference in list(_memos):
+        memo = reference()
+        if memo is not None:
+            memo.clear()
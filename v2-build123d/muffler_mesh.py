@@ -0,0 +1,283 @@
+'''Direct NumPy meshing of swept and revolved profiles, STL input and output, and indexed mesh output.
+
+Triangles are arrays of shape (n, 3, 3): n triangles of 3 vertices, counter
+clockwise seen from the outside. Indexed meshes (see weld) store every vertex
+once, as 3MF or binary PLY files, a fraction of the size of an STL file.
+'''
+import re
+import zipfile
+from pathlib import Path
+
+import numpy as np
+
+STL_RECORD = np.dtype([("normal", "<f4", 3), ("vertices", "<f4", (3, 3)), ("attribute", "<u2")])
+'''One triangle of a binary STL file, after its 80 byte header and 4 byte triangle count'''
+
+PLY_FACE = np.dtype([("count", "u1"), ("vertices", "<i4", 3)])
+'''One triangle of a binary PLY file, as a list of 3 vertex indices'''
+
+ZIP_TIMESTAMP = (1980, 1, 1, 0, 0, 0)
+'''Date of the files in a 3MF archive, fixed so repeated exports are identical'''
+
+THREE_MF_PARTS = {
+    "[Content_Types].xml":
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="model" ContentType="application/vnd.ms-package.3dmanufacturing-3dmodel+xml"/>'
+        '</Types>',
+    "_rels/.rels":
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Target="/3D/3dmodel.model" Id="rel0" '
+        'Type="http://schemas.microsoft.com/3dmanufacturing/2013/01/3dmodel"/>'
+        '</Relationships>',
+}
+'''The fixed parts of a 3MF archive, besides its model'''
+
+def screw_sweep(polygon, pitch: float, height: float, segments: int, lefthand: bool = False):
+    '''Triangles of a convex polygon in the XY plane swept along a helix around the Z axis.
+
+    Matches a Frenet sweep of the polygon along a Helix(pitch, height, ...):
+    every slice is the polygon rotated by the helix angle at that height.
+    The number of segments is per full turn.
+    '''
+    polygon = np.asarray(polygon, dtype=float)
+    turns = height/pitch
+    steps = max(1, int(np.ceil(abs(turns)*segments)))
+    z = np.linspace(0, height, steps+1)
+    angle = 2*np.pi*turns*np.linspace(0, 1, steps+1)*(-1 if lefthand else 1)
+    cos, sin = np.cos(angle)[:, None], np.sin(angle)[:, None]
+    x, y = polygon[:, 0], polygon[:, 1]
+    rings = np.stack([cos*x - sin*y, sin*x + cos*y, np.broadcast_to(z[:, None], (steps+1, len(x)))], axis=-1)
+    return np.concatenate([_sides(rings), _cap(rings[0], flip=True), _cap(rings[-1])])
+
+def rotated_copies(triangles, count: int):
+    '''The triangles repeated count times, evenly rotated around the Z axis'''
+    angle = 2*np.pi*np.arange(count)/count
+    cos, sin, zero, one = np.cos(angle), np.sin(angle), np.zeros(count), np.ones(count)
+    rotation = np.stack([cos, -sin, zero, sin, cos, zero, zero, zero, one], axis=-1).reshape(count, 3, 3)
+    return np.einsum("kij,ntj->knti", rotation, triangles).reshape(-1, 3, 3)
+
+def lathe(outline, segments: int):
+    '''Triangles of a polygon in the XZ plane (x as radius, counter clockwise) revolved around the Z axis.
+
+    The polygon must not touch the axis.
+    '''
+    outline = np.asarray(outline, dtype=float)
+    angle = np.linspace(0, 2*np.pi, segments+1)
+    cos, sin = np.cos(angle)[:, None], np.sin(angle)[:, None]
+    r, z = outline[:, 0], outline[:, 1]
+    rings = np.stack([cos*r, sin*r, np.broadcast_to(z, (segments+1, len(r)))], axis=-1)
+    return _sides(rings[::-1])
+
+def revolve_polygon(polygon, segments: int, seam_radius: float = None, seam_triangles=None):
+    '''Watertight triangles of a polygon in the XZ plane (x as radius) revolved around the Z axis.
+
+    With a seam radius, only the part of the polygon inside it is revolved. It
+    is stitched to seam_triangles, a mesh of the rest (e.g. by OCCT) without its
+    faces on the seam cylinder, at the circles where the polygon crosses it.
+    The polygon must not touch the axis.
+    '''
+    polygon = np.asarray(polygon, dtype=float)
+    if _signed_area(polygon) < 0:
+        polygon = polygon[::-1]
+    uniform = 2*np.pi*np.arange(segments)/segments
+    if seam_radius is None or np.all(polygon[:, 0] < seam_radius):
+        chains = [(np.vstack([polygon, polygon[:1]]), False, False)]
+    else:
+        chains = _seam_chains(polygon, seam_radius)
+        seam_vertices = np.unique(np.asarray(seam_triangles, dtype=float).reshape(-1, 3), axis=0)
+        seam_vertices = seam_vertices[np.abs(np.hypot(seam_vertices[:, 0], seam_vertices[:, 1]) - seam_radius) < 1e-6]
+    triangles = []
+    for chain, seam_start, seam_end in chains:
+        rings = [_seam_ring(seam_vertices, point) if (seam_start and i == 0) or (seam_end and i == len(chain)-1)
+                 else _ring(point, uniform)
+                 for i, point in enumerate(chain)]
+        for i in range(len(chain)-1):
+            if not np.array_equal(chain[i], chain[i+1]):
+                triangles.append(_outwards(_zipper(*rings[i], *rings[i+1]), chain[i], chain[i+1]))
+    return np.concatenate(triangles)
+
+def _signed_area(polygon):
+    x, y = polygon[:, 0], polygon[:, 1]
+    return (x*np.roll(y, -1) - np.roll(x, -1)*y).sum()/2
+
+def _seam_chains(polygon, seam_radius: float):
+    '''The parts of a polygon inside the seam radius, starting and ending on it'''
+    outside = polygon[:, 0] >= seam_radius
+    # Start outside, so no chain wraps around the end of the polygon
+    polygon = np.roll(polygon, -int(np.argmax(outside)), axis=0)
+    outside = np.roll(outside, -int(np.argmax(outside)))
+    chains, chain = [], None
+    for i in range(len(polygon)):
+        a, b = polygon[i], polygon[(i+1) % len(polygon)]
+        if outside[i] != outside[(i+1) % len(polygon)]:
+            t = (seam_radius - a[0])/(b[0] - a[0])
+            crossing = np.array([seam_radius, a[1] + t*(b[1] - a[1])])
+            if chain is None:
+                chain = [crossing]
+            else:
+                chains.append((np.array(chain + [crossing]), True, True))
+                chain = None
+        if chain is not None:
+            chain.append(b)
+    return chains
+
+def _ring(point, angles):
+    '''A circle around the Z axis through a point (radius, z), and the angles of its vertices'''
+    radius, z = point
+    return np.stack([radius*np.cos(angles), radius*np.sin(angles), np.full(len(angles), z)], axis=-1), angles
+
+def _seam_ring(seam_vertices, point):
+    '''The seam vertices on the circle closest to a point (radius, z), ordered by angle.
+
+    On a curved edge of the polygon, the point is on a chord, slightly off the circle.
+    '''
+    z = seam_vertices[np.argmin(np.abs(seam_vertices[:, 2] - point[1])), 2]
+    ring = seam_vertices[np.abs(seam_vertices[:, 2] - z) < 1e-6]
+    if len(ring) < 3 or abs(z - point[1]) > 0.1:
+        raise ValueError(f"No seam vertices at radius {point[0]}, z {point[1]}")
+    angles = np.arctan2(ring[:, 1], ring[:, 0]) % (2*np.pi)
+    order = np.argsort(angles)
+    return ring[order], angles[order]
+
+def _zipper(ring_a, angles_a, ring_b, angles_b):
+    '''Triangles between two closed rings around the Z axis, each ordered by angle'''
+    m, n = len(ring_a), len(ring_b)
+    a, b = np.vstack([ring_a, ring_a[:1]]), np.vstack([ring_b, ring_b[:1]])
+    # Advance along the ring whose next vertex comes first
+    steps = np.concatenate([np.append(angles_a[1:], angles_a[0] + 2*np.pi),
+                            np.append(angles_b[1:], angles_b[0] + 2*np.pi)])
+    on_a = np.arange(m+n) < m
+    order = np.argsort(steps, kind="stable")
+    on_a = on_a[order]
+    i = np.cumsum(on_a) - on_a
+    j = np.cumsum(~on_a) - ~on_a
+    # Stepping along a gives (a[i], a[i+1], b[j]), along b (a[i], b[j+1], b[j])
+    second = np.where(on_a[:, None], a[np.minimum(i+1, m)], b[np.minimum(j+1, n)])
+    return np.stack([a[i], second, b[j]], axis=1)
+
+def _outwards(triangles, start, end):
+    '''Triangles of the surface revolved from a polygon edge, facing outwards (to the right of the edge)'''
+    normal_radius, normal_z = end[1] - start[1], start[0] - end[0]
+    centers = triangles.mean(axis=1)
+    angles = np.arctan2(centers[:, 1], centers[:, 0])
+    outwards = np.stack([normal_radius*np.cos(angles), normal_radius*np.sin(angles),
+                         np.full(len(angles), normal_z)], axis=-1)
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    return triangles if np.einsum("ij,ij->", normals, outwards) >= 0 else triangles[:, ::-1]
+
+def weld(triangles, decimals: int = 6):
+    '''Indexed mesh of triangles: the unique vertices, and the faces as indices of their vertices'''
+    vertices, faces = np.unique(np.round(np.asarray(triangles, dtype=float).reshape(-1, 3), decimals),
+                                axis=0, return_inverse=True)
+    return vertices, faces.reshape(-1, 3)
+
+def open_edges(faces):
+    '''Number of edges not shared by exactly two faces, once in each direction (0 for watertight meshes)'''
+    faces = np.asarray(faces, dtype=np.int64)
+    count = faces.max() + 1
+    edges = np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]])
+    directed, multiplicity = np.unique(edges[:, 0]*count + edges[:, 1], return_counts=True)
+    reverse = edges[:, 1]*count + edges[:, 0]
+    unmatched = ~np.isin(np.unique(reverse), directed)
+    return int((multiplicity != 1).sum() + unmatched.sum())
+
+def _sides(rings):
+    '''Quads between consecutive rings of a closed polygon, as triangles.
+
+    The diagonal of the (twisted) quads alternates between rings, so the
+    volume error of one ring is cancelled by the next one.
+    '''
+    a, b = rings[:-1], np.roll(rings[:-1], -1, axis=1)
+    c, d = np.roll(rings[1:], -1, axis=1), rings[1:]
+    odd = (np.arange(len(a)) % 2 == 1)[:, None, None, None]
+    first = np.where(odd, np.stack([a, b, d], axis=-2), np.stack([a, b, c], axis=-2))
+    second = np.where(odd, np.stack([b, c, d], axis=-2), np.stack([a, c, d], axis=-2))
+    return np.concatenate([first, second]).reshape(-1, 3, 3)
+
+def _cap(polygon, flip: bool = False):
+    '''Fan triangulation of a convex polygon'''
+    first = np.broadcast_to(polygon[0], (len(polygon)-2, 3))
+    triangles = np.stack([first, polygon[1:-1], polygon[2:]], axis=1)
+    return triangles[:, ::-1] if flip else triangles
+
+def mesh_volume(triangles):
+    '''Enclosed volume of closed triangle meshes (overlapping meshes are all counted)'''
+    return np.einsum("ij,ij->i", triangles[:, 0], np.cross(triangles[:, 1], triangles[:, 2])).sum()/6
+
+def triangle_areas(triangles):
+    '''Area of every triangle'''
+    return np.linalg.norm(np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0]), axis=1)/2
+
+def write_binary_stl(triangles, file_path: str, header: bytes = b"Binary STL written by muffler_mesh"):
+    '''Write triangles as a binary STL file'''
+    triangles = np.asarray(triangles, dtype=np.float32)
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+    records = np.zeros(len(triangles), dtype=STL_RECORD)
+    records["normal"] = normals
+    records["vertices"] = triangles
+    with open(file_path, "wb") as file:
+        file.write(header[:80].ljust(80, b" "))
+        file.write(np.uint32(len(records)).tobytes())
+        file.write(records.tobytes())
+
+def read_stl(file_path: str):
+    '''The triangles of a binary or ASCII STL file, as float32.
+
+    Binary files are memory-mapped, not read: the triangles are a view of the
+    file, only paged in when used. Raises ValueError for a file that is neither.
+    '''
+    with open(file_path, "rb") as file:
+        header = file.read(84)
+    if len(header) == 84:
+        count = int(np.frombuffer(header, "<u4", 1, 80)[0])
+        size = 84 + count*STL_RECORD.itemsize
+        # ASCII files also start with "solid", so only the size tells them apart
+        if count and size == Path(file_path).stat().st_size:
+            return np.memmap(file_path, STL_RECORD, "r", 84, (count,))["vertices"]
+    if header.lstrip().startswith(b"solid"):
+        with open(file_path, "rb") as file:
+            numbers = re.findall(rb"vertex\s+(\S+)\s+(\S+)\s+(\S+)", file.read())
+        if numbers:
+            return np.array(numbers, dtype=np.float32).reshape(-1, 3, 3)
+    raise ValueError(f"{file_path} is not an STL file")
+
+def distinct_faces(faces):
+    '''The faces with three distinct vertices, without the triangles collapsed by welding'''
+    faces = np.asarray(faces)
+    return faces[(faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 2] != faces[:, 0])]
+
+def write_binary_ply(vertices, faces, file_path: str):
+    '''Write an indexed mesh as a binary PLY file'''
+    records = np.zeros(len(faces), dtype=PLY_FACE)
+    records["count"] = 3
+    records["vertices"] = faces
+    header = (f"ply\nformat binary_little_endian 1.0\ncomment Written by muffler_mesh\n"
+              f"element vertex {len(vertices)}\nproperty float x\nproperty float y\nproperty float z\n"
+              f"element face {len(faces)}\nproperty list uchar int vertex_indices\nend_header\n")
+    with open(file_path, "wb") as file:
+        file.write(header.encode("ascii"))
+        file.write(np.asarray(vertices, dtype="<f4").tobytes())
+        file.write(records.tobytes())
+
+def write_3mf(vertices, faces, file_path: str):
+    '''Write an indexed mesh as a 3MF file, a zip-compressed XML model in millimeters'''
+    # One %-format over all values is much faster than formatting every vertex separately
+    vertex_xml = ('<vertex x="%.6f" y="%.6f" z="%.6f"/>'*len(vertices)) % tuple(np.asarray(vertices, dtype=float).ravel())
+    triangle_xml = ('<triangle v1="%d" v2="%d" v3="%d"/>'*len(faces)) % tuple(np.asarray(faces).ravel().tolist())
+    model = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+             '<model unit="millimeter" xml:lang="en-US" '
+             'xmlns="http://schemas.microsoft.com/3dmanufacturing/core/2015/02">'
+             '<resources><object id="1" type="model"><mesh>'
+             f'<vertices>{vertex_xml}</vertices><triangles>{triangle_xml}</triangles>'
+             '</mesh></object></resources><build><item objectid="1"/></build></model>')
+    with zipfile.ZipFile(file_path, "w") as archive:
+        for name, content in {**THREE_MF_PARTS, "3D/3dmodel.model": model}.items():
+            archive.writestr(zipfile.ZipInfo(name, ZIP_TIMESTAMP), content, zipfile.ZIP_DEFLATED)
+
+INDEXED_WRITERS = {".3mf": write_3mf, ".ply": write_binary_ply}
+'''The writers of the indexed mesh formats, by suffix'''
@@ -0,0 +1,122 @@
+'''The configuration of the parametric source file, loaded without build123d.
+
+Loading the model imports build123d, bd_warehouse and OCCT, which takes seconds.
+Its configuration only needs the standard library, so only the light imports,
+the enums, the constants and the calculations of the source file are executed
+here, and the signatures of its builders and its VARIANTS are read from the
+syntax tree. Listing the variants, validating parameters or printing the
+dimensions then starts in milliseconds. The CAD stack is only imported by
+muffler_build.load_model, once geometry is built.
+'''
+import ast
+import builtins
+import inspect
+import types
+from dataclasses import dataclass
+from pathlib import Path
+
+from muffler_deps import override_constants
+
+MODEL_PATH = Path(__file__).with_name("The Silent Night Customizable CPAP Silencer-Muffler v2.py")
+'''The parametric source file, defining all parts and VARIANTS'''
+
+LIGHT_MODULES = ("enum", "functools", "math")
+'''The modules imported by the source file that its configuration needs, all others are left out'''
+
+@dataclass(frozen=True)
+class Variant:
+    builder: str
+    '''Name of the part builder, e.g. "end_cap_male"'''
+    arguments: dict
+    '''Arguments of the builder by name, the enums as their members'''
+
+_params = None
+
+def load_params(constants: dict = None):
+    '''The configuration of the source file as a module, once per process.
+
+    Besides the enums, constants and calculations, VALUES holds the values of
+    the constants and calculations in the order of the source, BUILDERS the
+    inspect.Signature of each part builder and VARIANTS the Variant of each
+    name. With constants, e.g. {"TOLERANCE": 0.3}, a separate module is loaded
+    with these values replaced. Raises KeyError for unknown constants.
+    '''
+    global _params
+    if constants:
+        return _load(override_constants(MODEL_PATH.read_text(), constants))
+    if _params is None:
+        _params = _load(ast.parse(MODEL_PATH.read_text()))
+    return _params
+
+def parse_value(text: str):
+    '''A boolean, integer or float value of a constant or parameter'''
+    if text.lower() in ("true", "false"):
+        return text.lower() == "true"
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+def _load(tree: ast.Module):
+    params = types.ModuleType("muffler_v2_params")
+    params.__file__ = str(MODEL_PATH)
+    namespace = params.__dict__
+    params.VALUES = {}
+    functions = {}
+    variants = None
+    for statement in tree.body:
+        if isinstance(statement, ast.Import):
+            if all(alias.name in LIGHT_MODULES for alias in statement.names):
+                _exec(statement, namespace)
+        elif isinstance(statement, ast.ImportFrom):
+            if statement.module in LIGHT_MODULES:
+                _exec(statement, namespace)
+        elif isinstance(statement, ast.FunctionDef):
+            functions[statement.name] = statement
+        elif isinstance(statement, ast.ClassDef):
+            if _known(statement, namespace):
+                _exec(statement, namespace)
+        elif isinstance(statement, ast.Assign) and len(statement.targets) == 1 \
+                and isinstance(statement.targets[0], ast.Name):
+            name = statement.targets[0].id
+            if name == "VARIANTS":
+                variants = statement.value
+            elif _known(statement.value, namespace):
+                _exec(statement, namespace)
+                params.VALUES[name] = namespace[name]
+    params.VARIANTS = {}
+    params.BUILDERS = {}
+    for key, call in zip(variants.keys, variants.values) if variants is not None else ():
+        builder, *arguments = call.args
+        if builder.id not in params.BUILDERS:
+            params.BUILDERS[builder.id] = _signature(functions[builder.id], namespace)
+        values = dict(zip(params.BUILDERS[builder.id].parameters, (_eval(node, namespace) for node in arguments)))
+        values.update({keyword.arg: _eval(keyword.value, namespace) for keyword in call.keywords})
+        params.VARIANTS[ast.literal_eval(key)] = Variant(builder.id, values)
+    return params
+
+def _known(node: ast.AST, namespace: dict):
+    # Whether all names loaded by the node are defined, so it runs without the CAD stack
+    defined = {target.id for statement in getattr(node, "body", ()) if isinstance(statement, ast.Assign)
+               for target in statement.targets if isinstance(target, ast.Name)}
+    return all(child.id in namespace or child.id in defined or hasattr(builtins, child.id)
+               for child in ast.walk(node) if isinstance(child, ast.Name) and isinstance(child.ctx, ast.Load))
+
+def _exec(statement: ast.stmt, namespace: dict):
+    exec(compile(ast.Module([statement], type_ignores=[]), str(MODEL_PATH), "exec"), namespace)
+
+def _eval(node: ast.expr, namespace: dict):
+    return eval(compile(ast.Expression(node), str(MODEL_PATH), "eval"), namespace)
+
+def _signature(function: ast.FunctionDef, namespace: dict):
+    arguments = function.args.args
+    defaults = [None]*(len(arguments) - len(function.args.defaults)) + function.args.defaults
+    parameters = []
+    for argument, default in zip(arguments, defaults):
+        annotation = argument.annotation
+        parameters.append(inspect.Parameter(
+            argument.arg, inspect.Parameter.POSITIONAL_OR_KEYWORD,
+            default=inspect.Parameter.empty if default is None else _eval(default, namespace),
+            annotation=_eval(annotation, namespace) if annotation is not None and _known(annotation, namespace)
+            else inspect.Parameter.empty))
+    return inspect.Signature(parameters)
@@ -0,0 +1,283 @@
+'''Build plates: the parts of an order packed onto the printer bed, one mesh per plate.
+
+An order is a list of kits (see muffler_kit) or variants, each with a count,
+e.g. "kit-large-100:10". The footprint of every part is a circle, its radius
+computed from the dimensions of muffler_validate without building anything:
+the grip of the bodies and end caps, the male connector around the inner mesh
+tube, the outside of the O-ring. The circles are packed by first fit
+decreasing: the largest parts first, each one onto the first plate where it
+fits, at its lowest then leftmost position touching two walls or placed parts.
+Parts of different materials (see muffler_estimate.BUILDER_MATERIALS) go onto
+different plates. The STL files of the parts are then moved into place and
+written as one mesh per plate, so a printer gets one full job per plate
+instead of one per part.
+
+Examples:
+    python muffler_plate.py kit-large-100:10
+    python muffler_plate.py kit-small-70:4 "inner-mesh-tube-*-corkscrew" --bed 220x220 -o plates
+    python muffler_plate.py kit-medium-85:2 --list
+'''
+import argparse
+import csv
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from muffler_build import BuildOptions, build_variants, output_files, select_variants
+from muffler_estimate import BUILDER_MATERIALS, DEFAULT_MATERIAL, MATERIALS, builder_points, estimate_variants
+from muffler_kit import kit_variants
+from muffler_mesh import INDEXED_WRITERS, read_stl, write_binary_stl
+from muffler_params import load_params
+from muffler_validate import default_points, dimensions, model_values
+
+BED_SIZE = (256, 256)
+'''Width (X) and depth (Y) of the printer bed, in mm'''
+
+BED_MARGIN = 5
+'''Distance in mm between the parts and the edges of the bed'''
+
+PART_SPACING = 5
+'''Distance in mm between the footprints of the parts'''
+
+FOOTPRINT_RADII = {
+    "body_male": lambda v: v.outer_tube_outer_radius + v.grip_cutout_radius,
+    "end_cap_male": lambda v: v.outer_tube_outer_radius + v.grip_cutout_radius,
+    "end_cap_female": lambda v: v.outer_tube_outer_radius + v.grip_cutout_radius,
+    "inner_mesh_tube": lambda v: v.connector_male_outer_radius,
+    "o_ring": lambda v: v.diameter/2 + v.MUFFLER_O_RING_THICKNESS,
+}
+'''The radius of the circle around the parts of each builder, from the dimensions of muffler_validate'''
+
+@dataclass
+class Plate:
+    material: str
+    '''Name of the filament of all parts, see muffler_estimate.MATERIALS'''
+    names: list
+    '''Variant name of every part'''
+    centers: np.ndarray
+    '''Center of the footprint of every part on the bed, in mm'''
+    radii: np.ndarray
+    '''Radius of the footprint of every part, in mm'''
+
+    def fill(self, bed_size=BED_SIZE):
+        '''The share of the bed covered by the footprints'''
+        return float(np.pi*(self.radii**2).sum()/(bed_size[0]*bed_size[1]))
+
+def footprint_radii(names):
+    '''The radius of the footprint of each named variant, computed for all variants of a builder at once'''
+    radii = {}
+    for builder, group, points in builder_points(list(dict.fromkeys(names))):
+        values = FOOTPRINT_RADII[builder](dimensions(model_values(default_points(points))))
+        radii.update(zip(group, np.broadcast_to(values, len(group)).astype(float)))
+    return radii
+
+def order_variants(order):
+    '''The variant name of every part of an order, a list of (kit or variant pattern, count).
+
+    Raises KeyError for a name matching neither a kit nor a variant.
+    '''
+    kits = kit_variants()
+    names = list(load_params().VARIANTS)
+    parts = []
+    for pattern, count in order:
+        variants = list(kits[pattern]) if pattern in kits else select_variants([pattern], names)
+        parts += variants*count
+    return parts
+
+def pack_plates(names, bed_size=BED_SIZE, margin: float = BED_MARGIN, spacing: float = PART_SPACING,
+                material: str = None):
+    '''The parts packed onto plates, by first fit decreasing of their footprints.
+
+    Parts of different materials go onto different plates, unless material
+    sets one for all. Raises ValueError for a part larger than the bed.
+    '''
+    radii = footprint_radii(names)
+    builders = {name: variant.builder for name, variant in load_params().VARIANTS.items()}
+    plates = []
+    # Largest first, the order of the names breaking ties
+    for name in sorted(names, key=lambda name: -radii[name]):
+        part_material = material or BUILDER_MATERIALS.get(builders[name], DEFAULT_MATERIAL)
+        for plate in plates:
+            if plate.material == part_material:
+                center = _lowest_position(plate.centers, plate.radii, radii[name], bed_size, margin, spacing)
+                if center is not None:
+                    break
+        else:
+            plate = Plate(part_material, [], np.empty((0, 2)), np.empty(0))
+            center = _lowest_position(plate.centers, plate.radii, radii[name], bed_size, margin, spacing)
+            if center is None:
+                raise ValueError(f"{name} does not fit onto a bed of {bed_size[0]:g}x{bed_size[1]:g} mm")
+            plates.append(plate)
+        plate.names.append(name)
+        plate.centers = np.vstack([plate.centers, center])
+        plate.radii = np.append(plate.radii, radii[name])
+    return plates
+
+def _lowest_position(centers, radii, radius: float, bed_size, margin: float, spacing: float):
+    # The lowest, then leftmost, center of a circle touching two of the walls and placed circles, None if full
+    low = np.full(2, margin + radius)
+    high = np.asarray(bed_size, dtype=float) - margin - radius
+    if (low > high + 1e-9).any():
+        return None
+    reach = radii + radius + spacing
+    candidates = [np.array([[low[0], low[1]], [high[0], low[1]], [low[0], high[1]], [high[0], high[1]]])]
+    for axis in range(2):
+        other = 1 - axis
+        for wall in (low[axis], high[axis]):
+            # Touching a wall and a circle
+            offset = np.sqrt(np.maximum(reach**2 - (wall - centers[:, axis])**2, 0))
+            for sign in (-1, 1):
+                points = np.empty((len(centers), 2))
+                points[:, axis] = wall
+                points[:, other] = centers[:, other] + sign*offset
+                candidates.append(points)
+    if len(centers) > 1:
+        # Touching two circles, at the intersections of the circles they may not reach into
+        i, j = np.triu_indices(len(centers), 1)
+        delta = centers[j] - centers[i]
+        distance = np.maximum(np.hypot(delta[:, 0], delta[:, 1]), 1e-12)
+        along = (reach[i]**2 - reach[j]**2 + distance**2)/(2*distance)
+        across = np.sqrt(np.maximum(reach[i]**2 - along**2, 0))
+        middle = centers[i] + delta*(along/distance)[:, None]
+        normal = np.stack([-delta[:, 1], delta[:, 0]], axis=1)/distance[:, None]
+        candidates += [middle + normal*across[:, None], middle - normal*across[:, None]]
+    candidates = np.concatenate(candidates)
+    inside = ((candidates >= low - 1e-9) & (candidates <= high + 1e-9)).all(axis=1)
+    candidates = candidates[inside]
+    if len(centers):
+        gaps = np.linalg.norm(candidates[:, None] - centers[None], axis=2) - reach[None]
+        candidates = candidates[(gaps >= -1e-6).all(axis=1)]
+    if not len(candidates):
+        return None
+    return candidates[np.lexsort((candidates[:, 0], np.round(candidates[:, 1], 6)))[0]]
+
+def plate_triangles(plate: Plate, stl_files: dict[str, str]):
+    '''The triangles of all parts of a plate, each part moved onto the bed at its center'''
+    meshes = []
+    for name, center in zip(plate.names, plate.centers):
+        triangles = read_stl(stl_files[name])
+        points = triangles.reshape(-1, 3)
+        low, high = points.min(axis=0), points.max(axis=0)
+        offset = np.array([center[0] - (low[0] + high[0])/2, center[1] - (low[1] + high[1])/2, -low[2]])
+        meshes.append(triangles + offset.astype(np.float32))
+    return np.concatenate(meshes)
+
+def write_plates(plates, stl_files: dict[str, str], output_dir: str = ".", formats=(".stl",)):
+    '''Write every plate as one mesh in each format, and plates.csv listing the parts and their centers.
+
+    Returns the files of every plate, by suffix.
+    '''
+    from muffler_mesh import distinct_faces, weld
+    os.makedirs(output_dir, exist_ok=True)
+    files = []
+    for index, plate in enumerate(plates, 1):
+        triangles = plate_triangles(plate, stl_files)
+        plate_files = output_files(f"plate-{index}-{plate.material}", output_dir, formats)
+        if ".stl" in plate_files:
+            write_binary_stl(triangles, plate_files[".stl"], f"Plate {index} of {len(plates)}".encode())
+        indexed = {suffix: file_path for suffix, file_path in plate_files.items() if suffix in INDEXED_WRITERS}
+        if indexed:
+            vertices, faces = weld(triangles)
+            faces = distinct_faces(faces)
+            for suffix, file_path in indexed.items():
+                INDEXED_WRITERS[suffix](vertices, faces, file_path)
+        files.append(plate_files)
+    with open(os.path.join(output_dir, "plates.csv"), "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["plate", "material", "variant", "x", "y", "radius"])
+        for index, plate in enumerate(plates, 1):
+            for name, (x, y), radius in zip(plate.names, plate.centers, plate.radii):
+                writer.writerow([index, plate.material, name, f"{x:.2f}", f"{y:.2f}", f"{radius:.2f}"])
+    return files
+
+def parse_order(item: str):
+    '''An order item "NAME[:COUNT]" as (name, count)'''
+    name, _, count = item.partition(":")
+    if not count:
+        return name, 1
+    if not count.isdigit() or int(count) < 1:
+        raise argparse.ArgumentTypeError(f"invalid count in {item!r}")
+    return name, int(count)
+
+def parse_bed(value: str):
+    '''A bed size "WIDTHxDEPTH" in mm as (width, depth)'''
+    try:
+        width, depth = map(float, value.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid bed size {value!r}, expected e.g. 256x256") from None
+    return width, depth
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pack the muffler parts of an order onto build plates.")
+    parser.add_argument("order", nargs="+", type=parse_order, metavar="NAME[:COUNT]",
+                        help="kits (see muffler_kit.py --list) or names or glob patterns of variants, "
+                             "each with a count (default: 1)")
+    parser.add_argument("-o", "--output-dir", default=".", help="folder of the plates (default: current folder)")
+    parser.add_argument("--bed", type=parse_bed, default=BED_SIZE, metavar="WIDTHxDEPTH",
+                        help=f"size of the printer bed in mm (default: {BED_SIZE[0]}x{BED_SIZE[1]})")
+    parser.add_argument("--margin", type=float, default=BED_MARGIN,
+                        help=f"distance in mm to the edges of the bed (default: {BED_MARGIN})")
+    parser.add_argument("--spacing", type=float, default=PART_SPACING,
+                        help=f"distance in mm between the parts (default: {PART_SPACING})")
+    parser.add_argument("--material", choices=MATERIALS,
+                        help="print all parts with this filament, onto shared plates (default: TPU O-rings apart)")
+    parser.add_argument("--3mf", dest="three_mf", action="store_true", help="also write every plate as a 3MF file")
+    parser.add_argument("--ply", action="store_true", help="also write every plate as a binary PLY file")
+    parser.add_argument("--from", dest="from_dir", metavar="DIR",
+                        help="use the STL files already exported into this folder instead of building them")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of build processes (default: one per CPU core)")
+    parser.add_argument("--no-cache", action="store_true", help="build every variant, ignoring the cache")
+    parser.add_argument("--list", action="store_true", help="only list the plates and their parts, without meshes")
+    args = parser.parse_args(argv)
+
+    try:
+        names = order_variants(args.order)
+    except KeyError as error:
+        parser.error(f"no kit or variant matches {error}")
+    start = time.perf_counter()
+    try:
+        plates = pack_plates(names, args.bed, args.margin, args.spacing, args.material)
+    except ValueError as error:
+        parser.error(str(error))
+    seconds = time.perf_counter() - start
+    _report(plates, args.bed, args.material)
+    print(f"Packed {len(names)} parts onto {len(plates)} plates in {seconds*1000:.1f} ms")
+    if args.list:
+        return
+
+    formats = (".stl",) + (".3mf",)*args.three_mf + (".ply",)*args.ply
+    variants = list(dict.fromkeys(names))
+    if args.from_dir is not None:
+        stl_files = {name: output_files(name, args.from_dir, (".stl",))[".stl"] for name in variants}
+        missing = [name for name, file_path in stl_files.items() if not os.path.exists(file_path)]
+        if missing:
+            parser.error(f"no STL file of {', '.join(missing)} in {args.from_dir}")
+        _write(plates, stl_files, args.output_dir, formats)
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        build_variants(variants, directory, args.jobs, not args.no_cache, BuildOptions(formats=(".stl",)))
+        _write(plates, {name: output_files(name, directory, (".stl",))[".stl"] for name in variants},
+               args.output_dir, formats)
+
+def _report(plates, bed_size, material: str = None):
+    estimates = estimate_variants(list(dict.fromkeys(name for plate in plates for name in plate.names)), material)
+    for index, plate in enumerate(plates, 1):
+        counts = {}
+        for name in plate.names:
+            counts[name] = counts.get(name, 0) + 1
+        grams = sum(estimates[name].mass for name in plate.names)
+        print(f"plate {index:<3} {plate.material:<4} {len(plate.names):3} parts {plate.fill(bed_size):4.0%} filled "
+              f"{grams:6.1f} g  {', '.join(f'{count}x {name}' for name, count in counts.items())}")
+
+def _write(plates, stl_files: dict[str, str], output_dir: str, formats):
+    start = time.perf_counter()
+    files = write_plates(plates, stl_files, output_dir, formats)
+    size = sum(os.path.getsize(file_path) for plate_files in files for file_path in plate_files.values())
+    print(f"Wrote {len(files)} plates ({size/1e6:.1f} MB) into {output_dir} in {time.perf_counter() - start:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+'''Tessellation quality profiles for the STL export.
+
+A profile sets the linear and angular deflection of the STL meshes. It can
+override them per kind of solid ("revolved" solids made of planes, cylinders,
+cones and tori, or "swept" solids such as threads and mesh strands), per part
+builder, or both ("<builder>/<kind>"). Overrides work per solid, since solids
+meshed with different settings stay watertight, unlike faces of one solid.
+'''
+import os
+import time
+from dataclasses import dataclass, field
+
+from muffler_trace import span, tracing_enabled, triangle_count
+
+@dataclass(frozen=True)
+class MeshQuality:
+    tolerance: float
+    '''Linear deflection, relative to the size of each edge (as build123d's export_stl)'''
+    angular_tolerance: float
+    '''Angular deflection, in radians'''
+
+@dataclass(frozen=True)
+class QualityProfile:
+    default: MeshQuality
+    '''Quality of all solids without an override'''
+    overrides: dict[str, MeshQuality] = field(default_factory=dict)
+    '''Quality by "<builder>/<kind>", "<builder>" or "<kind>", in that order of precedence'''
+
+    def quality(self, builder: str, kind: str):
+        '''The quality of a solid of the given kind, in a part made by the given builder'''
+        for key in (f"{builder}/{kind}", builder, kind):
+            if key in self.overrides:
+                return self.overrides[key]
+        return self.default
+
+QUALITY_PROFILES = {
+    "draft": QualityProfile(MeshQuality(0.01, 0.5),
+                            # Keep threads fine enough to still screw together
+                            {"swept": MeshQuality(0.005, 0.25)}),
+    "print": QualityProfile(MeshQuality(1e-3, 0.1)), # build123d's defaults, used for the published files
+    "archive": QualityProfile(MeshQuality(2e-4, 0.05)),
+}
+'''The named quality profiles'''
+
+DEFAULT_PROFILE = "print"
+
+@dataclass
+class StlStats:
+    triangles: int
+    '''Number of triangles in the STL file'''
+    bytes: int
+    '''Size of the STL file'''
+    seconds: float
+    '''Time spent tessellating and writing the file'''
+
+@dataclass
+class IndexedStats:
+    vertices: int
+    '''Number of distinct vertices in the file, None if copied from the cache'''
+    bytes: int
+    '''Size of the file'''
+    seconds: float
+    '''Time spent welding the vertices and writing the file'''
+
+def solid_kind(solid):
+    '''"swept" for solids with free-form (B-spline) faces, otherwise "revolved"'''
+    from build123d import GeomType
+    analytic = {GeomType.PLANE, GeomType.CYLINDER, GeomType.CONE, GeomType.SPHERE,
+                GeomType.TORUS, GeomType.REVOLUTION}
+    return "revolved" if all(face.geom_type in analytic for face in solid.faces()) else "swept"
+
+def export_stl(part, file_path: str, builder: str, profile: QualityProfile):
+    '''Export a part as binary STL, meshing each solid with the quality of the profile'''
+    from OCP.BRepMesh import BRepMesh_IncrementalMesh
+    from OCP.BRepTools import BRepTools
+    from OCP.StlAPI import StlAPI_Writer
+    start = time.perf_counter()
+    # Shared (memoized) sub-geometry may still carry the triangulation of an
+    # earlier export, remove it so the STL does not depend on what was built before
+    BRepTools.Clean_s(part.wrapped)
+    solids = part.solids()
+    qualities = [profile.quality(builder, solid_kind(solid)) for solid in solids]
+    if len(set(qualities)) == 1:
+        # Same as build123d's export_stl
+        solids, qualities = [part], qualities[:1]
+    with span("tessellate") as counts:
+        for solid, quality in zip(solids, qualities):
+            BRepMesh_IncrementalMesh(solid.wrapped, quality.tolerance, True, quality.angular_tolerance, True)
+        if tracing_enabled():
+            counts["triangles"] = triangle_count(part)
+    with span("write stl"):
+        writer = StlAPI_Writer()
+        writer.ASCIIMode = False
+        writer.Write(part.wrapped, str(file_path))
+    return stl_stats(file_path, time.perf_counter() - start)
+
+def stl_stats(file_path: str, seconds: float = 0.0):
+    '''The statistics of a binary STL file'''
+    size = os.path.getsize(file_path)
+    return StlStats((size - 84)//50, size, seconds)
+
+def export_indexed(triangles, files: dict[str, str]):
+    '''Weld the triangles of a tessellated part once, and write them as indexed meshes into the files, by suffix.
+
+    Returns the statistics of every file, by suffix.
+    '''
+    from muffler_mesh import INDEXED_WRITERS, distinct_faces, weld
+    start = time.perf_counter()
+    with span("weld") as counts:
+        vertices, faces = weld(triangles)
+        faces = distinct_faces(faces)
+        counts["vertices"] = len(vertices)
+    weld_seconds = time.perf_counter() - start
+    stats = {}
+    for suffix, file_path in files.items():
+        start = time.perf_counter()
+        with span(f"write {suffix[1:]}"):
+            INDEXED_WRITERS[suffix](vertices, faces, file_path)
+        stats[suffix] = IndexedStats(len(vertices), os.path.getsize(file_path),
+                                     weld_seconds + time.perf_counter() - start)
+    return stats
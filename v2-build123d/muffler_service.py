@@ -0,0 +1,275 @@
+'''Local HTTP service generating parts with custom parameters on demand.
+
+    GET /                                    the part builders, their parameters and the constants (JSON)
+    GET /<builder>.<stl|step>?<parameters>   the exported part
+
+The parameters are the arguments of the builder, the constants of the model to
+override (in upper case) and optionally the STL quality profile, e.g.
+    curl -o body.stl "http://localhost:8000/body_male.stl?muffler_o_ring_inner_diameter=50&muffler_length=100&CONNECTOR_MALE_OUTER_DIAMETER=23"
+
+Builds run on a bounded pool of worker processes, which import build123d once
+and stay warm. Concurrent identical requests share one build, and recent
+results are kept in memory and in the on-disk cache of muffler_cache. When a
+worker crashes (an OCCT segfault or running out of memory), its requests are
+answered with 503 and the pool is replaced.
+'''
+import argparse
+import inspect
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, dataclass
+from functools import partial
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qsl, urlsplit
+
+from muffler_build import INDEXED_FORMATS, MESH_FORMATS, MODEL_PATH, build_timestamp, load_model
+from muffler_cache import ArtifactCache, variant_key
+from muffler_deps import ModelDependencies, constant_names
+from muffler_params import parse_value
+from muffler_quality import DEFAULT_PROFILE, QUALITY_PROFILES, export_indexed, export_stl
+
+DEFAULT_MEMORY_CACHE_BYTES = 256*1024**2
+'''Size of the in-memory cache of recent results, least recently used are dropped above this'''
+
+CONTENT_TYPES = {".stl": "model/stl", ".step": "model/step", ".3mf": "model/3mf", ".ply": "application/x-ply"}
+
+class ServiceBusy(Exception):
+    '''Too many builds are pending, the request should be retried later'''
+
+@dataclass(frozen=True)
+class PartRequest:
+    builder: str
+    '''Name of the part builder, e.g. "body_male"'''
+    arguments: tuple[tuple[str, object], ...]
+    '''Arguments of the builder, sorted by name'''
+    constants: tuple[tuple[str, object], ...] = ()
+    '''Overridden constants of the model, sorted by name'''
+    suffix: str = ".stl"
+    '''Format of the exported file'''
+    quality: str = DEFAULT_PROFILE
+    '''Name of the STL quality profile, also used for the other mesh formats'''
+
+def build_part(request: PartRequest, key: str, cache: ArtifactCache = None):
+    '''Build and export a requested part in a worker process, returning the file content'''
+    from build123d import export_step
+    from muffler_mesh import read_stl
+    model = load_model(dict(request.constants))
+    part = getattr(model, request.builder)(**dict(request.arguments))
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, "part" + request.suffix)
+        if request.suffix in MESH_FORMATS:
+            stl_file = os.path.join(directory, "part.stl")
+            export_stl(part, stl_file, request.builder, QUALITY_PROFILES[request.quality])
+            if request.suffix in INDEXED_FORMATS:
+                export_indexed(read_stl(stl_file), {request.suffix: file_path})
+        else:
+            export_step(part, file_path, timestamp=build_timestamp())
+        if cache is not None:
+            cache.store(key, {request.suffix: file_path})
+        return Path(file_path).read_bytes()
+
+class PartService:
+    '''Builds requested parts on a process pool, sharing identical builds and caching the results'''
+
+    def __init__(self, workers: int = None, max_pending: int = None, cache: ArtifactCache = None,
+                 memory_bytes: int = DEFAULT_MEMORY_CACHE_BYTES):
+        self.model = load_model()
+        source = MODEL_PATH.read_text()
+        self.dependencies = ModelDependencies(source)
+        self.constants = constant_names(source)
+        self.builders = {variant.func.__name__: inspect.signature(variant.func)
+                         for variant in self.model.VARIANTS.values()}
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = self._new_pool()
+        self.max_pending = max_pending or 4*self.workers
+        self.cache = cache
+        self.memory_bytes = memory_bytes
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def parse(self, builder: str, suffix: str, parameters: dict[str, str]):
+        '''The request for a builder and format, with its parameters from a query string.
+
+        Raises KeyError for an unknown builder and ValueError for invalid parameters.
+        '''
+        if builder not in self.builders:
+            raise KeyError(builder)
+        if suffix not in CONTENT_TYPES:
+            raise ValueError(f"Unknown format {suffix!r}, use {', '.join(CONTENT_TYPES)}")
+        parameters = dict(parameters)
+        quality = parameters.pop("quality", DEFAULT_PROFILE)
+        if quality not in QUALITY_PROFILES:
+            raise ValueError(f"Unknown quality {quality!r}, use {', '.join(QUALITY_PROFILES)}")
+        constants = {name: parse_value(value) for name, value in parameters.items() if name.isupper()}
+        unknown = set(constants) - set(self.constants)
+        if unknown:
+            raise ValueError(f"Unknown constants: {', '.join(sorted(unknown))}")
+        arguments = {name: parse_value(value) for name, value in parameters.items() if not name.isupper()}
+        try:
+            self.builders[builder].bind(**arguments)
+        except TypeError as error:
+            raise ValueError(f"Invalid arguments for {builder}: {error}") from None
+        return PartRequest(builder, tuple(sorted(arguments.items())), tuple(sorted(constants.items())),
+                           suffix, quality)
+
+    def key(self, request: PartRequest):
+        '''The cache key of a request'''
+        options = {"constants": dict(request.constants), "format": request.suffix}
+        if request.suffix in MESH_FORMATS:
+            options["quality"] = asdict(QUALITY_PROFILES[request.quality])
+        return variant_key(self.dependencies, partial(getattr(self.model, request.builder), **dict(request.arguments)),
+                           options=options)
+
+    def get(self, request: PartRequest):
+        '''The exported file of a request, and where it came from ("memory", "disk", "shared" or "built").
+
+        Raises ServiceBusy when too many builds are pending, and BrokenProcessPool
+        when a worker crashed, the pool being replaced for the next requests.
+        '''
+        key = self.key(request)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key], "memory"
+        content = self.cache.read(key, request.suffix) if self.cache is not None else None
+        if content is not None:
+            self._remember(key, content)
+            return content, "disk"
+        with self._lock:
+            pending = self._pending.get(key)
+            source = "shared" if pending is not None else "built"
+            if pending is None:
+                if len(self._pending) >= self.max_pending:
+                    raise ServiceBusy()
+                try:
+                    job = self.pool.submit(build_part, request, key, self.cache)
+                except BrokenProcessPool: # An idle worker crashed, no build was lost
+                    self._replace_pool(self.pool)
+                    job = self.pool.submit(build_part, request, key, self.cache)
+                pending = self._pending[key] = job, self.pool
+        job, pool = pending
+        if source == "built":
+            # Outside of the lock, as a job already done calls it right away
+            job.add_done_callback(partial(self._finished, key))
+        try:
+            return job.result(), source
+        except BrokenProcessPool:
+            with self._lock:
+                self._replace_pool(pool)
+            raise
+
+    def _new_pool(self):
+        # Import build123d and load the model once per worker, not per request
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=load_model)
+
+    def _replace_pool(self, pool: ProcessPoolExecutor):
+        # A crashed worker breaks the whole pool, replace it once for all requests that were using it. Holding the lock
+        if self.pool is pool:
+            self.pool = self._new_pool()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _finished(self, key: str, job):
+        with self._lock:
+            self._pending.pop(key, None)
+        if job.exception() is None:
+            self._remember(key, job.result())
+
+    def _remember(self, key: str, content: bytes):
+        with self._lock:
+            self._memory[key] = content
+            self._memory.move_to_end(key)
+            while sum(len(content) for content in self._memory.values()) > self.memory_bytes and len(self._memory) > 1:
+                self._memory.popitem(last=False)
+
+    def index(self):
+        '''The builders with their parameters, and the constants with their values'''
+        def default(parameter):
+            return None if parameter.default is inspect.Parameter.empty else parameter.default
+        return {
+            "builders": {builder: {name: default(parameter) for name, parameter in signature.parameters.items()}
+                         for builder, signature in self.builders.items()},
+            "constants": {name: getattr(self.model, name) for name in self.constants},
+            "formats": list(CONTENT_TYPES),
+            "qualities": list(QUALITY_PROFILES),
+        }
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "SilentNightMuffler/2"
+
+    def do_GET(self):
+        service: PartService = self.server.service
+        url = urlsplit(self.path)
+        if url.path == "/":
+            return self._send(HTTPStatus.OK, "application/json", json.dumps(service.index(), indent=1).encode())
+        builder, suffix = os.path.splitext(url.path.lstrip("/"))
+        start = time.perf_counter()
+        try:
+            request = service.parse(builder, suffix, dict(parse_qsl(url.query)))
+        except KeyError as error:
+            return self._send(HTTPStatus.NOT_FOUND, "text/plain", f"Unknown part builder {error}\n".encode())
+        except ValueError as error:
+            return self._send(HTTPStatus.BAD_REQUEST, "text/plain", f"{error}\n".encode())
+        try:
+            content, source = service.get(request)
+        except ServiceBusy:
+            return self._send(HTTPStatus.SERVICE_UNAVAILABLE, "text/plain", b"Too many pending builds, retry later\n",
+                              {"Retry-After": "10"})
+        except BrokenProcessPool:
+            return self._send(HTTPStatus.SERVICE_UNAVAILABLE, "text/plain", b"A build process crashed, retry later\n",
+                              {"Retry-After": "10"})
+        except Exception as error: # Failed build, e.g. invalid geometry for the parameters
+            return self._send(HTTPStatus.UNPROCESSABLE_ENTITY, "text/plain", f"Build failed: {error}\n".encode())
+        self.log_message("%s %s in %.2fs", source, builder + suffix, time.perf_counter() - start)
+        self._send(HTTPStatus.OK, CONTENT_TYPES[suffix], content,
+                   {"Content-Disposition": f'attachment; filename="v2-{builder.replace("_", "-")}{suffix}"',
+                    "X-Muffler-Source": source})
+
+    def _send(self, status: HTTPStatus, content_type: str, content: bytes, headers: dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve The Silent Night CPAP muffler parts with custom parameters.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000, help="port to listen on (default: 8000)")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of build processes (default: one per core)")
+    parser.add_argument("--max-pending", type=int, default=None,
+                        help="pending builds before requests are refused (default: 4 per build process)")
+    parser.add_argument("--memory-cache-mb", type=int, default=DEFAULT_MEMORY_CACHE_BYTES//1024**2,
+                        help=f"size of the in-memory cache (default: {DEFAULT_MEMORY_CACHE_BYTES//1024**2})")
+    parser.add_argument("--no-cache", action="store_true", help="do not use the on-disk cache")
+    args = parser.parse_args(argv)
+
+    service = PartService(args.jobs, args.max_pending, None if args.no_cache else ArtifactCache(),
+                          args.memory_cache_mb*1024**2)
+    server = ThreadingHTTPServer((args.host, args.port), _Handler)
+    server.service = service
+    print(f"Serving on http://{args.host}:{server.server_address[1]}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+if __name__ == "__main__":
+    main()
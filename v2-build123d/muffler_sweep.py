@@ -0,0 +1,322 @@
+'''Parameter sweeps over the part builders, e.g. fit-test matrices of the threads.
+
+A sweep takes lists or ranges of builder arguments and model constants, e.g.
+the O-ring inner diameter, muffler length, TOLERANCE, female O-ring thickness
+and extra thread spacing, and expands them into the jobs of the requested
+parts. A part is only swept over the parameters it depends on, so e.g. the
+O-rings are built once for all tolerances. Jobs are run in batches, one batch
+per process at a time, sorted by constants, diameter and length, so the jobs of
+a batch share the memoized threads, grip cutouts and mesh strands.
+
+Every job is checked by muffler_validate before any geometry is built, and
+jobs that would make broken parts are skipped with the reason. Values are
+comma separated, and an item may be an inclusive range "start:stop:step".
+Examples:
+    python muffler_sweep.py end_cap_male --diameter 47 --tolerance 0.1:0.3:0.01 --stl-only
+    python muffler_sweep.py end_cap_female --diameter 44,47,50 --female-o-ring-thickness 2:2.5:0.25 --extra-spacing false,true
+    python muffler_sweep.py o_ring -D MUFFLER_O_RING_THICKNESS=3.3:3.7:0.1 --diameter 47 --list
+    python muffler_sweep.py --diameter 30:70:0.1 --length 70:150:1 --tolerance 0:1:0.01 --check
+'''
+import argparse
+import csv
+import inspect
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from functools import partial
+from itertools import product
+
+import numpy as np
+
+from muffler_build import (MODEL_PATH, BuildOptions, BuildResult, add_build_arguments, build_options, build_part,
+                           build_timestamp, cached_indexed_stats, load_model, output_files, part_key, report_result,
+                           report_summary)
+from muffler_cache import ArtifactCache
+from muffler_deps import ModelDependencies, constant_names
+from muffler_params import load_params, parse_value
+from muffler_quality import stl_stats
+from muffler_validate import parameter_grid, validate
+
+SWEEP_OPTIONS = {
+    "diameter": "muffler_o_ring_inner_diameter",
+    "length": "muffler_length",
+    "tolerance": "TOLERANCE",
+    "female_o_ring_thickness": "connector_female_o_ring_thickness",
+    "extra_spacing": "threading_extra_spacing_enabled",
+}
+'''The swept parameters having their own command line option, by option name'''
+
+NAME_LABELS = {
+    "muffler_o_ring_inner_diameter": "d",
+    "muffler_length": "l",
+    "connector_female_o_ring_thickness": "t",
+    "threading_extra_spacing_enabled": "extra-spacing",
+    "include_corkscrew": "corkscrew",
+}
+'''Short labels of the builder arguments in the names of the swept parts, other parameters use their own name'''
+
+NAME_DIGITS = 10
+'''Significant digits of the values in the names of the swept parts'''
+
+SWEEP_BATCH_SIZE = 8
+'''Jobs per batch, a batch is built in one process and shares its memoized geometry'''
+
+INDEX_FILE = "sweep.csv"
+'''The table of the swept parts and their parameters, written in the output directory'''
+
+@dataclass(frozen=True)
+class SweepJob:
+    builder: str
+    '''Name of the part builder, e.g. "end_cap_male"'''
+    arguments: tuple[tuple[str, object], ...]
+    '''Arguments of the builder, in the order of its parameters'''
+    constants: tuple[tuple[str, object], ...] = ()
+    '''Overridden constants of the model, sorted by name'''
+
+    @property
+    def name(self):
+        '''The name of the part, from its builder and parameters, e.g. "end-cap-male-d47-tolerance0.15"'''
+        labels = [self.builder.replace("_", "-")]
+        for name, value in self.arguments + self.constants:
+            label = NAME_LABELS.get(name, name.lower().replace("_", "-"))
+            if isinstance(value, bool):
+                if value:
+                    labels.append(label)
+            else:
+                labels.append(f"{label}{value:.{NAME_DIGITS}g}")
+        return "-".join(labels)
+
+def parse_values(text: str):
+    '''The values of a comma separated list, where an item may be an inclusive range "start:stop:step".
+
+    E.g. "44:50:2,53" is [44, 46, 48, 50, 53]. Raises ValueError for invalid values.
+    '''
+    values = []
+    for item in text.split(","):
+        if ":" not in item:
+            values.append(parse_value(item))
+            continue
+        try:
+            start, stop, step = (parse_value(part) for part in item.split(":"))
+        except ValueError:
+            raise ValueError(f"Invalid range {item!r}, use start:stop:step") from None
+        if step <= 0 or stop < start:
+            raise ValueError(f"Invalid range {item!r}, the step must be positive and stop not below start")
+        # Keep the stop value despite float rounding, and round away noise like 0.30000000000000004
+        count = int((stop - start)/step + 1e-9) + 1
+        values.extend(round(start + i*step, 9) for i in range(count))
+    return values
+
+def builder_names():
+    '''The part builders of the model, in the order of VARIANTS'''
+    return list(load_params().BUILDERS)
+
+def expand_sweep(parameters: dict[str, list], builders=None):
+    '''The jobs building every combination of the parameter values with each builder, without duplicates.
+
+    Parameters are builder arguments (lower case) or constants of the model
+    (upper case). A builder is only swept over the parameters it depends on,
+    the others keep their default. Without builders, all builders whose
+    required arguments are given are used. Raises KeyError for an unknown
+    builder or parameter, and ValueError for a builder missing a required
+    argument or jobs with the same name, whose files would overwrite each other.
+    '''
+    source = MODEL_PATH.read_text()
+    dependencies = ModelDependencies(source)
+    signatures = load_params().BUILDERS
+    unknown = [name for name in parameters
+               if name not in constant_names(source)
+               and not any(name in signature.parameters for signature in signatures.values())]
+    if unknown:
+        raise KeyError(", ".join(unknown))
+
+    def missing(builder):
+        return [name for name, parameter in signatures[builder].parameters.items()
+                if parameter.default is inspect.Parameter.empty and name not in parameters]
+    if builders is None:
+        builders = [builder for builder in signatures if not missing(builder)]
+    jobs = {}
+    for builder in builders:
+        if builder not in signatures:
+            raise KeyError(builder)
+        if missing(builder):
+            raise ValueError(f"{builder} needs {', '.join(missing(builder))}")
+        used = {name: values for name, values in parameters.items()
+                if name in signatures[builder].parameters or (name.isupper() and name in dependencies.names(builder))}
+        for values in product(*used.values()):
+            combination = dict(zip(used, values))
+            job = SweepJob(builder,
+                           tuple((name, combination[name]) for name in signatures[builder].parameters
+                                 if name in combination),
+                           tuple(sorted((name, value) for name, value in combination.items() if name.isupper())))
+            jobs[job] = None
+    names = {}
+    for job in jobs:
+        if names.setdefault(job.name, job) != job:
+            raise ValueError(f"Several parts would be named {job.name}, "
+                             f"their values only differ beyond {NAME_DIGITS} significant digits")
+    return list(jobs)
+
+def invalid_jobs(jobs):
+    '''The reasons why jobs would make broken parts, by job, checked with NumPy for all jobs of a builder at once'''
+    invalid = {}
+    for builder in dict.fromkeys(job.builder for job in jobs):
+        group = [job for job in jobs if job.builder == builder]
+        parameters = [dict(job.arguments + job.constants) for job in group]
+        validation = validate({name: [values[name] for values in parameters] for name in parameters[0]}, [builder])
+        for index in np.flatnonzero(~validation.valid):
+            invalid[group[index]] = validation.reasons(index)
+    return invalid
+
+def sweep_batches(jobs, batch_size: int = SWEEP_BATCH_SIZE):
+    '''The jobs in batches, sorted so that the jobs of a batch share their model and sub-geometry'''
+    def order(job: SweepJob):
+        arguments = dict(job.arguments)
+        return (job.constants, job.builder,
+                arguments.get("muffler_o_ring_inner_diameter", 0), arguments.get("muffler_length", 0), job.arguments)
+    jobs = sorted(jobs, key=order)
+    return [jobs[i:i+batch_size] for i in range(0, len(jobs), batch_size)]
+
+def sweep_keys(jobs, options: BuildOptions = BuildOptions()):
+    '''The cache key of each job'''
+    model = load_model()
+    dependencies = ModelDependencies(MODEL_PATH.read_text())
+    return {job: part_key(dependencies, model, partial(getattr(model, job.builder), **dict(job.arguments)),
+                          options, dict(job.constants))
+            for job in jobs}
+
+def build_job(job: SweepJob, output_dir: str = ".", timestamp: str = None, cache: ArtifactCache = None,
+              key: str = None, options: BuildOptions = BuildOptions()):
+    '''Build one job of a sweep and export it into output_dir, storing the files in the cache'''
+    model = load_model(dict(job.constants))
+    variant = partial(getattr(model, job.builder), **dict(job.arguments))
+    return build_part(job.name, model, variant, output_files(job.name, output_dir, options.formats),
+                      timestamp, cache, key, options)
+
+def build_batch(jobs, output_dir: str = ".", timestamp: str = None, cache: ArtifactCache = None,
+                keys: dict = None, options: BuildOptions = BuildOptions()):
+    '''Build the jobs of a batch one after the other in this process'''
+    return [build_job(job, output_dir, timestamp, cache, (keys or {}).get(job), options) for job in jobs]
+
+def stream_sweep(jobs, output_dir: str = ".", workers: int = None, use_cache: bool = True,
+                 options: BuildOptions = BuildOptions(), batch_size: int = SWEEP_BATCH_SIZE):
+    '''Build and export all jobs of a sweep, yielding the results of each batch as soon as it is done.
+
+    As muffler_build.stream_variants, but the jobs run in batches.
+    '''
+    output_dir = os.path.abspath(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    timestamp = build_timestamp()
+    cache = ArtifactCache() if use_cache else None
+    keys = sweep_keys(jobs, options) if use_cache else {}
+    pending = []
+    for job in jobs:
+        copy_start = time.perf_counter()
+        files = output_files(job.name, output_dir, options.formats)
+        if cache is not None and options.trace_file is None and cache.fetch(keys[job], files):
+            stl = stl_stats(files[".stl"]) if ".stl" in files else None
+            yield BuildResult(job.name, time.perf_counter() - copy_start, list(files.values()), cached=True, stl=stl,
+                              indexed=cached_indexed_stats(files))
+        else:
+            pending.append(job)
+    batches = sweep_batches(pending, batch_size)
+    workers = min(workers or os.cpu_count() or 1, len(batches) or 1)
+    if workers == 1:
+        for batch in batches:
+            yield from build_batch(batch, output_dir, timestamp, cache, keys, options)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(build_batch, batch, output_dir, timestamp, cache,
+                                   {job: keys.get(job) for job in batch}, options)
+                       for batch in batches]
+            for future in as_completed(futures):
+                yield from future.result()
+
+def write_index(jobs, file_path: str):
+    '''Write the table of the swept parts, one row per part with its builder and parameters'''
+    columns = list(dict.fromkeys(name for job in jobs for name, _ in job.arguments + job.constants))
+    with open(file_path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["name", "builder"] + columns)
+        for job in jobs:
+            parameters = dict(job.arguments + job.constants)
+            writer.writerow([job.name, job.builder] + [parameters.get(column, "") for column in columns])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build The Silent Night CPAP muffler parts over ranges of parameters.")
+    parser.add_argument("builders", nargs="*", metavar="BUILDER",
+                        help=f"part builders to sweep, of {', '.join(builder_names())} "
+                             "(default: all having their required parameters)")
+    for option, parameter in SWEEP_OPTIONS.items():
+        parser.add_argument("--" + option.replace("_", "-"), metavar="VALUES",
+                            help=f"values of {parameter}, e.g. 1,2,3 or 1:3:0.5")
+    parser.add_argument("-D", "--parameter", action="append", default=[], metavar="NAME=VALUES",
+                        help="values of any other builder argument or constant of the model, e.g. "
+                             "CONNECTOR_MALE_OUTER_DIAMETER=22.5:23.5:0.25")
+    parser.add_argument("--list", action="store_true", help="list the parts of the sweep instead of building them")
+    parser.add_argument("--check", action="store_true",
+                        help="only check the dimensions of every combination of the values, without building")
+    parser.add_argument("--no-validate", action="store_true",
+                        help="also build the parts failing the dimension checks")
+    parser.add_argument("--batch-size", type=int, default=SWEEP_BATCH_SIZE,
+                        help=f"parts built one after the other by one process (default: {SWEEP_BATCH_SIZE})")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of parallel build processes (default: one per core)")
+    parser.add_argument("-o", "--output-dir", default=".",
+                        help=f"directory of the exported files and {INDEX_FILE} (default: current directory)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="rebuild all parts instead of copying unchanged ones from the cache")
+    add_build_arguments(parser)
+    args = parser.parse_args(argv)
+
+    parameters = {}
+    try:
+        for option, parameter in SWEEP_OPTIONS.items():
+            if getattr(args, option) is not None:
+                parameters[parameter] = parse_values(getattr(args, option))
+        for text in args.parameter:
+            name, separator, values = text.partition("=")
+            if not separator:
+                parser.error(f"invalid parameter {text!r}, use NAME=VALUES")
+            parameters[name] = parse_values(values)
+        if args.check:
+            sys.exit(_check(parameters, args.builders or None))
+        jobs = expand_sweep(parameters, args.builders or None)
+    except KeyError as error:
+        parser.error(f"unknown builder or parameter {error}")
+    except ValueError as error:
+        parser.error(str(error))
+    if not jobs:
+        parser.error("no builder has all its required parameters, e.g. --diameter")
+    if not args.no_validate:
+        invalid = invalid_jobs(jobs)
+        for job, reasons in invalid.items():
+            print(f"Skipping {job.name}: {'; '.join(reasons)}")
+        jobs = [job for job in jobs if job not in invalid]
+    if args.list:
+        print("\n".join(job.name for job in jobs))
+        print(f"{len(jobs)} parts")
+        return
+    options = build_options(args)
+    start = time.perf_counter()
+    results = [report_result(result) for result in
+               stream_sweep(jobs, args.output_dir, args.jobs, not args.no_cache, options, args.batch_size)]
+    report_summary(results, time.perf_counter() - start, args.jobs, options)
+    write_index(jobs, os.path.join(args.output_dir, INDEX_FILE))
+
+def _check(parameters: dict[str, list], builders):
+    start = time.perf_counter()
+    points = parameter_grid(parameters)
+    validation = validate(points, builders)
+    valid = validation.valid
+    print(f"{len(valid)} combinations checked in {time.perf_counter() - start:.3f}s, {valid.sum()} valid")
+    for reason, count in validation.failures().items():
+        index = np.flatnonzero(validation.margins[reason] < 0)[0]
+        example = ", ".join(f"{name}={values[index]:g}" for name, values in points.items())
+        print(f"{count:10} {reason}, e.g. {example}")
+    return 0 if valid.all() else 1
+
+if __name__ == "__main__":
+    main()
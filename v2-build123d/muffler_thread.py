@@ -0,0 +1,77 @@
+'''A lighter ISO thread than bd_warehouse IsoThread, swept along a helix.
+
+The ISO profile of IsoThread (its 5/8 H height, and the apex and root widths
+of external and internal threads) is swept along a helix with OCCT's pipe
+shell. The ends fade like those of IsoThread, the profile shrinking linearly
+towards its root over a quarter turn, but with a scaling law of the sweep
+instead of a loft. The thread is a compound of the two faded ends and the
+middle, touching each other, so no boolean operation is needed either.
+'''
+from math import sqrt
+
+FADE_TURNS = 0.25
+'''Turns over which each end of the thread fades, as IsoThread'''
+
+FADE_SCALE = 1/11
+'''Scale of the profile at both ends of the thread, as IsoThread'''
+
+def thread_profile(major_diameter: float, pitch: float, external: bool):
+    '''The root radius, apex radius, root width and apex width of the ISO profile, as IsoThread'''
+    height = 5*sqrt(3)/2*pitch/8
+    if external:
+        return major_diameter/2 - height, major_diameter/2, 3*pitch/4, pitch/8
+    return major_diameter/2, major_diameter/2 - height, 7*pitch/8, pitch/4
+
+def swept_iso_thread(major_diameter: float, pitch: float, length: float, external: bool = True):
+    '''A right-hand ISO thread with faded ends, within z=0 and z=length, as IsoThread with interference=0'''
+    from build123d import Compound, Helix, Plane, Polygon, Pos, Rot
+    root_radius, apex_radius, root_width, apex_width = thread_profile(major_diameter, pitch, external)
+    profile = Plane.XZ * Polygon((root_radius, -root_width/2), (apex_radius, -apex_width/2),
+                                 (apex_radius, apex_width/2), (root_radius, root_width/2))
+    # The full profile starts after the faded end, at the bottom of the thread
+    start = root_width/2 - FADE_TURNS*pitch
+    turns = (length - 2*start)/pitch
+    if turns < 2*FADE_TURNS:
+        raise ValueError(f"A thread of pitch {pitch} needs to be longer than {length}")
+
+    def piece(first_turn: float, last_turn: float, first_scale: float, last_scale: float):
+        location = Rot(Z=360*first_turn) * Pos(0, 0, start + first_turn*pitch)
+        helix = location * Helix(pitch, (last_turn - first_turn)*pitch, root_radius)
+        return _scaled_sweep(location * profile, helix, first_scale, last_scale)
+    return Compound([piece(0, FADE_TURNS, FADE_SCALE, 1),
+                     piece(FADE_TURNS, turns - FADE_TURNS, 1, 1),
+                     piece(turns - FADE_TURNS, turns, 1, FADE_SCALE)])
+
+def _scaled_sweep(profile, path, first_scale: float, last_scale: float):
+    # Sweep the profile along the path, scaled linearly about the start of the path
+    from build123d import Solid, Wire
+    from OCP.BRepOffsetAPI import BRepOffsetAPI_MakePipeShell
+    from OCP.Law import Law_Linear
+    law = Law_Linear()
+    law.Set(0, first_scale, 1, last_scale)
+    maker = BRepOffsetAPI_MakePipeShell(Wire([path]).wrapped)
+    maker.SetMode(True) # Frenet
+    maker.SetLaw(profile.face().outer_wire().wrapped, law, False, False)
+    maker.Build()
+    maker.MakeSolid()
+    return Solid(maker.Shape())
+
+def middle_turn_volume(thread, length: float, pitch: float):
+    '''Volume of one pitch of a thread around its middle, which only depends on its profile'''
+    from build123d import Box, Pos
+    rim = thread.bounding_box().size.X + 2
+    return (thread & Pos(0, 0, length/2) * Box(rim, rim, pitch)).volume
+
+def radial_extent(thread, length: float):
+    '''The smallest and largest distance of a thread to its axis'''
+    from build123d import Edge
+    axis = Edge.make_line((0, 0, -1), (0, 0, length + 1))
+    box = thread.bounding_box()
+    return thread.distance_to(axis), max(box.max.X, -box.min.X, box.max.Y, -box.min.Y)
+
+def mating_clearance(internal, external, pitch: float):
+    '''Smallest gap between an internal and an external thread made by swept_iso_thread, screwed into each other'''
+    from build123d import Pos
+    # Both threads start at angle 0, half their root width above z=0. Center the external teeth between the internal ones
+    internal_root_width, external_root_width = thread_profile(0, pitch, False)[2], thread_profile(0, pitch, True)[2]
+    return internal.distance_to(Pos(0, 0, (internal_root_width - external_root_width)/2 + pitch/2) * external)
@@ -0,0 +1,136 @@
+'''Opt-in tracing of the stages of building and exporting a part.
+
+While tracing, every stage (revolve, extrude, sweep, thread, boolean, compound,
+tessellate, write) is recorded with its wall time, memory, and face or
+triangle count. The trace can be written in the Chrome trace format, to be
+viewed in chrome://tracing or https://ui.perfetto.dev. Without tracing, spans
+cost nothing and the model is left untouched.
+'''
+import functools
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+MODEL_STAGES = {"revolve": "revolve", "extrude": "extrude", "sweep": "sweep",
+                "IsoThread": "thread", "swept_iso_thread": "thread", "Compound": "compound"}
+'''The CAD operations of the model that are traced, by their name in the model, and their stage'''
+
+_events = None
+
+def peak_rss():
+    '''Peak resident memory of this process, in bytes, or None where it cannot be measured'''
+    try:
+        import resource
+    except ImportError: # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak*1024
+
+def current_rss():
+    '''Resident memory of this process, in bytes, or None where it cannot be measured'''
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1])*os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError): # Not Linux
+        return None
+
+def tracing_enabled():
+    return _events is not None
+
+@contextmanager
+def tracing():
+    '''Record the spans of the block, yields the list of trace events'''
+    global _events
+    previous, _events = _events, []
+    try:
+        yield _events
+    finally:
+        _events = previous
+
+@contextmanager
+def span(name: str, **args):
+    '''Trace a stage. Yields its arguments, to which the caller can add counts.'''
+    if _events is None:
+        yield args
+        return
+    events = _events
+    peak_before = peak_rss()
+    timestamp = time.time()
+    start = time.perf_counter()
+    try:
+        yield args
+    finally:
+        seconds = time.perf_counter() - start
+        rss, peak = current_rss(), peak_rss()
+        if rss is not None:
+            args["rss_mb"] = round(rss/2**20, 1)
+        if peak is not None:
+            args["peak_rss_mb"] = round(peak/2**20, 1)
+            args["peak_rss_growth_mb"] = round((peak - peak_before)/2**20, 1)
+        events.append({"name": name, "ph": "X", "ts": timestamp*1e6, "dur": seconds*1e6,
+                       "pid": os.getpid(), "tid": 0, "args": args})
+
+def traced(function, stage: str):
+    '''Wrap a function creating a shape in a span, counting the faces of the shape'''
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with span(stage) as counts:
+            shape = function(*args, **kwargs)
+            if _events is not None and hasattr(shape, "faces"):
+                counts["faces"] = len(shape.faces())
+            return shape
+    return wrapper
+
+def instrument(model):
+    '''Trace the CAD operations of the model, and all boolean operations of build123d.
+
+    Only needed once per process, the wrappers do nothing while not tracing.
+    '''
+    if getattr(model, "_instrumented", False):
+        return
+    for name, stage in MODEL_STAGES.items():
+        setattr(model, name, traced(getattr(model, name), stage))
+    from build123d import Shape
+    bool_op = Shape._bool_op
+
+    @functools.wraps(bool_op)
+    def traced_bool_op(self, args, tools, operation):
+        # e.g. BRepAlgoAPI_Cut, BRepAlgoAPI_Fuse, BRepAlgoAPI_Common
+        stage = type(operation).__name__.removeprefix("BRepAlgoAPI_").lower()
+        with span(stage) as counts:
+            shape = bool_op(self, args, tools, operation)
+            if _events is not None and hasattr(shape, "faces"):
+                counts["faces"] = len(shape.faces())
+            return shape
+    if not hasattr(Shape._bool_op, "__wrapped__"):
+        Shape._bool_op = traced_bool_op
+    model._instrumented = True
+
+def triangle_count(shape):
+    '''Number of triangles of a tessellated shape'''
+    from OCP.BRep import BRep_Tool
+    from OCP.TopLoc import TopLoc_Location
+    count = 0
+    for face in shape.faces():
+        triangulation = BRep_Tool.Triangulation_s(face.wrapped, TopLoc_Location())
+        if triangulation is not None:
+            count += triangulation.NbTriangles()
+    return count
+
+def write_chrome_trace(events, file_path: str):
+    '''Write trace events as a Chrome trace JSON file, naming each process'''
+    metadata = [{"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": f"build process {pid}"}}
+                for pid in sorted({event["pid"] for event in events})]
+    with open(file_path, "w") as file:
+        json.dump({"traceEvents": metadata + list(events), "displayTimeUnit": "ms"}, file)
+
+def stage_totals(events):
+    '''Number of spans, total seconds and largest peak RSS growth of every stage, slowest first'''
+    totals = {}
+    for event in events:
+        count, seconds, growth = totals.get(event["name"], (0, 0.0, 0.0))
+        totals[event["name"]] = (count + 1, seconds + event["dur"]/1e6,
+                                 max(growth, event["args"].get("peak_rss_growth_mb", 0.0)))
+    return dict(sorted(totals.items(), key=lambda item: -item[1][1]))
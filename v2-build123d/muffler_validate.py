@@ -0,0 +1,210 @@
+'''Validation of the derived dimensions of the parts, before building any geometry.
+
+The constants and calculations of the parametric source file are read from its
+syntax tree and evaluated with NumPy, without importing build123d, so a whole
+grid of parameter values is checked at once, in microseconds per point. Each
+check is a clearance or wall thickness of the profiles, as a margin in mm that
+is negative where the part would be broken, e.g. an O-ring slot breaking
+through the wall or an inner mesh tube not fitting through the end cap.
+'''
+import ast
+import functools
+import math
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Callable
+
+import numpy as np
+
+from muffler_params import MODEL_PATH
+
+MIN_WALL_THICKNESS = 0.4
+'''Thinnest wall that still prints, one extrusion width of a 0.4 mm nozzle'''
+
+FUNCTIONS = {"pi": math.pi, "tan": np.tan, "radians": np.radians, "hypot": np.hypot}
+'''The math functions the calculations of the model may use, as NumPy functions'''
+
+GRIPPED_BUILDERS = ("body_male", "end_cap_male", "end_cap_female")
+END_CAP_BUILDERS = ("end_cap_male", "end_cap_female")
+MALE_CONNECTOR_BUILDERS = ("body_male", "end_cap_male")
+
+@dataclass(frozen=True)
+class Check:
+    reason: str
+    '''What is wrong where the check fails'''
+    builders: tuple[str, ...]
+    '''The part builders making the checked feature'''
+    margin: Callable
+    '''The margin in mm of the dimensions (see dimensions), negative where the check fails'''
+
+@functools.lru_cache(maxsize=4)
+def _statements(source: str):
+    return ast.parse(source).body
+
+def argument_defaults(source: str):
+    '''The default values of the arguments of the top-level functions, by argument name.
+
+    NaN for arguments without a numeric default, so the checks using them do not apply.
+    '''
+    defaults = {}
+    for statement in _statements(source):
+        if isinstance(statement, ast.FunctionDef):
+            arguments = statement.args.args
+            values = [None]*(len(arguments) - len(statement.args.defaults)) + statement.args.defaults
+            for argument, default in zip(arguments, values):
+                numeric = isinstance(default, ast.Constant) and isinstance(default.value, (bool, int, float))
+                if numeric:
+                    defaults[argument.arg] = float(default.value)
+                else:
+                    defaults.setdefault(argument.arg, math.nan)
+    return defaults
+
+def model_values(points: dict, source: str = None):
+    '''The constants and calculations of the model evaluated with NumPy, by name.
+
+    Constants in points, and the builder arguments, are replaced by their arrays
+    of values, and the calculations using them are evaluated for every point.
+    Definitions needing build123d (shapes, variants) are left out.
+    '''
+    source = MODEL_PATH.read_text() if source is None else source
+    values = dict(FUNCTIONS)
+    values.update({name: np.asarray(array, dtype=float) for name, array in points.items() if not name.isupper()})
+    for statement in _statements(source):
+        if not (isinstance(statement, ast.Assign) and len(statement.targets) == 1
+                and isinstance(statement.targets[0], ast.Name)):
+            continue
+        name = statement.targets[0].id
+        if name in points:
+            values[name] = np.asarray(points[name], dtype=float)
+            continue
+        names = {node.id for node in ast.walk(statement.value) if isinstance(node, ast.Name)}
+        if names <= values.keys():
+            code = compile(ast.Expression(statement.value), str(MODEL_PATH), "eval")
+            values[name] = eval(code, {"__builtins__": {}}, values)
+    return values
+
+def dimensions(values: dict):
+    '''The model values with the dimensions derived in the profile functions, as attributes'''
+    v = SimpleNamespace(**values)
+    v.diameter = v.muffler_o_ring_inner_diameter
+    v.length = v.muffler_length
+    v.female_o_ring_thickness = v.connector_female_o_ring_thickness
+    v.extra_spacing = v.threading_extra_spacing_enabled*v.THREADING_EXTRA_SPACING_IF_ENABLED
+    v.outer_tube_inner_radius = v.diameter/2 + v.MUFFLER_O_RING_SHIFT
+    v.outer_tube_outer_radius = v.outer_tube_inner_radius + v.BODY_WALL_THICKNESS
+    v.grip_cutout_radius = v.outer_tube_outer_radius*v.GRIP_CUTOUT_RATIO
+    v.o_ring_slot_outer_radius = (v.diameter + v.BODY_WALL_THICKNESS)/2 + v.MUFFLER_O_RING_THICKNESS/2
+    v.insert_inner_radius = (v.outer_tube_inner_radius - v.END_CAP_INSERT_THICKNESS - v.threading_height
+                             - v.extra_spacing)
+    v.inner_tube_slot_radius = v.inner_mesh_tube_outer_radius + v.TOLERANCE
+    v.inner_tube_length = v.length - 2*v.END_CAP_BOTTOM_THICKNESS + 2*v.END_CAP_INNER_TUBE_SLOT_DEPTH
+    v.female_connector_outer_radius = (v.connector_male_outer_radius + v.TOLERANCE
+                                       + v.CONNECTOR_FEMALE_WALL_THICKNESS)
+    # The slot is a triangle twice as long as the O-ring thickness, its tip filleted by half the thickness
+    half_angle = np.arctan(1/2.8)
+    v.female_o_ring_slot_outer_radius = (v.CONNECTOR_FEMALE_O_RING_INNER_DIAMETER/2
+                                         + v.female_o_ring_thickness*(2 - (1/np.sin(half_angle) - 1)/2))
+    return v
+
+CHECKS = (
+    Check("the male connector wall is too thin", MALE_CONNECTOR_BUILDERS,
+          lambda v: v.CONNECTOR_MALE_WALL_THICKNESS - MIN_WALL_THICKNESS),
+    Check("the connector corner radius does not fit the male connector wall", MALE_CONNECTOR_BUILDERS,
+          lambda v: v.CONNECTOR_MALE_WALL_THICKNESS - v.CONNECTOR_CORNER_RADIUS),
+    Check("the connector corner radius does not fit the female connector wall", ("end_cap_female",),
+          lambda v: v.CONNECTOR_FEMALE_WALL_THICKNESS - v.CONNECTOR_CORNER_RADIUS),
+    Check("the female O-ring slot breaks through the connector wall", ("end_cap_female",),
+          lambda v: v.female_connector_outer_radius - v.female_o_ring_slot_outer_radius - MIN_WALL_THICKNESS),
+    Check("the female O-ring slot breaks through the connector end", ("end_cap_female",),
+          lambda v: v.CONNECTOR_LENGTH/5 - v.female_o_ring_thickness/1.4 - MIN_WALL_THICKNESS),
+    Check("the female O-ring does not squeeze the male connector", ("end_cap_female",),
+          lambda v: v.connector_male_outer_radius - v.CONNECTOR_FEMALE_O_RING_INNER_DIAMETER/2),
+    Check("the O-ring slot breaks through the outer wall", GRIPPED_BUILDERS,
+          lambda v: v.outer_tube_outer_radius - v.o_ring_slot_outer_radius - MIN_WALL_THICKNESS),
+    Check("the end cap corner radius does not fit the grip", GRIPPED_BUILDERS,
+          lambda v: v.END_CAP_GRIP_THICKNESS - v.END_CAP_CORNER_RADIUS),
+    Check("the end cap insert is thinner than the thread height", END_CAP_BUILDERS,
+          lambda v: v.END_CAP_INSERT_THICKNESS - v.TOLERANCE - v.threading_height),
+    Check("the inner mesh tube does not fit through the end cap insert", END_CAP_BUILDERS,
+          lambda v: v.insert_inner_radius - v.inner_tube_slot_radius),
+    Check("the inner mesh tube does not fit through the body threads", ("body_male",),
+          lambda v: v.outer_tube_inner_radius - v.threading_height - v.inner_tube_slot_radius),
+    Check("the slot for the inner mesh tube leaves no floor", GRIPPED_BUILDERS,
+          lambda v: v.END_CAP_BOTTOM_THICKNESS - v.END_CAP_INNER_TUBE_SLOT_DEPTH - MIN_WALL_THICKNESS),
+    Check("the body is too short for its threads", ("body_male",),
+          lambda v: v.length - v.END_CAP_GRIP_THICKNESS - v.END_CAP_INSERT_LENGTH - 1 - v.END_CAP_BOTTOM_THICKNESS),
+    Check("the inner mesh tube is shorter than its end rings", ("inner_mesh_tube",),
+          lambda v: v.inner_tube_length - 2*v.INNER_TUBE_MESH_THICKNESS),
+    Check("the grip cutouts overlap", GRIPPED_BUILDERS,
+          lambda v: 2*np.pi*(v.outer_tube_outer_radius + v.grip_cutout_radius)/v.END_CAP_GRIP_CUTOUT_COUNT
+                    - 2*v.grip_cutout_radius),
+    Check("TOLERANCE is negative", GRIPPED_BUILDERS,
+          lambda v: v.TOLERANCE),
+    Check("the printed O-ring is flattened away", ("o_ring",),
+          lambda v: v.MUFFLER_O_RING_THICKNESS - 0.6),
+)
+'''All checks of the derived dimensions'''
+
+@dataclass
+class Validation:
+    points: dict[str, np.ndarray]
+    '''The validated parameter values, one array per parameter'''
+    margins: dict[str, np.ndarray]
+    '''The margin in mm of every check at every point, by reason, NaN where it does not apply'''
+
+    @property
+    def valid(self):
+        '''Whether all checks pass, by point'''
+        valid = np.ones(len(next(iter(self.points.values()), [])), dtype=bool)
+        for margin in self.margins.values():
+            valid &= ~(margin < 0)
+        return valid
+
+    def reasons(self, index: int):
+        '''Why a point is invalid, e.g. ["the O-ring slot breaks through the outer wall (-0.25 mm)"]'''
+        return [f"{reason} ({margin[index]:+.2f} mm)" for reason, margin in self.margins.items() if margin[index] < 0]
+
+    def failures(self):
+        '''The number of failing points, by reason'''
+        return {reason: int(np.count_nonzero(margin < 0)) for reason, margin in self.margins.items()
+                if np.any(margin < 0)}
+
+def parameter_grid(parameters: dict[str, list]):
+    '''Every combination of the parameter values, as one flat array per parameter'''
+    arrays = np.meshgrid(*[np.asarray(values, dtype=float) for values in parameters.values()], indexing="ij")
+    return {name: array.ravel() for name, array in zip(parameters, arrays)}
+
+def default_points(points: dict[str, np.ndarray], source: str = None):
+    '''The points with the builder arguments missing from them at their default.
+
+    Raises KeyError for an unknown constant.
+    '''
+    source = MODEL_PATH.read_text() if source is None else source
+    size = len(next(iter(points.values()), []))
+    unknown = [name for name in points if name.isupper() and not any(
+        isinstance(statement, ast.Assign) and any(isinstance(target, ast.Name) and target.id == name
+                                                  for target in statement.targets)
+        for statement in _statements(source))]
+    if unknown:
+        raise KeyError(", ".join(unknown))
+    arguments = {name: np.full(size, default) for name, default in argument_defaults(source).items()
+                 if name not in points}
+    return {**arguments, **points}
+
+def validate(points: dict[str, np.ndarray], builders=None, source: str = None):
+    '''Check the dimensions of the parts at every point, given as equal length arrays of builder arguments and constants.
+
+    Only the checks of the given builders are made (default: all). Builder
+    arguments missing from points take their default, or make the checks using
+    them not apply. Raises KeyError for an unknown constant.
+    '''
+    source = MODEL_PATH.read_text() if source is None else source
+    size = len(next(iter(points.values()), []))
+    points = {name: np.asarray(values, dtype=float) for name, values in points.items()}
+    v = dimensions(model_values(default_points(points, source), source))
+    margins = {}
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for check in CHECKS:
+            if builders is None or set(check.builders) & set(builders):
+                margins[check.reason] = np.broadcast_to(check.margin(v), (size,)).astype(float)
+    return Validation(points, margins)
@@ -0,0 +1,205 @@
+'''Watch mode: one warm process rebuilding only the variants affected by an edit.
+
+Starting Python and importing OCCT takes seconds, and building every variant
+minutes. The watcher imports the CAD stack and builds once, then polls the
+source file and an optional constants file. After a change, the model is
+loaded again in the same process and the cache key of every variant is
+computed again. As the key hashes the source of all the constants,
+calculations and functions its builder reads (see muffler_deps), only the
+variants whose key changed are rebuilt and exported: the inner mesh tubes
+after an edit of INNER_TUBE_MESH_TWIST_ANGLE, the bodies and end caps after an
+edit of GRIP_CUTOUT_RATIO. The memoized geometry of the functions whose
+dependencies did not change, e.g. the threads, is moved into the new model, so
+it is not built again either, and going back to earlier values copies the
+files from the cache.
+
+The constants file overrides constants of the model, one "NAME = VALUE" per
+line, "#" starting a comment, like the -D options of muffler_cli.
+
+Only the source file and the constants file are watched. The muffler_*
+helper modules, e.g. muffler_lathe or muffler_quality, are imported once,
+and the cache keys hash their source as it was then: restart the watcher
+after editing them.
+
+Examples:
+    python muffler_watch.py --stl-only -o build
+    python muffler_watch.py "inner-mesh-tube-*" --stl-only --3mf -o build
+    python muffler_watch.py --constants-file travel.txt -o build
+'''
+import argparse
+import ast
+import os
+import time
+import traceback
+from dataclasses import dataclass, replace
+from pathlib import Path
+
+from muffler_build import (MODEL_PATH, BuildOptions, add_build_arguments, build_options, build_variants, load_model,
+                           reload_model, select_variants, variant_keys)
+from muffler_deps import ModelDependencies, constant_names, override_constants
+from muffler_params import parse_value
+
+POLL_SECONDS = 0.5
+'''Interval in seconds between two checks of the watched files'''
+
+@dataclass
+class ModelState:
+    model: object
+    '''The loaded model, with the constants replaced'''
+    dependencies: ModelDependencies
+    '''The definitions of the source, with the constants replaced'''
+    keys: dict[str, str]
+    '''The cache key of every watched variant, by name'''
+    mtimes: list[int]
+    '''The modification times of the watched files when they were loaded'''
+
+def read_constants(file_path: str):
+    '''The constants of a constants file by name, one "NAME = VALUE" per line.
+
+    Raises ValueError for an invalid line or a name that is not a constant of the model.
+    '''
+    names = constant_names(MODEL_PATH.read_text())
+    constants = {}
+    for number, line in enumerate(Path(file_path).read_text().splitlines(), 1):
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        name, separator, value = (part.strip() for part in line.partition("="))
+        if not separator or name not in names:
+            raise ValueError(f"{file_path}:{number}: expected NAME = VALUE with a constant of the model")
+        try:
+            constants[name] = parse_value(value)
+        except ValueError:
+            raise ValueError(f"{file_path}:{number}: invalid value of {name}: {value!r}") from None
+    return constants
+
+def changed_definitions(old: ModelDependencies, new: ModelDependencies):
+    '''The top-level names defined differently in two versions of the source'''
+    def source(dependencies: ModelDependencies, name: str):
+        return "\n".join(ast.unparse(statement) for statement in dependencies.definitions.get(name, ()))
+    return sorted(name for name in old.definitions.keys() | new.definitions.keys()
+                  if source(old, name) != source(new, name))
+
+def carry_memos(old_model, new_model, old: ModelDependencies, new: ModelDependencies):
+    '''Move the memoized geometry of the functions with unchanged dependencies into the new model.
+
+    Returns the names of these functions.
+    '''
+    kept = []
+    for name, function in vars(new_model).items():
+        previous = getattr(old_model, name, None)
+        if hasattr(function, "memo") and hasattr(previous, "memo") and old.sources(name) == new.sources(name):
+            function.memo.update(previous.memo)
+            kept.append(name)
+    return kept
+
+class Watcher:
+    '''Keeps the model loaded, and rebuilds the variants whose key changed since their last build'''
+
+    def __init__(self, patterns=(), output_dir: str = ".", options: BuildOptions = BuildOptions(),
+                 constants_file: str = None, use_cache: bool = True):
+        self.patterns = list(patterns)
+        self.output_dir = output_dir
+        self.options = options
+        self.constants_file = constants_file
+        self.use_cache = use_cache
+        self.state: ModelState = None
+
+    def files(self):
+        '''The watched files'''
+        return [MODEL_PATH] + ([Path(self.constants_file)] if self.constants_file else [])
+
+    def load(self):
+        '''The state of the model as the watched files are now, loaded again in this process.
+
+        Raises the errors of reading the constants, loading the model or selecting the variants.
+        '''
+        mtimes = self._mtimes()
+        constants = dict(self.options.constants)
+        if self.constants_file:
+            constants.update(read_constants(self.constants_file))
+        source = MODEL_PATH.read_text()
+        dependencies = ModelDependencies(ast.unparse(override_constants(source, constants)) if constants else source)
+        reload_model()
+        model = load_model(constants)
+        names = list(model.VARIANTS)
+        names = select_variants(self.patterns, names) if self.patterns else names
+        options = replace(self.options, constants=tuple(sorted(constants.items())))
+        return ModelState(model, dependencies, variant_keys(names, options), mtimes), options
+
+    def rebuild(self, loaded=None):
+        '''Load the watched files, and build the variants whose key changed. Returns their build results.
+
+        loaded is a result of load to start from instead of loading again.
+        '''
+        start = time.perf_counter()
+        old = self.state
+        new, options = loaded or self.load()
+        names = [name for name, key in new.keys.items() if old is None or old.keys.get(name) != key]
+        if old is not None:
+            kept = carry_memos(old.model, new.model, old.dependencies, new.dependencies)
+            changed = changed_definitions(old.dependencies, new.dependencies)
+            print(f"Changed {', '.join(changed) or 'nothing'}: rebuilding {len(names)} of {len(new.keys)} variants, "
+                  f"keeping the memo of {', '.join(kept) or 'no function'} "
+                  f"(reloaded in {time.perf_counter() - start:.2f}s)")
+        results = build_variants(names, self.output_dir, 1, self.use_cache, options) if names else []
+        # Only once built, so the variants of a failed build are built again after the next change
+        self.state = new
+        return results
+
+    def run(self, poll_seconds: float = POLL_SECONDS, loaded=None):
+        '''Build the watched variants, then rebuild them after every change of the watched files, until interrupted.
+
+        loaded is a result of load to start from, e.g. the one that validated the arguments, so the model is not
+        loaded twice. Changes since that load are built after the first build.
+        '''
+        loaded = loaded or self.load()
+        self.rebuild(loaded)
+        mtimes = loaded[0].mtimes
+        print(f"Watching {', '.join(path.name for path in self.files())}, press Ctrl+C to stop")
+        while True:
+            time.sleep(poll_seconds)
+            current = self._mtimes()
+            if current == mtimes:
+                continue
+            mtimes = current
+            try:
+                self.rebuild()
+            except Exception: # A broken edit, keep watching for the fix
+                traceback.print_exc()
+                print("Build failed, waiting for the next change")
+
+    def _mtimes(self):
+        return [path.stat().st_mtime_ns if path.exists() else None for path in self.files()]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild the muffler variants affected by every edit of the model.",
+                                     epilog="Edits of the muffler_*.py helper modules are neither watched nor "
+                                            "reloaded, restart the watcher after them.")
+    parser.add_argument("variants", nargs="*", metavar="VARIANT",
+                        help="names or glob patterns of the variants to watch (default: all)")
+    parser.add_argument("-o", "--output-dir", default=".",
+                        help="directory of the exported files (default: current directory)")
+    parser.add_argument("--constants-file", metavar="FILE",
+                        help="watch this file of constants overriding the model, one NAME = VALUE per line")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="build the affected variants instead of copying earlier builds from the cache")
+    add_build_arguments(parser)
+    parser.add_argument("--poll", type=float, default=POLL_SECONDS,
+                        help=f"seconds between two checks of the watched files (default: {POLL_SECONDS})")
+    args = parser.parse_args(argv)
+
+    if args.constants_file and not os.path.isfile(args.constants_file):
+        parser.error(f"no constants file {args.constants_file}")
+    watcher = Watcher(args.variants, args.output_dir, build_options(args), args.constants_file, not args.no_cache)
+    try:
+        loaded = watcher.load()
+    except (KeyError, ValueError) as error:
+        parser.error(f"no variant matches {error}" if isinstance(error, KeyError) else str(error))
+    try:
+        watcher.run(args.poll, loaded)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
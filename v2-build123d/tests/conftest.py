@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The helper modules are imported by their file names, as the source file does
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,86 @@
+import shutil
+from functools import partial
+
+import pytest
+
+import muffler_cache
+from muffler_cache import ArtifactCache, module_sources, variant_key
+from muffler_deps import ModelDependencies
+from muffler_params import MODEL_PATH
+
+def builder(name: str):
+    # A stand-in for a part builder of the model, only its name is keyed
+    def function(*args, **kwargs):
+        pass
+    function.__name__ = name
+    return function
+
+@pytest.fixture(scope="module")
+def dependencies():
+    return ModelDependencies(MODEL_PATH.read_text())
+
+@pytest.fixture
+def edit_module(monkeypatch):
+    # Give a helper module another source hash, as if it was edited
+    read = muffler_cache._module_source
+
+    def edit(module: str):
+        monkeypatch.setattr(muffler_cache, "_module_source",
+                            lambda name: ("edited", read(name)[1]) if name == module else read(name))
+    return edit
+
+def test_module_sources_follow_local_imports():
+    # muffler_lathe imports muffler_quality, which imports muffler_trace and, in a function, muffler_mesh
+    assert list(module_sources(["muffler_lathe", "numpy"])) == ["muffler_lathe", "muffler_mesh", "muffler_quality",
+                                                                "muffler_trace"]
+
+def test_export_module_edit_changes_every_key(dependencies, edit_module):
+    o_ring = partial(builder("o_ring"), 44)
+    key = variant_key(dependencies, o_ring)
+    edit_module("muffler_quality")
+    assert variant_key(dependencies, o_ring) != key
+
+def test_imported_module_edit_changes_the_keys_of_its_users(dependencies, edit_module):
+    o_ring, mesh = partial(builder("o_ring"), 44), ("o_ring_mesh",)
+    keys = variant_key(dependencies, o_ring), variant_key(dependencies, o_ring, mesh)
+    edit_module("muffler_lathe")
+    assert variant_key(dependencies, o_ring) == keys[0]
+    assert variant_key(dependencies, o_ring, mesh) != keys[1]
+
+@pytest.mark.parametrize("builder_name", ["body_male", "end_cap_male", "end_cap_female", "end_cap_male_mesh"])
+def test_thread_engine_edit_changes_the_keys_of_threaded_parts(dependencies, edit_module, builder_name):
+    # threading_body and threading_end_cap sweep the threads with muffler_thread when THREADING_SWEPT is set
+    assert "THREADING_SWEPT" in dependencies.names(builder_name)
+    part = partial(builder(builder_name), 47)
+    key = variant_key(dependencies, part)
+    edit_module("muffler_thread")
+    assert variant_key(dependencies, part) != key
+
+@pytest.mark.parametrize("builder_name", ["o_ring", "inner_mesh_tube"])
+def test_thread_engine_edit_keeps_the_keys_of_other_parts(dependencies, edit_module, builder_name):
+    part = partial(builder(builder_name), 47)
+    key = variant_key(dependencies, part)
+    edit_module("muffler_thread")
+    assert variant_key(dependencies, part) == key
+
+def test_fetch_of_an_entry_evicted_meanwhile(tmp_path, monkeypatch):
+    cache = ArtifactCache(tmp_path/"cache")
+    exported = {suffix: tmp_path/("exported" + suffix) for suffix in (".stl", ".step")}
+    for suffix, file in exported.items():
+        file.write_text("cached" + suffix)
+    cache.store("key", exported)
+    destinations = {suffix: tmp_path/("v2-part" + suffix) for suffix in exported}
+    for file in destinations.values():
+        file.write_text("earlier build")
+    copy, copied = shutil.copyfile, []
+
+    def evict_then_copy(source, destination):
+        # Another process evicts the entry after the first file was copied
+        if copied:
+            shutil.rmtree(tmp_path/"cache"/"key", ignore_errors=True)
+        copied.append(source)
+        return copy(source, destination)
+    monkeypatch.setattr(muffler_cache.shutil, "copyfile", evict_then_copy)
+    assert not cache.fetch("key", {suffix: str(file) for suffix, file in destinations.items()})
+    assert [file.read_text() for file in destinations.values()] == ["earlier build"]*2
+    assert not list(tmp_path.glob(".staging-*"))
@@ -0,0 +1,57 @@
+import ast
+
+import pytest
+
+from muffler_deps import ModelDependencies, constant_names, override_constants
+
+SOURCE = '''
+import muffler_mesh
+from muffler_thread import swept_iso_thread
+
+WIDTH = 10
+HEIGHT = 2*WIDTH # A calculation, not a constant
+SIDES = [WIDTH, HEIGHT]
+
+def area():
+    return WIDTH*HEIGHT
+
+def thread():
+    return swept_iso_thread(WIDTH, 2, 10)
+
+def mesh():
+    return muffler_mesh.lathe([(WIDTH, 0)], 8)
+'''
+
+def run(tree: ast.Module):
+    # Without the imports, the functions using them are not called
+    tree.body = [statement for statement in tree.body if not isinstance(statement, (ast.Import, ast.ImportFrom))]
+    namespace = {}
+    exec(compile(tree, "<source>", "exec"), namespace)
+    return namespace
+
+def test_constant_names():
+    assert constant_names(SOURCE) == ["WIDTH"]
+
+def test_override_constants_keeps_calculations():
+    namespace = run(override_constants(SOURCE, {"WIDTH": 3}))
+    assert (namespace["WIDTH"], namespace["HEIGHT"], namespace["SIDES"]) == (3, 6, [3, 6])
+    assert namespace["area"]() == 18
+
+def test_override_constants_leaves_source_unchanged():
+    assert run(override_constants(SOURCE, {}))["HEIGHT"] == 20
+
+@pytest.mark.parametrize("name", ["DEPTH", "HEIGHT", "area"])
+def test_override_constants_rejects_other_names(name):
+    with pytest.raises(KeyError):
+        override_constants(SOURCE, {name: 1})
+
+def test_names_follow_reads():
+    dependencies = ModelDependencies(SOURCE)
+    assert dependencies.names("area") == {"area", "WIDTH", "HEIGHT"}
+    assert dependencies.names("unknown") == set()
+
+def test_modules_of_the_reachable_imports():
+    dependencies = ModelDependencies(SOURCE)
+    assert dependencies.modules("thread") == ["muffler_thread"]
+    assert dependencies.modules("mesh") == ["muffler_mesh"]
+    assert dependencies.modules("area") == []
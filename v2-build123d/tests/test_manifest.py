@@ -0,0 +1,107 @@
+import argparse
+import json
+
+import pytest
+
+from muffler_build import BuildResult
+from muffler_manifest import (BUILD_TIMES_PATH, CATALOG_FILE, Manifest, ManifestVariant, default_manifest, merge_shards,
+                              parse_shard, plan_shards, read_manifest, variant_costs, write_manifest,
+                              write_shard_report)
+
+TIMES = {"body-70": 7.0, "body-85": 5.0, "cap-small": 4.0, "cap-large": 3.0, "tube-70": 3.0, "tube-85": 2.0}
+
+def manifest(names=TIMES, constants=None):
+    builders = {"body": "body_male", "cap": "end_cap_male", "tube": "inner_mesh_tube"}
+    return Manifest([ManifestVariant(name, builders[name.split("-")[0]], (("label", name),)) for name in names],
+                    constants or {})
+
+def build_shards(directory, manifest, shards, times=TIMES):
+    '''Write the files and report of every shard as a build would, returning the shard directories'''
+    directories = []
+    for shard, variants in enumerate(plan_shards(manifest, shards, times), 1):
+        output_dir = directory/f"shard-{shard}"
+        output_dir.mkdir()
+        results = []
+        for variant in variants:
+            stl = output_dir/f"v2-{variant.name}.stl"
+            stl.write_bytes(variant.name.encode())
+            results.append(BuildResult(variant.name, 1.5, [str(stl)]))
+        write_shard_report(manifest, shard, shards, results, str(output_dir), times)
+        directories.append(output_dir)
+    return directories
+
+def test_longest_processing_time_balance():
+    plan = plan_shards(manifest(), 2, TIMES)
+    assert [sum(TIMES[variant.name] for variant in variants) for variants in plan] == [12.0, 12.0]
+    assert sorted(variant.name for variants in plan for variant in variants) == sorted(TIMES)
+    # Each shard builds in manifest order
+    order = list(TIMES)
+    for variants in plan:
+        indices = [order.index(variant.name) for variant in variants]
+        assert indices == sorted(indices)
+    assert plan_shards(manifest(), 2, TIMES) == plan
+
+def test_unrecorded_variants_cost_the_mean_of_their_builder():
+    costs = variant_costs(manifest([*TIMES, "body-120", "cap-medium"]), {"body-70": 7.0, "body-85": 5.0})
+    assert costs["body-120"] == 6.0
+    assert costs["cap-medium"] == costs["cap-small"] == 1.0
+
+def test_zero_time_is_recorded():
+    costs = variant_costs(manifest(["body-70", "body-85"]), {"body-70": 0.0, "body-85": 5.0})
+    assert costs == {"body-70": 0.0, "body-85": 5.0}
+
+def test_merge(tmp_path):
+    catalog = tmp_path/"catalog"
+    assert merge_shards(manifest(), build_shards(tmp_path, manifest(), 3), str(catalog), TIMES) == []
+    entries = json.loads((catalog/CATALOG_FILE).read_text())["variants"]
+    assert list(entries) == list(TIMES)
+    assert all(set(entry["files"]) == {f"v2-{name}.stl"} for name, entry in entries.items())
+    assert json.loads((catalog/BUILD_TIMES_PATH.name).read_text()) == dict.fromkeys(sorted(TIMES), 1.5)
+
+def test_merge_keeps_the_recorded_times(tmp_path):
+    recorded = BUILD_TIMES_PATH.read_bytes()
+    merge_shards(manifest(), build_shards(tmp_path, manifest(), 2), str(tmp_path/"catalog"), TIMES)
+    assert BUILD_TIMES_PATH.read_bytes() == recorded
+
+def test_duplicate_shard(tmp_path):
+    first, second = build_shards(tmp_path, manifest(), 2)
+    problems = merge_shards(manifest(), [first, first, second], str(tmp_path/"catalog"), TIMES)
+    assert problems == [f"{first/'shard-1-of-2.json'}: shard 1 merged twice"]
+    assert not (tmp_path/"catalog").exists()
+
+def test_missing_shard(tmp_path):
+    first, second = build_shards(tmp_path, manifest(), 2)
+    problems = merge_shards(manifest(), [second], str(tmp_path/"catalog"), TIMES)
+    assert problems[0] == "missing shards 1"
+    assert {f"{variant.name} not built by any shard" for variant in plan_shards(manifest(), 2, TIMES)[0]} \
+        == set(problems[1:])
+
+def test_shard_of_a_foreign_manifest(tmp_path):
+    first, second = build_shards(tmp_path, manifest(), 2)
+    write_shard_report(manifest(constants={"TOLERANCE": 0.25}), 2, 2, [], str(second), TIMES)
+    problems = merge_shards(manifest(), [first, second], str(tmp_path/"catalog"), TIMES)
+    assert problems[0] == f"{second/'shard-2-of-2.json'}: built from another manifest"
+
+def test_shards_planned_with_other_times(tmp_path):
+    first, second = build_shards(tmp_path, manifest(), 2)
+    problems = merge_shards(manifest(), [first, second], str(tmp_path/"catalog"), dict(TIMES, **{"tube-85": 2.5}))
+    assert problems[:2] == [f"{first/'shard-1-of-2.json'}: planned with other build times",
+                            f"{second/'shard-2-of-2.json'}: planned with other build times"]
+
+def test_manifest_round_trip(tmp_path):
+    write_manifest(default_manifest(), tmp_path/"variants.json")
+    assert read_manifest(tmp_path/"variants.json") == default_manifest()
+
+def test_manifest_without_variants(tmp_path):
+    (tmp_path/"variants.json").write_text(json.dumps({"constants": {}, "variants": {}}))
+    with pytest.raises(ValueError, match="no variants"):
+        read_manifest(tmp_path/"variants.json")
+
+@pytest.mark.parametrize("text, shard", [("1/1", (1, 1)), ("2/4", (2, 4)), ("4/4", (4, 4))])
+def test_parse_shard(text, shard):
+    assert parse_shard(text) == shard
+
+@pytest.mark.parametrize("text", ["", "1", "0/4", "5/4", "1/0", "-1/4", "a/b", "1/4/8", "1.5/4", " 1/4"])
+def test_invalid_shard(text):
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_shard(text)
@@ -0,0 +1,70 @@
+import zipfile
+
+import numpy as np
+import pytest
+
+from muffler_mesh import (distinct_faces, lathe, mesh_volume, open_edges, read_stl, revolve_polygon, screw_sweep,
+                          weld, write_3mf, write_binary_ply, write_binary_stl)
+
+def cube(size: float = 1.0):
+    '''The 12 triangles of a cube, counter clockwise seen from the outside'''
+    corners = np.array([[x, y, z] for x in (0, size) for y in (0, size) for z in (0, size)])
+    quads = [(0, 1, 3, 2), (4, 6, 7, 5), (0, 4, 5, 1), (2, 3, 7, 6), (0, 2, 6, 4), (1, 5, 7, 3)]
+    return np.array([corners[[a, b, c]] for a, b, c, d in quads] + [corners[[a, c, d]] for a, b, c, d in quads])
+
+def test_weld_shares_the_vertices():
+    vertices, faces = weld(cube())
+    assert (len(vertices), len(faces)) == (8, 12)
+    np.testing.assert_allclose(vertices[faces], cube())
+
+def test_weld_merges_vertices_within_the_rounding():
+    triangles = cube()
+    triangles[0, 0] += 1e-8
+    assert len(weld(triangles)[0]) == 8
+    assert len(weld(triangles, decimals=9)[0]) == 9
+
+def test_closed_mesh_has_no_open_edges():
+    assert open_edges(weld(cube())[1]) == 0
+    assert mesh_volume(cube(2)) == pytest.approx(8)
+
+def test_missing_triangle_opens_its_edges():
+    assert open_edges(weld(cube()[1:])[1]) == 3
+
+def test_flipped_triangle_opens_its_edges():
+    triangles = cube()
+    triangles[0] = triangles[0, ::-1]
+    assert open_edges(weld(triangles)[1]) > 0
+
+def test_duplicated_triangle_is_not_watertight():
+    assert open_edges(weld(np.concatenate([cube(), cube()[:1]]))[1]) > 0
+
+def test_distinct_faces_drops_collapsed_triangles():
+    triangles = np.concatenate([cube(), [[[0, 0, 0], [0, 0, 1e-9], [1, 0, 0]]]])
+    vertices, faces = weld(triangles)
+    assert len(distinct_faces(faces)) == 12
+
+@pytest.mark.parametrize("triangles", [
+    lathe([(10, 0), (12, 0), (12, 5), (10, 5)], 64),
+    screw_sweep([(10, -0.5), (11, -0.5), (11, 0.5), (10, 0.5)], 20, 30, 64),
+    revolve_polygon([(10, 0), (12, 0), (11, 3)], 32),
+])
+def test_direct_meshes_are_watertight(triangles):
+    assert open_edges(weld(triangles)[1]) == 0
+    assert mesh_volume(triangles) > 0
+
+def test_ring_volume():
+    triangles = lathe([(10, 0), (12, 0), (12, 5), (10, 5)], 256)
+    assert mesh_volume(triangles) == pytest.approx(np.pi*(12**2 - 10**2)*5, rel=1e-3)
+
+def test_stl_round_trip(tmp_path):
+    write_binary_stl(cube(), tmp_path / "cube.stl")
+    np.testing.assert_array_equal(read_stl(tmp_path / "cube.stl"), cube().astype(np.float32))
+
+def test_indexed_files(tmp_path):
+    vertices, faces = weld(cube())
+    write_binary_ply(vertices, faces, tmp_path / "cube.ply")
+    write_3mf(vertices, faces, tmp_path / "cube.3mf")
+    assert (tmp_path / "cube.ply").read_bytes().startswith(b"ply\nformat binary_little_endian 1.0\n")
+    with zipfile.ZipFile(tmp_path / "cube.3mf") as archive:
+        model = archive.read("3D/3dmodel.model").decode()
+    assert (model.count("<vertex "), model.count("<triangle ")) == (8, 12)
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from muffler_plate import BED_MARGIN, BED_SIZE, PART_SPACING, footprint_radii, order_variants, pack_plates
+from muffler_params import load_params
+
+ORDERS = [
+    [("kit-large-100", 10)],
+    [("kit-small-70", 3), ("kit-medium-120", 2), ("inner-mesh-tube-*-corkscrew", 2)],
+    [("o-ring-*", 20)],
+]
+
+def assert_packed(plates, bed_size, margin, spacing):
+    for plate in plates:
+        low, high = margin + plate.radii[:, None], np.asarray(bed_size) - margin - plate.radii[:, None]
+        assert ((plate.centers >= low - 1e-6) & (plate.centers <= high + 1e-6)).all()
+        distances = np.linalg.norm(plate.centers[:, None] - plate.centers[None], axis=2)
+        reach = plate.radii[:, None] + plate.radii[None] + spacing
+        apart = ~np.eye(len(plate.names), dtype=bool)
+        assert (distances[apart] >= reach[apart] - 1e-6).all()
+
+@pytest.mark.parametrize("order", ORDERS)
+def test_parts_stay_apart_and_on_the_bed(order):
+    names = order_variants(order)
+    plates = pack_plates(names)
+    assert sorted(name for plate in plates for name in plate.names) == sorted(names)
+    assert_packed(plates, BED_SIZE, BED_MARGIN, PART_SPACING)
+
+def test_smaller_bed_and_wider_spacing():
+    plates = pack_plates(order_variants(ORDERS[1]), (180, 150), 10, 8)
+    assert_packed(plates, (180, 150), 10, 8)
+
+def test_materials_go_onto_separate_plates():
+    builders = {name: variant.builder for name, variant in load_params().VARIANTS.items()}
+    plates = pack_plates(order_variants([("kit-medium-85", 4)]))
+    assert {plate.material for plate in plates} == {"pla", "tpu"}
+    for plate in plates:
+        assert {builders[name] == "o_ring" for name in plate.names} == {plate.material == "tpu"}
+
+def test_one_material_for_all_parts():
+    plates = pack_plates(order_variants([("kit-medium-85", 2)]), material="petg")
+    assert [plate.material for plate in plates] == ["petg"]
+
+def test_part_larger_than_the_bed_raises():
+    name = "body-male-large-120"
+    size = 2*(footprint_radii([name])[name] + BED_MARGIN)
+    pack_plates([name], (size + 1, size + 1))
+    with pytest.raises(ValueError, match=name):
+        pack_plates([name], (size - 1, size + 1))
+
+def test_unknown_order_raises():
+    with pytest.raises(KeyError):
+        order_variants([("kit-huge-200", 1)])
@@ -0,0 +1,27 @@
+import pytest
+
+from muffler_sweep import expand_sweep, parse_values
+
+def test_parse_values_keeps_the_stop_of_ranges():
+    assert parse_values("44:50:2,53") == [44, 46, 48, 50, 53]
+    assert parse_values("0.1:0.3:0.1") == [0.1, 0.2, 0.3]
+
+@pytest.mark.parametrize("text", ["1:2", "2:1:1", "1:2:0"])
+def test_parse_values_rejects_invalid_ranges(text):
+    with pytest.raises(ValueError):
+        parse_values(text)
+
+@pytest.mark.parametrize("diameters", [[44.0000001, 44.0000002], [1234567, 1234568]])
+def test_close_values_get_different_names(diameters):
+    jobs = expand_sweep({"muffler_o_ring_inner_diameter": diameters}, ["o_ring"])
+    assert len({job.name for job in jobs}) == 2
+
+def test_values_too_close_to_name_are_rejected():
+    with pytest.raises(ValueError, match="o-ring-d44"):
+        expand_sweep({"muffler_o_ring_inner_diameter": [44.00000000001, 44.00000000002]}, ["o_ring"])
+
+def test_parts_are_only_swept_over_their_parameters():
+    jobs = expand_sweep({"muffler_o_ring_inner_diameter": [44, 47], "TOLERANCE": [0.1, 0.2]}, ["o_ring", "end_cap_male"])
+    assert sorted(job.name for job in jobs) == [
+        "end-cap-male-d44-tolerance0.1", "end-cap-male-d44-tolerance0.2",
+        "end-cap-male-d47-tolerance0.1", "end-cap-male-d47-tolerance0.2", "o-ring-d44", "o-ring-d47"]